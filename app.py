@@ -4,16 +4,43 @@ import os
 import uuid
 import re # Import regex for parsing overdue amount
 import logging # Import logging for detailed output
-import traceback # Import traceback for detailed errors
 import numpy as np # Import numpy for int64 check
-
-from flask import Flask, request, jsonify, render_template, session
+import json
+import time
+import datetime
+import atexit
+from contextlib import contextmanager
+
+from flask import Flask, request, jsonify, render_template, session, Response, stream_with_context, g, has_request_context
+from flask.sessions import SecureCookieSessionInterface
 from dotenv import load_dotenv
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-# For more detailed debug logs, uncomment:
-# logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+from customer_index import LookupResult
+from fake_model import create_fake_model
+from llm_pool import LLMClientPool, PoolSaturatedError, LLMTimeoutError
+from resilience import CircuitOpenError, RateLimitedError, create_model_call_policy
+from conversation_store import create_conversation_store, new_conversation
+from transcript_store import create_transcript_writer
+from history_compaction import compact_history, format_summary_for_prompt, estimate_tokens, turn_text
+from prompt_cache import DossierCache, ContextPrefixCache
+from data_loader import DEFAULT_CACHE_DIR
+from loan_book_reloader import LoanBookReloader, load_snapshot
+from opening_turns import OpeningTurnCache, OPENING_PROBE_TEXT, is_opening_input, opening_key, render_template_opening
+from call_queue import CallQueue, CALL_OUTCOMES
+from logging_setup import configure_logging, log_dump, logging_stats
+from metrics import MetricsRegistry, RequestTrace, accept_trace_id, TOKEN_BUCKETS, COUNT_BUCKETS
+
+# Configure logging: records are queued and written by a background thread (see logging_setup.py).
+# LOG_LEVEL=DEBUG for more detailed logs; LOG_FORMAT=json for structured records; LOG_FILE to also write a file.
+def request_log_context():
+    # Tags each record logged while handling a request with its session, trace ID and route.
+    if not has_request_context():
+        return None
+    trace = g.get('trace')
+    return {'session_id': session.get('session_id'), 'trace_id': trace.trace_id if trace is not None else None,
+            'route': trace.route if trace is not None else None}
+
+configure_logging(context=request_log_context)
 
 # Get the root logger instance once
 root_logger = logging.getLogger()
@@ -39,8 +66,14 @@ else:
 
 
 # --- Configure Gemini ---
+# LLM_BACKEND=fake swaps in the local FakeGenerativeModel (no network, configurable latency and injected faults)
+# for offline testing.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
+if LLM_BACKEND == "fake":
+    model = create_fake_model()
+    logging.info("Using local fake model (latency %ss, error rate %s) instead of Gemini.", model.latency, model.error_rate)
+elif not GEMINI_API_KEY:
     logging.error("GEMINI_API_KEY environment variable not set.")
     model = None # Set model to None
 else:
@@ -56,66 +89,306 @@ else:
         }
         model_name = "gemini-1.5-flash-latest" # Good balance
         model = genai.GenerativeModel(model_name=model_name, generation_config=generation_config)
-        logging.info(f"Gemini model '{model_name}' initialized.")
+        logging.info("Gemini model '%s' initialized.", model_name)
     except Exception as e:
         model = None # Set model to None if initialization fails
-        logging.error(f"Failed to initialize Gemini model: {e}. Chat endpoint will not work.")
+        logging.error("Failed to initialize Gemini model: %s. Chat endpoint will not work.", e)
+
+
+# --- Shared model call pool ---
+# Bounds concurrent model calls per process, queues a limited number of extra calls and rejects the rest
+# immediately (the chat routes answer with LLM_BUSY_MESSAGE), and applies a per-request timeout.
+# The model call policy (resilience.py) adds jittered retries, optional hedging, the per-process rate limit
+# (calls over quota also get LLM_BUSY_MESSAGE) and a circuit breaker; while it is open, calls fail at once and
+# the routes answer with the amount-aware fallback message.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_BUSY_MESSAGE = "Thank you for your patience. All of our lines are busy for a moment, so please hold and say that again in a few seconds."
+
+llm_pool = None
+llm_call_policy = None
+if model is not None:
+    llm_call_policy = create_model_call_policy()
+    llm_pool = LLMClientPool(model, max_concurrency=LLM_MAX_CONCURRENCY, max_queue=LLM_MAX_QUEUE, timeout=LLM_TIMEOUT_SECONDS, policy=llm_call_policy)
+    logging.info("Model call pool ready (concurrency %s, queue %s, timeout %ss).", LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_TIMEOUT_SECONDS)
+    if llm_call_policy is not None:
+        logging.info("Model call policy: %s attempts, hedging at %s, %s calls/s, breaker after %s failures for %ss.",
+                     llm_call_policy.max_attempts, llm_call_policy.hedge_percentile or 'off', llm_call_policy.bucket.rate or 'unlimited',
+                     llm_call_policy.breaker.failure_threshold, llm_call_policy.breaker.reset_seconds)
+
+
+# --- Optional Gemini context caching of the static prompt prefix ---
+# With GEMINI_CONTEXT_CACHE=1 the instruction + customer dossier is uploaded once as cached content and later
+# turns send only the dialogue. Requires an explicit model version (GEMINI_CONTEXT_CACHE_MODEL); prefixes the
+# API refuses to cache (e.g. below its minimum size) silently fall back to being sent inline.
+context_cache = None
+if os.getenv("GEMINI_CONTEXT_CACHE", "0") == "1" and model is not None and LLM_BACKEND == "gemini":
+    try:
+        context_cache = ContextPrefixCache(os.getenv("GEMINI_CONTEXT_CACHE_MODEL", "models/gemini-1.5-flash-002"),
+                                           generation_config=generation_config,
+                                           ttl_seconds=int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600")),
+                                           delete_delay_seconds=10 * LLM_TIMEOUT_SECONDS) # Streams are only bounded per chunk
+        logging.info("Gemini context caching enabled for model '%s'.", context_cache.model_name)
+    except Exception as e:
+        context_cache = None
+        logging.error("Failed to enable Gemini context caching: %s", e)
+
+
+# --- Server-side conversation store ---
+# The session cookie only carries session['session_id']; the located customer and the dialogue live in
+# the store (CONVERSATION_STORE=memory for an in-process LRU with TTL, or sqlite for multi-process deployments).
+# Before each model call the history is compacted: recent turns stay verbatim within HISTORY_TOKEN_BUDGET,
+# older turns are folded into a running summary capped at HISTORY_SUMMARY_TOKEN_BUDGET.
+conversation_store = create_conversation_store()
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_MIN_RECENT_TURNS = int(os.getenv("HISTORY_MIN_RECENT_TURNS", "6"))
+HISTORY_SUMMARY_TOKEN_BUDGET = int(os.getenv("HISTORY_SUMMARY_TOKEN_BUDGET", "400"))
+logging.info("Conversation store: %s (history budget %s tokens).", type(conversation_store).__name__, HISTORY_TOKEN_BUDGET)
+
+
+# --- Durable transcript and outcome log ---
+# Every turn, logged call outcome and extracted payment commitment is appended to the transcript store
+# (TRANSCRIPT_STORE=jsonl, sqlite or off). Requests only enqueue records; a background thread writes them in
+# batches and drains the queue when the process exits.
+transcript_writer = create_transcript_writer()
+if transcript_writer is not None:
+    atexit.register(transcript_writer.close)
+    logging.info("Transcript store: %s.", type(transcript_writer.sink).__name__)
+
+def log_transcript(record):
+    if transcript_writer is not None:
+        transcript_writer.submit(record)
 
 
 # --- Load the CSV data ---
-df = None
+# data_loader applies the cleaning rules with vectorized operations and keeps a columnar binary cache keyed
+# on the CSV's hash, so worker boots and debug reloads skip re-parsing an unchanged file.
+# LOAN_BOOK_STORAGE=compact instead serves the book from a read-only, memory-mapped compact column directory
+# (categorical text, narrowed numerics, binary UUIDs) that every worker process on the host shares.
+#
+# The loaded book and its customer lookup index (hash/prefix/fuzzy indexes, so /find_customer never scans
+# the data) form one immutable snapshot. Handlers read `loan_book_snapshot` once per request and use that
+# snapshot throughout, because the reloader below may swap in a newer one at any time.
+LOAN_BOOK_STORAGE = os.getenv('LOAN_BOOK_STORAGE', 'frame').lower()
+loan_book_snapshot = None
 try:
-    csv_file_path = 'cleaned_data.csv'
-    logging.info(f"Attempting to load CSV data from '{csv_file_path}'...")
-    df = pd.read_csv(csv_file_path)
-
-    # Pre-process numeric/int64 types for JSON serialization and handling
-    numeric_cols_to_clean = ['Current Loan Amount', 'Annual Income', 'Monthly Debt',
-                             'Years of Credit History', 'Months since last delinquent',
-                             'Number of Open Accounts', 'Number of Credit Problems',
-                             'Current Credit Balance', 'Maximum Open Credit', 'Bankruptcies', 'Tax Liens']
-    for col in numeric_cols_to_clean:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce') # Convert, coerce errors to NaN
-            # Convert numeric types to standard Python int/float for JSON serialization
-            df[col] = df[col].apply(lambda x: x if pd.isna(x) else (int(x) if x == int(x) else float(x)))
-            df[col].fillna(0.0, inplace=True) # Fill NaN with 0.0
-
-
-    # Handle Credit Score
-    if 'Credit Score' in df.columns:
-        df['Credit Score'] = pd.to_numeric(df['Credit Score'], errors='coerce')
-        df['Credit Score'] = df['Credit Score'].apply(lambda x: x / 10.0 if pd.notna(x) and x > 1000 and x < 10000 else x)
-        df['Credit Score'] = df['Credit Score'].clip(lower=300.0, upper=850.0)
-         # Ensure Credit Score is a standard Python int or float
-        df['Credit Score'] = df['Credit Score'].apply(lambda x: x if pd.isna(x) else (int(x) if x == int(x) else float(x)))
-        df['Credit Score'].fillna('Unknown Score', inplace=True)
-
-
-    # Fill missing text columns
-    text_cols_to_fill = ['Term', 'Years in current job', 'Home Ownership', 'Purpose', 'Random_Name', 'Random_Phone_Number']
-    for col in text_cols_to_fill:
-         if col in df.columns:
-            df[col].fillna('Unknown', inplace=True)
-
-    logging.info(f"CSV data loaded and pre-processed successfully from '{csv_file_path}'. DataFrame shape: (1000, 20)")
+    csv_file_path = os.getenv('LOAN_BOOK_CSV', 'cleaned_data.csv')
+    loan_book_cache_dir = os.getenv('LOAN_BOOK_CACHE_DIR', DEFAULT_CACHE_DIR)
+    logging.info("Attempting to load CSV data from '%s' (%s storage)...", csv_file_path, LOAN_BOOK_STORAGE)
+    loan_book_snapshot = load_snapshot(csv_file_path, storage=LOAN_BOOK_STORAGE, cache_dir=loan_book_cache_dir,
+                                       use_cache=os.getenv('LOAN_BOOK_CACHE', '1') == '1')
+
+    logging.info("CSV data loaded and pre-processed successfully from '%s'. Rows: %s, customer lookup index over %s rows, version %s.", csv_file_path, len(loan_book_snapshot.book), len(loan_book_snapshot.index), loan_book_snapshot.version)
 
 except FileNotFoundError:
-    df = None
-    logging.error(f"Error: The CSV file '{csv_file_path}' was not found.")
+    loan_book_snapshot = None
+    logging.error("Error: The CSV file '%s' was not found.", csv_file_path)
 except Exception as e:
-    df = None
-    logging.error(f"An unexpected error occurred while processing CSV data from '{csv_file_path}': {e}")
-    traceback.print_exc()
+    loan_book_snapshot = None
+    logging.error("An unexpected error occurred while processing CSV data from '%s': %s", csv_file_path, e, exc_info=True)
+
+
+# --- Rendered dossier cache ---
+# Dossiers are memoized per (snapshot version, row index). Every full reload or delta produces a new version,
+# so stale renders are never served; the cache is also cleared on each swap to release them.
+dossier_cache = DossierCache(max_entries=int(os.getenv("DOSSIER_CACHE_SIZE", "4096")))
+
+
+# --- Ranked call queue ---
+# Every loan is scored for recovery (call_queue.py) and kept ranked for outbound calls. Call outcomes logged
+# through /queue/outcome and loan book deltas re-rank only the loans they touch. A customer located by
+# /find_customer is held out of the queue for CALL_QUEUE_IN_CALL_SECONDS so no other agent dials them.
+CALL_QUEUE_IN_CALL_SECONDS = float(os.getenv('CALL_QUEUE_IN_CALL_SECONDS', '900'))
+CALL_QUEUE_MAX_PER_PAGE = int(os.getenv('CALL_QUEUE_MAX_PER_PAGE', '500'))
+
+call_queue = None
+if loan_book_snapshot is not None:
+    try:
+        call_queue = CallQueue(loan_book_snapshot)
+    except Exception as e:
+        logging.error("Could not build the call queue; /queue is unavailable: %s", e)
+
+
+# --- Hot reload of the loan book ---
+# A daemon thread polls the CSV (full reload when it changes) and LOAN_BOOK_DELTA_DIR (append/update deltas
+# keyed by Loan ID) every LOAN_BOOK_RELOAD_SECONDS, builds the new snapshot off the request path and swaps
+# it in atomically. Conversations store the Loan ID, so calls in progress continue on the new data.
+# LOAN_BOOK_RELOAD_SECONDS=0 disables the watcher.
+LOAN_BOOK_RELOAD_SECONDS = float(os.getenv('LOAN_BOOK_RELOAD_SECONDS', '30'))
+
+def on_loan_book_swap(previous_snapshot, new_snapshot):
+    global loan_book_snapshot
+    loan_book_snapshot = new_snapshot
+    dossier_cache.clear()
+    if call_queue is not None:
+        call_queue.update_snapshot(previous_snapshot, new_snapshot)
+
+loan_book_reloader = None
+if loan_book_snapshot is not None and LOAN_BOOK_RELOAD_SECONDS > 0:
+    loan_book_reloader = LoanBookReloader(loan_book_snapshot, csv_file_path, storage=LOAN_BOOK_STORAGE,
+                                          cache_dir=loan_book_cache_dir,
+                                          use_cache=os.getenv('LOAN_BOOK_CACHE', '1') == '1',
+                                          delta_dir=os.getenv('LOAN_BOOK_DELTA_DIR', 'loan_book_deltas'),
+                                          poll_seconds=LOAN_BOOK_RELOAD_SECONDS,
+                                          on_swap=on_loan_book_swap).start()
+    logging.info("Loan book reloader watching '%s' and '%s' every %ss.", csv_file_path, loan_book_reloader.delta_dir, LOAN_BOOK_RELOAD_SECONDS)
+
+
+# --- Request metrics and tracing ---
+# Every request gets a RequestTrace: its stages (session cookie, lookup, conversation load/save, dossier,
+# compaction, prompt assembly, model call) are timed into loan_collection_stage_seconds, and GET /metrics
+# exposes those histograms plus token counts, history length, model outcome counters (ok/blocked/empty/
+# error/timeout/busy) and the cache, pool, store and reloader stats in the Prometheus text format.
+# The trace ID comes from the REQUEST_TRACE_HEADER request header when the caller sends one (otherwise it is
+# generated), is echoed on the response, and is logged with the session ID and stage breakdown; requests
+# slower than REQUEST_TRACE_SLOW_MS are logged as warnings.
+REQUEST_TRACE_HEADER = os.getenv("REQUEST_TRACE_HEADER", "X-Trace-Id")
+REQUEST_TRACE_SLOW_MS = float(os.getenv("REQUEST_TRACE_SLOW_MS", "2000"))
+
+metrics = MetricsRegistry()
+request_seconds = metrics.histogram('loan_collection_request_seconds', 'Request latency by route and status code.', labelnames=('route', 'status'))
+stage_seconds = metrics.histogram('loan_collection_stage_seconds', 'Time spent in each stage of a request.', labelnames=('route', 'stage'))
+prompt_tokens = metrics.histogram('loan_collection_prompt_tokens', 'Prompt tokens per model call (usage metadata, else estimated).', buckets=TOKEN_BUCKETS, labelnames=('route',))
+response_tokens = metrics.histogram('loan_collection_response_tokens', 'Response tokens per model call (usage metadata, else estimated).', buckets=TOKEN_BUCKETS, labelnames=('route',))
+history_turns = metrics.histogram('loan_collection_history_turns', 'Verbatim dialogue turns sent per model call (after compaction).', buckets=COUNT_BUCKETS, labelnames=('route',))
+llm_responses = metrics.counter('loan_collection_llm_responses', 'Model call outcomes: ok, blocked, empty, error, timeout, busy, circuit_open, rate_limited, prepared (opening served without a model call).', labelnames=('outcome',))
+customer_lookups = metrics.counter('loan_collection_customer_lookups', 'Customer lookups by match type and result.', labelnames=('match_type', 'result'))
+metrics.stats_gauge('loan_collection_llm_pool', 'Model call pool state.', lambda: {
+    'outstanding': llm_pool.outstanding, 'max_concurrency': llm_pool.max_concurrency, 'max_queue': llm_pool.max_queue,
+    'completed': llm_pool.completed, 'rejected': llm_pool.rejected, 'timed_out': llm_pool.timed_out} if llm_pool is not None else None)
+metrics.stats_gauge('loan_collection_llm_policy', 'Model call retries, hedges, rate limiting and circuit breaker state.',
+                    lambda: llm_call_policy.stats() if llm_call_policy is not None else None)
+metrics.stats_gauge('loan_collection_dossier_cache', 'Rendered dossier cache statistics.', lambda: dossier_cache.stats())
+metrics.stats_gauge('loan_collection_context_cache', 'Gemini context cache statistics.', lambda: context_cache.stats() if context_cache is not None else None)
+metrics.stats_gauge('loan_collection_loan_book', 'Loaded loan book size.', lambda: {
+    'rows': len(loan_book_snapshot.book), 'bytes': loan_book_snapshot.book.memory_bytes()} if loan_book_snapshot is not None else None)
+metrics.stats_gauge('loan_collection_logging', 'Log queue state.', logging_stats)
+metrics.stats_gauge('loan_collection_transcripts', 'Transcript writer statistics.', lambda: transcript_writer.stats() if transcript_writer is not None else None)
+metrics.stats_gauge('loan_collection_call_queue', 'Ranked call queue state.', lambda: call_queue.stats() if call_queue is not None else None)
+metrics.stats_gauge('loan_collection_loan_book_reloader', 'Loan book reloader statistics.', lambda: loan_book_reloader.stats() if loan_book_reloader is not None else None)
+metrics.gauge('loan_collection_conversations', 'Conversations held by the conversation store.', lambda: len(conversation_store))
+
+
+# The cookie only carries the session ID, but it is still verified and re-signed on every request: the load
+# is added to the request's trace, the save (which Flask runs after the trace is logged) to the histogram.
+class TimedSessionInterface(SecureCookieSessionInterface):
+    def open_session(self, app, request):
+        started = time.perf_counter()
+        try:
+            return super().open_session(app, request)
+        finally:
+            g.session_load_seconds = time.perf_counter() - started
+
+    def save_session(self, app, session, response):
+        started = time.perf_counter()
+        super().save_session(app, session, response)
+        trace = g.get('trace')
+        if trace is not None:
+            trace.record('session_save', time.perf_counter() - started)
+
+app.session_interface = TimedSessionInterface()
+
+
+@app.before_request
+def start_request_trace():
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    g.trace = RequestTrace(accept_trace_id(request.headers.get(REQUEST_TRACE_HEADER)), route, stage_seconds)
+    g.trace.record('session_load', g.pop('session_load_seconds', 0.0))
+
+
+@app.after_request
+def finish_request_trace(response):
+    trace = g.get('trace')
+    if trace is None:
+        return response
+    response.headers[REQUEST_TRACE_HEADER] = trace.trace_id
+    if response.mimetype != 'text/event-stream': # Streamed turns are logged when their stream ends
+        log_request_trace(trace, response.status_code, session.get('session_id', 'NoSessionId'))
+    return response
+
+
+def log_request_trace(trace, status, current_session_id):
+    if trace is None:
+        return
+    elapsed = trace.elapsed()
+    request_seconds.observe(elapsed, trace.route, str(status))
+    level = logging.WARNING if elapsed * 1000 >= REQUEST_TRACE_SLOW_MS else logging.INFO
+    logging.log(level, "Session %s: Trace %s %s -> %s in %.1f ms (%s)", current_session_id, trace.trace_id, trace.route, status, elapsed * 1000, trace.summary(),
+                extra={'session_id': current_session_id, 'trace_id': trace.trace_id, 'route': trace.route, 'status': status,
+                       'elapsed_ms': round(elapsed * 1000, 1),
+                       'timings_ms': {stage: round(seconds * 1000, 1) for stage, seconds in trace.stages.items()},
+                       'fields': dict(trace.fields) or None})
+
+
+# --- Helpers for timing stages of the current request (no-ops outside a request, e.g. in campaign_runner.py) ---
+def current_trace():
+    return g.get('trace') if has_request_context() else None
+
+
+@contextmanager
+def trace_span(stage):
+    trace = current_trace()
+    if trace is None:
+        yield
+    else:
+        with trace.span(stage):
+            yield
+
+
+# Records prompt/response token counts for one model call. Gemini reports them in usage_metadata; the fake
+# model (and streams cut short) don't, so the same ~4 characters/token estimate as history compaction is used.
+def record_model_usage(contents, response, assistant_text, trace=None):
+    trace = trace or current_trace()
+    route = trace.route if trace is not None else 'offline'
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_count = getattr(usage, 'prompt_token_count', None) or sum(estimate_tokens(turn_text(turn)) for turn in contents)
+    response_count = getattr(usage, 'candidates_token_count', None) or estimate_tokens(assistant_text)
+    prompt_tokens.observe(prompt_count, route)
+    response_tokens.observe(response_count, route)
+    if trace is not None:
+        trace.fields['prompt_tokens'] = prompt_count
+        trace.fields['response_tokens'] = response_count
+
+
+def record_model_error(error):
+    if isinstance(error, LLMTimeoutError):
+        llm_responses.inc('timeout')
+    elif isinstance(error, CircuitOpenError):
+        llm_responses.inc('circuit_open')
+    elif isinstance(error, RateLimitedError):
+        llm_responses.inc('rate_limited')
+    else:
+        llm_responses.inc('error')
+
+
+# --- Helper function to describe lookup candidates for the agent ---
+def describe_lookup_candidates(snapshot, positions):
+    candidates = []
+    for position in positions:
+        row = snapshot.book.record(position)
+        candidates.append({
+            "customer_name": row.get('Random_Name', 'Unknown'),
+            "loan_id": row.get('Loan ID', 'Unknown'),
+            "phone": row.get('Random_Phone_Number', 'Unknown'),
+            "overdue_amount": f"${row.get('Current Loan Amount', 0.0):,.2f}",
+        })
+    return candidates
 
 
 # --- Helper function to format customer data for the prompt ---
+# Accepts a one-row DataFrame (df.iloc[[idx]]) or a loan book record dict (loan_book.record(idx)).
 def format_customer_data_for_prompt(customer_row):
-    if customer_row.empty:
-        logging.warning("format_customer_data_for_prompt called with an empty customer row DataFrame.")
-        return "No customer loan data available to format."
-
-    data = customer_row.iloc[0].to_dict()
+    if isinstance(customer_row, pd.DataFrame):
+        if customer_row.empty:
+            logging.warning("format_customer_data_for_prompt called with an empty customer row DataFrame.")
+            return "No customer loan data available to format."
+        data = customer_row.iloc[0].to_dict()
+    else:
+        if not customer_row:
+            logging.warning("format_customer_data_for_prompt called with an empty customer record.")
+            return "No customer loan data available to format."
+        data = dict(customer_row)
 
     # Convert NumPy types in dictionary to standard Python types for JSON serialization safety
     for key, value in data.items():
@@ -146,6 +419,12 @@ Maximum Open Credit Available: ${data.get('Maximum Open Credit', 0.0):,.2f}
 """
     return formatted_data
 
+# --- Helper function returning the (cached) rendered dossier for a row of a snapshot ---
+def get_customer_dossier(snapshot, customer_idx):
+    return dossier_cache.get_or_render(snapshot.version, customer_idx,
+                                       lambda: format_customer_data_for_prompt(snapshot.book.record(customer_idx)))
+
+
 # --- Define the core system instruction for the AI loan collector ---
 # NOTE: Prompt significantly refined to better guide first/subsequent turns and reduce repetition.
 core_system_instruction = """
@@ -200,123 +479,318 @@ You MUST only respond with the **EXACT spoken lines** that the Apex Financial Se
 
 @app.route('/')
 def index():
-    session['session_id'] = str(uuid.uuid4()) # Assign a unique ID to the session
-    session.pop('chat_history_min', None)
-    session.pop('customer_idx', None)
-    session.pop('customer_name', None)
+    if 'session_id' in session:
+        conversation_store.delete(session['session_id']) # Drop the previous page's conversation
+    session['session_id'] = str(uuid.uuid4()) # Assign a unique ID to the session (the cookie's only content)
 
-    logging.info(f"New session started/cleared on index load: {session['session_id']}") # Log session start/clear
-    logging.info(f"Initial session state after /: {dict(session)}") # Log the state of the session cookie upon page load
+    logging.info("New session started/cleared on index load: %s", session['session_id']) # Log session start/clear
+    log_dump("Initial session state after /", session) # Log the state of the session cookie upon page load
 
     return render_template('index.html')
 
-# Route to handle finding a customer based on name. Stores minimal data in session.
+# Route to handle finding a customer by name, Loan ID, Customer ID or phone number. Stores minimal data in session.
 @app.route('/find_customer', methods=['POST'])
 def find_customer():
     customer_name_input = request.json.get('customer_name')
+    loan_id_input = request.json.get('loan_id')
+    customer_id_input = request.json.get('customer_id')
+    phone_input = request.json.get('phone')
     current_session_id = session.get('session_id', 'NoSessionId') # Get session ID for logging context.
 
-    logging.info(f"Session {current_session_id}: Received customer lookup request for name: '{customer_name_input}'")
-    logging.info(f"Session state before lookup: {dict(session)}")
+    logging.info("Session %s: Received customer lookup request for name: '%s' (loan_id=%s, customer_id=%s, phone=%s)", current_session_id, customer_name_input, loan_id_input, customer_id_input, phone_input)
+    log_dump("Session state before lookup", session, current_session_id)
 
 
-    if df is None:
-         logging.error(f"Session {current_session_id}: DataFrame is None during find_customer.")
+    snapshot = loan_book_snapshot # Use one snapshot for the whole request, even if a reload swaps it meanwhile
+    if snapshot is None:
+         logging.error("Session %s: Loan book or customer index is None during find_customer.", current_session_id)
          return jsonify({"response": "Error: Loan data not loaded on the server. Cannot look up customer."}, 500)
 
-    if not customer_name_input or not customer_name_input.strip():
-        logging.warning(f"Session {current_session_id}: Lookup requested with empty or whitespace name.")
+    lookup_query = next((value for value in (loan_id_input, customer_id_input, phone_input, customer_name_input)
+                         if value and str(value).strip()), None)
+    if lookup_query is None:
+        logging.warning("Session %s: Lookup requested with empty or whitespace name.", current_session_id)
         return jsonify({"response": "Please provide a customer name to look up."}), 400
 
-    matched_customers = df[df['Random_Name'].str.lower() == customer_name_input.strip().lower()]
+    # Explicit identifier fields take precedence; free text is classified by the index itself.
+    with trace_span('lookup'):
+        if loan_id_input and str(loan_id_input).strip():
+            lookup_result = LookupResult('loan_id', snapshot.index.by_loan_id(loan_id_input))
+        elif customer_id_input and str(customer_id_input).strip():
+            lookup_result = LookupResult('customer_id', snapshot.index.by_customer_id(customer_id_input))
+        elif phone_input and str(phone_input).strip():
+            lookup_result = LookupResult('phone', snapshot.index.by_phone(phone_input))
+        else:
+            lookup_result = snapshot.index.lookup(customer_name_input)
+    customer_lookups.inc(lookup_result.match_type or 'none', 'unique' if lookup_result.is_unique else 'candidates' if lookup_result else 'not_found')
 
 
-    if not matched_customers.empty:
-        # Found match. Get data and store minimal (index, name) in session.
-        customer_row = matched_customers.iloc[[0]]
-        customer_name_found = customer_row['Random_Name'].iloc[0]
-        customer_row_index = matched_customers.index[0] # Get the index
+    if lookup_result.is_unique:
+        # Found a single unambiguous match. Start a fresh conversation for it in the server-side store.
+        customer_row_index = lookup_result.positions[0]
+        customer_name_found = snapshot.book.value(customer_row_index, 'Random_Name')
+        loan_id_found = snapshot.book.value(customer_row_index, 'Loan ID')
 
-        # --- Store Minimal Data in Session ---
-        session['customer_idx'] = int(customer_row_index) # Convert NumPy int64 to standard Python int
-        session['customer_name'] = customer_name_found
-        session['chat_history_min'] = [] # Start empty minimal history
+        # --- Store the Conversation Server-Side ---
+        # Keyed by Loan ID, not the row position, so the conversation survives loan book reloads.
+        with trace_span('conversation_save'):
+            conversation_store.put(current_session_id, new_conversation(loan_id_found, customer_name_found))
+        with trace_span('opening_turn'):
+            start_opening_turn(snapshot, customer_row_index, current_session_id)
+        if call_queue is not None:
+            call_queue.record_outcome(loan_id_found, 'in_call', until=time.time() + CALL_QUEUE_IN_CALL_SECONDS)
 
-        logging.info(f"Session {current_session_id}: Customer '{customer_name_found}' found at index {customer_row_index}. Storing minimal data in session.")
-        logging.info(f"Session state after successful lookup: {dict(session)}")
+        logging.info("Session %s: Customer '%s' (Loan ID %s) found at index %s via %s match. Stored new conversation server-side.", current_session_id, customer_name_found, loan_id_found, customer_row_index, lookup_result.match_type)
+        log_dump("Session state after successful lookup", session, current_session_id)
 
-        response_msg = f"Thank you, I've located the loan file for {session['customer_name']}. Please click 'Start Talking (Voice)' when you're ready to connect with the Apex representative."
+        response_msg = f"Thank you, I've located the loan file for {customer_name_found}. Please click 'Start Talking (Voice)' when you're ready to connect with the Apex representative."
         return jsonify({"response": response_msg, "customer_found": True})
 
 
-    else:
-        # No match. Clear relevant session data and report.
-        logging.warning(f"Session {current_session_id}: Customer name '{customer_name_input}' not found in CSV data.")
-        response_msg = f"I couldn't find loan details for a customer named {customer_name_input}. Please confirm the name or provide the Loan ID."
-        session.pop('customer_idx', None)
-        session.pop('customer_name', None)
-        session.pop('chat_history_min', None)
-        logging.info(f"Session state after customer not found: {dict(session)}")
-        return jsonify({"response": response_msg, "customer_found": False})
+    # Not a unique match. Clear any previous conversation before reporting.
+    conversation_store.delete(current_session_id)
 
+    if lookup_result:
+        # Ambiguous (duplicate names) or approximate (prefix/typo) match. Return ranked candidates
+        # so the agent can confirm by Loan ID instead of silently picking the first row.
+        with trace_span('candidates'):
+            candidates = describe_lookup_candidates(snapshot, lookup_result.positions)
+        logging.info("Session %s: Lookup '%s' returned %s %s candidates.", current_session_id, lookup_query, len(candidates), lookup_result.match_type)
+        candidate_lines = "; ".join(f"{c['customer_name']} (Loan ID {c['loan_id']}, overdue {c['overdue_amount']})" for c in candidates)
+        if lookup_result.match_type in ('prefix', 'fuzzy'):
+            response_msg = f"I couldn't find an exact match for {lookup_query}. Did you mean: {candidate_lines}? Please confirm the full name or provide the Loan ID."
+        else:
+            response_msg = f"I found {len(candidates)} loan files matching {lookup_query}: {candidate_lines}. Please provide the Loan ID to confirm which one."
+        log_dump("Session state after ambiguous lookup", session, current_session_id)
+        return jsonify({"response": response_msg, "customer_found": False, "match_type": lookup_result.match_type, "candidates": candidates})
+
+    # No match. Report.
+    logging.warning("Session %s: Customer '%s' not found in CSV data.", current_session_id, lookup_query)
+    response_msg = f"I couldn't find loan details for a customer named {lookup_query}. Please confirm the name or provide the Loan ID."
+    log_dump("Session state after customer not found", session, current_session_id)
+    return jsonify({"response": response_msg, "customer_found": False})
 
-# --- Main chat route to handle conversation turns ---
-# Retrieves minimal session data, reloads customer data from DF, constructs full history for Gemini, calls API.
-@app.route('/chat', methods=['POST'])
-def chat():
-    user_input = request.json.get('text')
-    current_session_id = session.get('session_id', 'NoSessionId')
 
-    logging.info(f"Session {current_session_id}: Received chat input from user: '{user_input}'")
-    logging.info(f"Session state upon entering /chat: {dict(session)}")
+# --- Helper function to build the amount-aware fallback message used when the model call fails ---
+def build_fallback_message(loan_id, current_session_id):
+    overdue_amount_str_fallback = 'your overdue loan balance'
+    # Attempt to get overdue amount from the current loan book using the stored Loan ID for specificity
+    snapshot = loan_book_snapshot
+    customer_idx = snapshot.position_for(loan_id) if snapshot is not None else None
+    if customer_idx is not None:
+        try:
+             amount_value = snapshot.book.value(customer_idx, 'Current Loan Amount')
+             overdue_amount_str_fallback = f'${amount_value:,.2f}'
+
+             logging.debug("Session %s: Successfully extracted overdue amount from DF for fallback: %s", current_session_id, overdue_amount_str_fallback)
+
+        except Exception as parse_e:
+             logging.warning("Session %s: Could not extract overdue amount from DF for fallback message: %s", current_session_id, parse_e)
+             pass
+
+    return f"My apologies, I'm experiencing some technical difficulty right now and couldn't fully process that request. But while I have you, I still need to discuss resolving {overdue_amount_str_fallback}. Could we focus on finding a manageable payment option or setting up a plan for that today?"
+
+
+# --- Helper function to turn a Gemini response (text, blocked, or empty) into the spoken reply ---
+def extract_assistant_text(response, current_session_id):
+    try:
+        response_text = response.text if response else ""
+    except ValueError:
+        # .text raises when the candidate has no parts (e.g. the prompt or reply was blocked).
+        response_text = ""
+
+    if response_text:
+         llm_responses.inc('ok')
+         assistant_text = response_text.strip()
+         logging.info("Session %s: Gemini assistant text received (length: %s).", current_session_id, len(assistant_text))
+         logging.debug("Session %s: Gemini assistant text:\n%s", current_session_id, assistant_text)
+
+    elif response and response.prompt_feedback and response.prompt_feedback.block_reason:
+        block_reason = response.prompt_feedback.block_reason
+        llm_responses.inc('blocked')
+        logging.warning("Session %s: Gemini response blocked: %s", current_session_id, block_reason)
+        assistant_text = f"I'm sorry, I cannot respond to that query based on my guidelines (Blocked: {block_reason}). Let's focus back on resolving your loan account."
+
+    else:
+        llm_responses.inc('empty')
+        logging.warning("Session %s: Gemini returned empty response text or structure is unexpected.", current_session_id)
+        logging.warning("Session %s: Full response object received:\n%s", current_session_id, response)
+        assistant_text = "I'm sorry, I couldn't generate a clear response for that. Could you please try rephrasing, focusing on your loan resolution?"
+
+    return assistant_text
+
+
+# --- Helper functions assembling the model input for a turn (also used by campaign_runner.py) ---
+def build_prompt_prefix(formatted_customer_data_string):
+    return core_system_instruction + "\n\n" + formatted_customer_data_string
+
+
+# This includes the initial instruction/data (plus any summary of folded turns) PLUS the recent dialogue turns.
+# Creates a NEW list so the stored history is not modified before saving.
+def assemble_model_history(conversation, prompt_prefix, prefix_cached=False):
+    summary_section = format_summary_for_prompt(conversation)
+    if prefix_cached:
+        return ([{'role': 'user', 'parts': [summary_section.strip()]}] if summary_section else []) + conversation['history'][:]
+    return [{'role': 'user', 'parts': [prompt_prefix + summary_section]}] + conversation['history'][:] # Use slice [:] to create a copy
+
+
+# --- Prepared opening turns ---
+# OPENING_TURN_MODE=template|llm makes /find_customer prepare the call's opening reply in the background as
+# soon as the customer is located: `template` fills a local opening from the dossier instantly, `llm` runs the
+# real first-turn prompt through the model pool, but only when the pool has an idle slot so live turns are
+# never delayed. The first /chat of the call serves the prepared opening when the customer's first words are a
+# plain greeting, waiting at most OPENING_TURN_WAIT_SECONDS for one still being generated (then falling back
+# to a normal model call). OPENING_TURNS_FILE loads openings pre-generated for the day's call list by
+# pregenerate_openings.py; those are served in every mode. Speculative openings live in this process only.
+OPENING_TURN_MODE = os.getenv("OPENING_TURN_MODE", "off").lower()
+OPENING_TURN_WAIT_SECONDS = float(os.getenv("OPENING_TURN_WAIT_SECONDS", "5"))
+opening_turns = OpeningTurnCache(max_entries=int(os.getenv("OPENING_TURN_CACHE_SIZE", "4096")),
+                                 ttl_seconds=int(os.getenv("OPENING_TURN_TTL_SECONDS", "1800")),
+                                 workers=int(os.getenv("OPENING_TURN_WORKERS", "4")))
+OPENING_TURNS_FILE = os.getenv("OPENING_TURNS_FILE")
+if OPENING_TURNS_FILE:
+    try:
+        opening_turns.load_file(OPENING_TURNS_FILE)
+    except OSError as e:
+        logging.error("Could not load pre-generated opening turns from '%s': %s", OPENING_TURNS_FILE, e)
+metrics.stats_gauge('loan_collection_opening_turns', 'Prepared opening turn statistics.', lambda: opening_turns.stats())
+
+
+# The model input for an opening: the first-turn prompt answering a plain greeting.
+def opening_turn_contents(prompt_prefix, loan_id, customer_name):
+    contents = assemble_model_history(new_conversation(loan_id, customer_name), prompt_prefix)
+    contents.append({'role': 'user', 'parts': [OPENING_PROBE_TEXT]})
+    return contents
+
+
+# Generates an opening with `mode` ('template' or 'llm' via generate_content). Returns (key, text); raises
+# when the model reply is blocked or empty so such openings are never served. Also used by pregenerate_openings.py.
+def generate_opening_turn(snapshot, customer_idx, mode, generate_content=None):
+    prompt_prefix = build_prompt_prefix(get_customer_dossier(snapshot, customer_idx))
+    loan_id = snapshot.book.value(customer_idx, 'Loan ID')
+    customer_name = snapshot.book.value(customer_idx, 'Random_Name')
+    if mode == 'template':
+        overdue_amount_text = f"${snapshot.book.value(customer_idx, 'Current Loan Amount'):,.2f}"
+        return opening_key(prompt_prefix), render_template_opening(loan_id, customer_name, overdue_amount_text)
+    response = generate_content(opening_turn_contents(prompt_prefix, loan_id, customer_name))
+    try:
+        text = response.text.strip() if response else ""
+    except ValueError:
+        text = "" # Blocked reply without text parts
+    if not text:
+        raise ValueError("Model returned a blocked or empty opening.")
+    return opening_key(prompt_prefix), text
+
+
+# Called by /find_customer on a unique match; never raises.
+def start_opening_turn(snapshot, customer_idx, current_session_id):
+    if OPENING_TURN_MODE not in ('template', 'llm'):
+        return
+    try:
+        if OPENING_TURN_MODE == 'template':
+            key, text = generate_opening_turn(snapshot, customer_idx, 'template')
+            opening_turns.put(key, text)
+            return
+        if llm_pool is None or llm_pool.outstanding >= llm_pool.max_concurrency:
+            logging.info("Session %s: Model pool busy; not generating the opening turn speculatively.", current_session_id)
+            return
+        key = opening_key(build_prompt_prefix(get_customer_dossier(snapshot, customer_idx)))
+        if opening_turns.start(key, lambda: generate_opening_turn(snapshot, customer_idx, 'llm', llm_pool.generate)[1]):
+            logging.info("Session %s: Started speculative opening turn generation (key %s).", current_session_id, key)
+    except Exception as e:
+        logging.warning("Session %s: Could not prepare the opening turn: %s", current_session_id, e)
 
 
+# Resolves a prepared opening for a WSGI route (blocking up to OPENING_TURN_WAIT_SECONDS); None means
+# "make a normal model call instead".
+def wait_for_prepared_opening(turn, current_session_id):
+    try:
+        with trace_span('prepared_opening'):
+            text = turn['prepared_opening'].result(timeout=OPENING_TURN_WAIT_SECONDS)
+    except Exception as e:
+        logging.warning("Session %s: Prepared opening turn unavailable (%s: %s); calling the model.", current_session_id, type(e).__name__, e)
+        opening_turns.discard(turn['opening_key'])
+        return None
+    record_prepared_opening_served(current_session_id)
+    return text
+
+
+def record_prepared_opening_served(current_session_id, trace=None):
+    llm_responses.inc('prepared')
+    trace = trace or current_trace()
+    if trace is not None:
+        trace.fields['opening'] = 'prepared'
+    logging.info("Session %s: Served the prepared opening turn.", current_session_id)
+
+
+# --- Helper function shared by /chat and /chat_stream ---
+# Loads the conversation from the server-side store, resolves its Loan ID in the current loan book snapshot,
+# reloads the (cached) customer dossier, compacts the history and
+# assembles the full Gemini history for this turn.
+# Returns (error_response, None) when the turn cannot proceed, otherwise (None, turn_context).
+def prepare_chat_turn(user_input, current_session_id):
     # --- Input Validation & Session State Check ---
-    if df is None:
-         logging.error(f"Session {current_session_id}: DataFrame is None in chat route.")
-         return jsonify({"response": "Error: Loan data not loaded on the server."}, 500)
+    snapshot = loan_book_snapshot # Use one snapshot for the whole turn, even if a reload swaps it meanwhile
+    if snapshot is None:
+         logging.error("Session %s: Loan book is None in chat route.", current_session_id)
+         return jsonify({"response": "Error: Loan data not loaded on the server."}, 500), None
 
-    customer_idx = session.get('customer_idx')
-    customer_name = session.get('customer_name')
-    # Retrieve chat history from the session *at the start of the request*.
-    chat_history_min = session.get('chat_history_min', [])
+    # Retrieve the conversation from the server-side store *at the start of the request*.
+    with trace_span('conversation_load'):
+        conversation = conversation_store.get(current_session_id) if 'session_id' in session else None
+    loan_id = conversation.get('loan_id') if conversation else None
+    customer_name = conversation.get('customer_name') if conversation else None
 
 
-    if customer_idx is None or customer_name is None:
-        logging.warning(f"Session {current_session_id}: Chat route called without valid customer index/name in session.")
-        logging.debug(f"Session {current_session_id}: Debug state -> customer_idx={customer_idx}, customer_name={customer_name}, chat_history_min length={len(chat_history_min)}.")
+    if loan_id is None or customer_name is None:
+        logging.warning("Session %s: Chat route called without a stored conversation for this session.", current_session_id)
+        logging.debug("Session %s: Debug state -> loan_id=%s, customer_name=%s.", current_session_id, loan_id, customer_name)
         # Session lost message.
-        return jsonify({"response": "It seems like the session state was lost. My apologies. Please try finding the customer by name again."})
+        return jsonify({"response": "It seems like the session state was lost. My apologies. Please try finding the customer by name again."}), None
 
 
     # --- Reload Customer Data & Construct Full History for Gemini ---
     try:
-        if customer_idx not in df.index:
-             logging.error(f"Session {current_session_id}: Stored customer_idx {customer_idx} not found in DataFrame index.")
-             session.pop('customer_idx', None)
-             session.pop('customer_name', None)
-             # session.pop('chat_history_min', None) # Keep history in case we can recover somehow? No, clear state.
-             session.pop('chat_history_min', []) # Clear history list
-             return jsonify({"response": "Error retrieving customer data. Please try finding the customer again."}, 500)
-
-        customer_row = df.iloc[[customer_idx]]
-        formatted_customer_data_string = format_customer_data_for_prompt(customer_row)
-        logging.debug(f"Session {current_session_id}: Reloaded and formatted customer data using index {customer_idx}.")
+        customer_idx = snapshot.position_for(loan_id)
+        if customer_idx is None:
+             logging.error("Session %s: Stored Loan ID %s not found in loan book version %s.", current_session_id, loan_id, snapshot.version)
+             conversation_store.delete(current_session_id) # Clear the conversation
+             return jsonify({"response": "Error retrieving customer data. Please try finding the customer again."}, 500), None
+
+        with trace_span('dossier'):
+            formatted_customer_data_string = get_customer_dossier(snapshot, customer_idx)
+        logging.debug("Session %s: Loaded formatted customer data (cached dossier) for Loan ID %s at index %s.", current_session_id, loan_id, customer_idx)
 
     except Exception as e:
-        logging.error(f"Session {current_session_id}: Error reloading customer data from DF for index {customer_idx}: {e}")
-        traceback.print_exc()
-        session.pop('customer_idx', None)
-        session.pop('customer_name', None)
-        session.pop('chat_history_min', [])
-        return jsonify({"response": "Error retrieving customer data. Please try finding the customer again."}, 500)
+        logging.error("Session %s: Error reloading customer data for Loan ID %s: %s", current_session_id, loan_id, e, exc_info=True)
+        conversation_store.delete(current_session_id)
+        return jsonify({"response": "Error retrieving customer data. Please try finding the customer again."}, 500), None
+
 
+    # --- Keep the prompt size roughly constant: fold old turns into the running summary ---
+    with trace_span('compaction'):
+        folded_turns = compact_history(conversation, token_budget=HISTORY_TOKEN_BUDGET,
+                                       min_recent_turns=HISTORY_MIN_RECENT_TURNS,
+                                       summary_token_budget=HISTORY_SUMMARY_TOKEN_BUDGET)
+    if folded_turns:
+        logging.info("Session %s: Folded %s older turns into the conversation summary.", current_session_id, folded_turns)
+    chat_history_min = conversation['history']
 
     # **Construct the FULL chat history for the Gemini API call in THIS turn.**
-    # This includes the initial instruction/data PLUS the dialogue turns from the minimal history.
-    # Create a NEW list here to avoid modifying the session list directly before saving.
-    full_chat_history_for_gemini = [{'role': 'user', 'parts': [core_system_instruction + "\n\n" + formatted_customer_data_string]}] + chat_history_min[:] # Use slice [:] to create a copy
-    logging.debug(f"Session {current_session_id}: Constructed full history for Gemini (length: {len(full_chat_history_for_gemini)}).")
+    # With context caching, the instruction/data prefix is already held by the cached model and is not resent.
+    with trace_span('prompt_assembly'):
+        prompt_prefix = build_prompt_prefix(formatted_customer_data_string)
+        cached_model = context_cache.model_for(prompt_prefix) if context_cache is not None else None
+        full_chat_history_for_gemini = assemble_model_history(conversation, prompt_prefix, prefix_cached=cached_model is not None)
+    logging.debug("Session %s: Constructed full history for Gemini (length: %s).", current_session_id, len(full_chat_history_for_gemini))
+
+
+    # --- Use a prepared opening for the call's first turn, if there is one ---
+    prepared_opening = None
+    prepared_opening_key = None
+    if not chat_history_min and not conversation.get('summary') and is_opening_input(user_input):
+        prepared_opening_key = opening_key(prompt_prefix)
+        prepared_opening = opening_turns.lookup(prepared_opening_key)
 
 
     # --- Add User's Input to Minimal History & Prepare for Gemini ---
@@ -324,88 +798,320 @@ def chat():
          cleaned_user_input = user_input.strip()
          # Append to the list for this Gemini call.
          full_chat_history_for_gemini.append({'role': 'user', 'parts': [cleaned_user_input]})
-         # Append to the minimal session history (list loaded at start of request).
-         chat_history_min.append({'role': 'user', 'parts': [cleaned_user_input]}) # Add to the list loaded from session
-         logging.info(f"Session {current_session_id}: Appended cleaned user input to full history for Gemini & minimal session history (local list). New minimal length: {len(chat_history_min)}.")
+         # Append to the conversation history (loaded from the store at start of request).
+         chat_history_min.append({'role': 'user', 'parts': [cleaned_user_input]})
+         logging.info("Session %s: Appended cleaned user input to full history for Gemini & conversation history (local copy). New history length: %s.", current_session_id, len(chat_history_min))
     else:
          # Empty input. Return prompt without calling Gemini.
-         logging.warning(f"Session {current_session_id}: Received empty or whitespace user_input: '{user_input}'. Not appending to history, skipping Gemini call.")
-         return jsonify({"response": "I didn't quite catch that. Can you please say that again clearly?"})
+         logging.warning("Session %s: Received empty or whitespace user_input: '%s'. Not appending to history, skipping Gemini call.", current_session_id, user_input)
+         return jsonify({"response": "I didn't quite catch that. Can you please say that again clearly?"}), None
+
+
+    # --- Check the Gemini AI Model ---
+    if prepared_opening is None and (model is None or llm_pool is None):
+        logging.error("Session %s: Gemini model is not initialized. Cannot call API.", current_session_id)
+        return jsonify({"response": "The AI system is currently unavailable. Please try again later."}, 500), None
+
+    trace = current_trace()
+    history_turns.observe(len(chat_history_min), trace.route if trace is not None else 'offline')
+    if trace is not None:
+        trace.fields['history_turns'] = len(chat_history_min)
+
+    return None, {
+        'loan_id': loan_id,
+        'conversation': conversation,
+        'full_chat_history_for_gemini': full_chat_history_for_gemini,
+        'model': cached_model, # None means the pool's default model
+        'prepared_opening': prepared_opening, # Future holding the prepared opening text, or None
+        'opening_key': prepared_opening_key,
+    }
+
+
+# --- Helper function to store the conversation for this turn server-side ---
+def save_conversation_turn(conversation, current_session_id):
+    with trace_span('conversation_save'):
+        conversation_store.put(current_session_id, conversation)
+    logging.info("Session %s: Saved conversation to the store (history length: %s, summarized turns: %s).", current_session_id, len(conversation['history']), conversation.get('summarized_turns', 0))
+    log_dump("Conversation after save", conversation, current_session_id)
+
+
+# --- Helper function to store the model's reply for this turn ---
+def record_model_reply(conversation, assistant_text, current_session_id):
+    history = conversation['history']
+    user_text = turn_text(history[-1]) if history and history[-1]['role'] == 'user' else ''
+    # Append the assistant's response to the conversation history and persist it server-side.
+    history.append({'role': 'model', 'parts': [assistant_text]})
+    save_conversation_turn(conversation, current_session_id)
+    log_transcript({'kind': 'turn', 'session_id': current_session_id, 'loan_id': conversation.get('loan_id'),
+                    'customer_name': conversation.get('customer_name'),
+                    'turn': conversation.get('summarized_turns', 0) + len(history) // 2,
+                    'user_text': user_text, 'assistant_text': assistant_text})
+
+
+# --- Helper function for the fast "please hold" reply when the model pool is saturated or over its rate limit ---
+# The user's turn was never stored, so the customer can simply repeat it.
+def respond_pool_saturated(current_session_id, error=None):
+    if isinstance(error, RateLimitedError):
+        llm_responses.inc('rate_limited')
+        logging.warning("Session %s: Model call rate limit reached; returning hold message.", current_session_id)
+    else:
+        llm_responses.inc('busy')
+        logging.warning("Session %s: Model call pool saturated; returning hold message.", current_session_id)
+    return jsonify({"response": LLM_BUSY_MESSAGE, "busy": True})
 
 
-    # --- Call Gemini AI Model ---
-    if model is None:
-        logging.error(f"Session {current_session_id}: Gemini model is not initialized. Cannot call API.")
-        return jsonify({"response": "The AI system is currently unavailable. Please try again later."}, 500)
+# --- Main chat route to handle conversation turns ---
+# Retrieves minimal session data, reloads customer data from DF, constructs full history for Gemini, calls API.
+@app.route('/chat', methods=['POST'])
+def chat():
+    user_input = request.json.get('text')
+    current_session_id = session.get('session_id', 'NoSessionId')
+
+    logging.info("Session %s: Received chat input from user: '%s'", current_session_id, user_input)
+    log_dump("Session state upon entering /chat", session, current_session_id)
 
+    error_response, turn = prepare_chat_turn(user_input, current_session_id)
+    if error_response is not None:
+        return error_response
+
+    conversation = turn['conversation']
+    full_chat_history_for_gemini = turn['full_chat_history_for_gemini']
+
+    if turn['prepared_opening'] is not None:
+        assistant_text = wait_for_prepared_opening(turn, current_session_id)
+        if assistant_text is not None:
+            record_model_reply(conversation, assistant_text, current_session_id)
+            return jsonify({"response": assistant_text})
 
     try:
         # **Call the Gemini API** with the complete history assembled for this turn.
-        logging.info(f"Session {current_session_id}: Calling Gemini generate_content with assembled full history (length: {len(full_chat_history_for_gemini)}).")
-        response = model.generate_content(full_chat_history_for_gemini)
+        logging.info("Session %s: Calling Gemini generate_content with assembled full history (length: %s).", current_session_id, len(full_chat_history_for_gemini))
+        with trace_span('llm'):
+            response = llm_pool.generate(full_chat_history_for_gemini, model=turn['model'])
 
         # --- Process Gemini's Response ---
-        assistant_text = ""
-        if response and response.text:
-             assistant_text = response.text.strip()
-             logging.info(f"Session {current_session_id}: Gemini assistant text received (length: {len(assistant_text)}).")
-             logging.debug(f"Session {current_session_id}: Gemini assistant text:\n{assistant_text}")
+        assistant_text = extract_assistant_text(response, current_session_id)
+        record_model_usage(full_chat_history_for_gemini, response, assistant_text)
 
-        elif response and response.prompt_feedback and response.prompt_feedback.block_reason:
-            block_reason = response.prompt_feedback.block_reason
-            logging.warning(f"Session {current_session_id}: Gemini response blocked: {block_reason}")
-            assistant_text = f"I'm sorry, I cannot respond to that query based on my guidelines (Blocked: {block_reason}). Let's focus back on resolving your loan account."
+        # --- Update Conversation History with Model Response ---
+        record_model_reply(conversation, assistant_text, current_session_id)
 
-        else:
-            logging.warning(f"Session {current_session_id}: Gemini returned empty response text or structure is unexpected.")
-            logging.warning(f"Session {current_session_id}: Full response object received:\n{response}")
-            assistant_text = "I'm sorry, I couldn't generate a clear response for that. Could you please try rephrasing, focusing on your loan resolution?"
+    except PoolSaturatedError as e: # Includes RateLimitedError
+        return respond_pool_saturated(current_session_id, e)
 
-        # --- Update Minimal Session History with Model Response ---
-        # Append the assistant's response to the minimal history list (the local list loaded from session).
-        chat_history_min.append({'role': 'model', 'parts': [assistant_text]})
-        logging.info(f"Session {current_session_id}: Appended assistant response to minimal session history (local list). New minimal length: {len(chat_history_min)}.")
+    # --- Error Handling for API or Other Server-Side Failures ---
+    except Exception as e:
+        logging.error("Session %s: An exception occurred during chat processing or Gemini API call: %s", current_session_id, e, exc_info=not isinstance(e, CircuitOpenError)) # Circuit open: failed fast, no traceback worth logging
+        record_model_error(e)
 
-        # **CRITICAL FIX: Manually update the session object with the modified list.**
-        # This ensures Flask sees that the list has changed and persists the updated version to the cookie.
-        session['chat_history_min'] = chat_history_min
-        logging.info(f"Session {current_session_id}: Explicitly saved chat_history_min list back to session.")
+        assistant_text = build_fallback_message(turn['loan_id'], current_session_id)
+        # Record the fallback message as this turn's reply so the history stays consistent.
+        record_model_reply(conversation, assistant_text, current_session_id)
 
 
-    # --- Error Handling for API or Other Server-Side Failures ---
-    except Exception as e:
-        logging.error(f"Session {current_session_id}: An exception occurred during chat processing or Gemini API call: {e}")
-        traceback.print_exc()
+    # --- Return Response to Frontend ---
+    return jsonify({"response": assistant_text})
 
-        overdue_amount_str_fallback = 'your overdue loan balance'
-        # Attempt to get overdue amount from DF using stored index for specificity
-        if 'customer_idx' in session and df is not None and session['customer_idx'] in df.index:
-            try:
-                 customer_row = df.iloc[[session['customer_idx']]]
-                 amount_value = customer_row['Current Loan Amount'].iloc[0]
-                 overdue_amount_str_fallback = f'${amount_value:,.2f}'
 
-                 logging.debug(f"Session {current_session_id}: Successfully extracted overdue amount from DF for fallback: {overdue_amount_str_fallback}")
+# --- Streaming chat route ---
+# Same turn pipeline as /chat, but uses Gemini's streaming API and relays text chunks to the browser as
+# Server-Sent Events so speech can start on the first complete sentence instead of after the full reply.
+# Events: {"type": "delta", "text": ...} for each chunk, then {"type": "done", "response": <full text>}.
+def format_sse_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
 
-            except Exception as parse_e:
-                 logging.warning(f"Session {current_session_id}: Could not extract overdue amount from DF for fallback message: {parse_e}")
-                 pass
 
-        assistant_text = f"My apologies, I'm experiencing some technical difficulty right now and couldn't fully process that request. But while I have you, I still need to discuss resolving {overdue_amount_str_fallback}. Could we focus on finding a manageable payment option or setting up a plan for that today?"
-        # Append error response to minimal history (local list)
-        chat_history_min.append({'role': 'model', 'parts': [assistant_text]})
-        logging.info(f"Session {current_session_id}: Appended exception fallback message to minimal session history (local list). New minimal length: {len(chat_history_min)}.")
-         # **CRITICAL FIX: Manually update the session object with the modified list in error case too.**
-        session['chat_history_min'] = chat_history_min
-        logging.info(f"Session {current_session_id}: Explicitly saved chat_history_min list back to session after error.")
+@app.route('/chat_stream', methods=['POST'])
+def chat_stream():
+    user_input = request.json.get('text')
+    current_session_id = session.get('session_id', 'NoSessionId')
 
+    logging.info("Session %s: Received streaming chat input from user: '%s'", current_session_id, user_input)
+    log_dump("Session state upon entering /chat_stream", session, current_session_id)
 
-    # --- Return Response to Frontend ---
-    return jsonify({"response": assistant_text})
+    error_response, turn = prepare_chat_turn(user_input, current_session_id)
+    if error_response is not None:
+        return error_response # Plain JSON; the frontend handles it like a /chat reply.
+
+    loan_id = turn['loan_id']
+    conversation = turn['conversation']
+    full_chat_history_for_gemini = turn['full_chat_history_for_gemini']
+
+    # A prepared opening is sent as a single delta.
+    if turn['prepared_opening'] is not None:
+        prepared_text = wait_for_prepared_opening(turn, current_session_id)
+        if prepared_text is not None:
+            trace = current_trace()
+
+            def prepared_events():
+                yield format_sse_event({"type": "delta", "text": prepared_text})
+                record_model_reply(conversation, prepared_text, current_session_id)
+                yield format_sse_event({"type": "done", "response": prepared_text})
+                log_request_trace(trace, 200, current_session_id)
+
+            return Response(stream_with_context(prepared_events()), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    # Admission happens before any bytes are sent, so a saturated pool still gets the plain "please hold" reply.
+    trace = current_trace()
+    stream_started = time.perf_counter()
+    model_stream = None # Stays None when the pool is unavailable; the event stream then sends the fallback
+    try:
+        if llm_pool is not None:
+            logging.info("Session %s: Calling Gemini generate_content (stream=True) with assembled full history (length: %s).", current_session_id, len(full_chat_history_for_gemini))
+            model_stream = llm_pool.stream(full_chat_history_for_gemini, model=turn['model'])
+    except PoolSaturatedError as e: # Includes RateLimitedError
+        return respond_pool_saturated(current_session_id, e)
+
+    def generate_events():
+        assistant_text = ""
+        try:
+            if model_stream is None:
+                raise RuntimeError("Gemini model pool is not initialized.")
+            for chunk in model_stream:
+                if not assistant_text and trace is not None and 'llm_first_chunk' not in trace.stages:
+                    trace.record('llm_first_chunk', time.perf_counter() - stream_started)
+                try:
+                    chunk_text = chunk.text
+                except ValueError:
+                    chunk_text = "" # Chunk without text parts (e.g. safety metadata only)
+                if chunk_text:
+                    assistant_text += chunk_text
+                    yield format_sse_event({"type": "delta", "text": chunk_text})
+
+            assistant_text = assistant_text.strip()
+            if not assistant_text:
+                # Nothing was streamed: report the blocked/empty reply the same way /chat does.
+                assistant_text = extract_assistant_text(model_stream.response, current_session_id)
+                yield format_sse_event({"type": "delta", "text": assistant_text})
+            else:
+                llm_responses.inc('ok')
+                logging.info("Session %s: Gemini streamed assistant text received (length: %s).", current_session_id, len(assistant_text))
+            if trace is not None:
+                trace.record('llm', time.perf_counter() - stream_started)
+            record_model_usage(full_chat_history_for_gemini, model_stream.response, assistant_text)
+
+        except Exception as e:
+            logging.error("Session %s: An exception occurred during streaming Gemini API call: %s", current_session_id, e, exc_info=not isinstance(e, CircuitOpenError))
+            record_model_error(e)
+            # Discard any partial text; the fallback replaces the whole turn.
+            assistant_text = build_fallback_message(loan_id, current_session_id)
+            yield format_sse_event({"type": "reset"})
+            yield format_sse_event({"type": "delta", "text": assistant_text})
+
+        # The conversation lives server-side, so the full reply can be stored once streaming completes.
+        record_model_reply(conversation, assistant_text, current_session_id)
+        yield format_sse_event({"type": "done", "response": assistant_text})
+        log_request_trace(trace, 200, current_session_id)
+
+    return Response(stream_with_context(generate_events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# --- Prompt cache statistics ---
+# Hit rates for the rendered-dossier cache and (when enabled) Gemini context caching.
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "loan_book_version": loan_book_snapshot.version if loan_book_snapshot is not None else None,
+        "loan_book": {"storage": LOAN_BOOK_STORAGE, "rows": len(loan_book_snapshot.book), "bytes": loan_book_snapshot.book.memory_bytes()} if loan_book_snapshot is not None else None,
+        "loan_book_reloader": loan_book_reloader.stats() if loan_book_reloader is not None else None,
+        "dossier_cache": dossier_cache.stats(),
+        "context_cache": context_cache.stats() if context_cache is not None else None,
+    })
+
+
+# --- Call queue routes ---
+# GET /queue?page=1&per_page=50 lists callable loans by rank; GET /queue/stats summarizes the queue;
+# POST /queue/outcome {"loan_id", "outcome", "callback_at"?} logs a call and re-ranks that loan.
+@app.route('/queue', methods=['GET'])
+def queue_page():
+    if call_queue is None:
+        return jsonify({"response": "Error: Call queue not available on the server."}), 503
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 50))
+    except ValueError:
+        return jsonify({"response": "page and per_page must be integers."}), 400
+    if page < 1 or not 1 <= per_page <= CALL_QUEUE_MAX_PER_PAGE:
+        return jsonify({"response": f"page must be >= 1 and per_page between 1 and {CALL_QUEUE_MAX_PER_PAGE}."}), 400
+    return jsonify(call_queue.page(page, per_page))
+
+
+@app.route('/queue/stats', methods=['GET'])
+def queue_stats():
+    if call_queue is None:
+        return jsonify({"response": "Error: Call queue not available on the server."}), 503
+    return jsonify(call_queue.stats())
+
+
+@app.route('/queue/outcome', methods=['POST'])
+def queue_outcome():
+    if call_queue is None:
+        return jsonify({"response": "Error: Call queue not available on the server."}), 503
+    payload = request.get_json(silent=True) or {}
+    loan_id = str(payload.get('loan_id') or '').strip()
+    outcome = payload.get('outcome')
+    if not loan_id or outcome not in CALL_OUTCOMES:
+        return jsonify({"response": f"Provide a loan_id and an outcome, one of: {', '.join(CALL_OUTCOMES)}."}), 400
+    until = None
+    callback_at = payload.get('callback_at')
+    if callback_at:
+        if outcome != 'callback':
+            return jsonify({"response": "callback_at is only accepted with the 'callback' outcome."}), 400
+        try:
+            until = float(callback_at) if isinstance(callback_at, (int, float)) else datetime.datetime.fromisoformat(callback_at).timestamp()
+        except (TypeError, ValueError):
+            return jsonify({"response": "callback_at must be epoch seconds or an ISO 8601 timestamp."}), 400
+    entry = call_queue.record_outcome(loan_id, outcome, until=until)
+    if entry is None:
+        return jsonify({"response": f"Loan ID {loan_id} is not in the loan book."}), 404
+    current_session_id = session.get('session_id', 'NoSessionId')
+    log_transcript({'kind': 'call_outcome', 'session_id': current_session_id, 'loan_id': loan_id,
+                    'outcome': outcome, 'callback_at': until})
+    logging.info("Session %s: Logged call outcome '%s' for Loan ID %s.", current_session_id, outcome, loan_id)
+    return jsonify(entry)
+
+
+# --- Transcript reader ---
+# GET /transcripts?loan_id=...&since=...&until=...&kind=... streams matching records as JSON lines, oldest
+# first. since/until are epoch seconds or ISO 8601 dates/times; kind may be repeated.
+def parse_time_param(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+
+@app.route('/transcripts', methods=['GET'])
+def transcripts():
+    if transcript_writer is None:
+        return jsonify({"response": "Error: Transcript store is disabled (TRANSCRIPT_STORE=off)."}), 503
+    loan_id = request.args.get('loan_id') or None
+    kinds = request.args.getlist('kind') or None
+    try:
+        since = parse_time_param(request.args.get('since'))
+        until = parse_time_param(request.args.get('until'))
+    except ValueError:
+        return jsonify({"response": "since and until must be epoch seconds or ISO 8601 timestamps."}), 400
+    if loan_id is None and since is None and until is None:
+        return jsonify({"response": "Provide a loan_id or a since/until range."}), 400
+    records = transcript_writer.iter_records(loan_id=loan_id, since=since, until=until, kinds=kinds)
+    return Response((json.dumps(record, ensure_ascii=False) + '\n' for record in records), mimetype='application/x-ndjson')
+
+
+# --- Prometheus metrics ---
+# Stage/request latency histograms, token and history-length histograms, model outcome counters, and the
+# cache/pool/store/reloader gauges, in the Prometheus text exposition format.
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 # --- Flask Application Entry Point ---
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 8000))
-    logging.info(f"Starting Flask app on http://0.0.0.0:{port} (Debug Mode: {'True' if app.debug else 'False'})...")
+    logging.info("Starting Flask app on http://0.0.0.0:%s (Debug Mode: %s)...", port, 'True' if app.debug else 'False')
     app.run(debug=True, host='0.0.0.0', port=port)
\ No newline at end of file
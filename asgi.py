@@ -0,0 +1,323 @@
+import asyncio
+import io
+import logging
+import sys
+import time
+
+from flask import Response, request, session
+
+import app as loan_app
+from llm_pool import PoolSaturatedError
+from conversation_store import MemoryConversationStore
+from resilience import CircuitOpenError
+
+# --- ASGI entry point ---
+# Run with an ASGI server, e.g.:  uvicorn asgi:application --host 0.0.0.0 --port 8000
+#
+# /chat and /chat_stream are served natively: session handling and prompt assembly run on the event
+# loop, except conversation store reads and writes, which go to a worker thread unless the store is the
+# in-memory one (SQLite can wait up to its busy timeout), and turn preparation while Gemini context caching
+# is on (creating a cache is a blocking RPC). The model call is *awaited* through the shared
+# LLMClientPool, so a waiting conversation holds no worker thread. The pool's concurrency limit, queue backpressure ("please hold")
+# and per-request timeout apply exactly as on the WSGI routes.
+# Every other route (index, /find_customer, static files) is handed to the Flask WSGI app on a worker thread.
+
+flask_app = loan_app.app
+
+
+def build_environ(scope, body):
+    """Builds a WSGI environ for an ASGI HTTP scope so Flask request/session handling can be reused."""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client_addr, client_port = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client_addr,
+        'REMOTE_PORT': str(client_port),
+        'CONTENT_LENGTH': str(len(body)),  # The body is fully buffered before dispatch
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin1').upper().replace('-', '_')
+        value = raw_value.decode('latin1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            continue
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body', False):
+            return body
+
+
+async def send_response(send, status, headers, body_chunks):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+    })
+    async for chunk in body_chunks:
+        if chunk:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+async def _single_chunk(data):
+    yield data
+
+
+# --- Native async chat turns ---
+
+async def run_store_io(fn, *args):
+    """Runs fn (a helper that loads or saves the conversation) on a worker thread when the conversation store
+    does real I/O. The thread runs in a copy of the request context, so Flask's session and request work."""
+    if isinstance(loan_app.conversation_store, MemoryConversationStore):
+        return fn(*args)
+    return await asyncio.to_thread(fn, *args)
+
+
+async def prepare_turn(user_input, current_session_id):
+    """app.prepare_chat_turn, on a worker thread whenever it may block: with context caching on, the first
+    turn of a conversation creates the Gemini cached content, a blocking RPC."""
+    if loan_app.context_cache is not None:
+        return await asyncio.to_thread(loan_app.prepare_chat_turn, user_input, current_session_id)
+    return await run_store_io(loan_app.prepare_chat_turn, user_input, current_session_id)
+
+
+async def await_prepared_opening(turn, current_session_id, trace):
+    """Async counterpart of app.wait_for_prepared_opening; None means "make a normal model call instead"."""
+    started = time.perf_counter()
+    try:
+        text = await asyncio.wait_for(asyncio.wrap_future(turn['prepared_opening']), timeout=loan_app.OPENING_TURN_WAIT_SECONDS)
+    except Exception as e:
+        logging.warning("Session %s: Prepared opening turn unavailable (%s: %s); calling the model.", current_session_id, type(e).__name__, e)
+        loan_app.opening_turns.discard(turn['opening_key'])
+        return None
+    finally:
+        if trace is not None:
+            trace.record('prepared_opening', time.perf_counter() - started)
+    loan_app.record_prepared_opening_served(current_session_id, trace=trace)
+    return text
+
+
+async def chat_turn_async():
+    user_input = request.json.get('text')
+    current_session_id = session.get('session_id', 'NoSessionId')
+    logging.info("Session %s: Received async chat input from user: '%s'", current_session_id, user_input)
+
+    error_response, turn = await prepare_turn(user_input, current_session_id)
+    if error_response is not None:
+        return error_response
+
+    if turn['prepared_opening'] is not None:
+        assistant_text = await await_prepared_opening(turn, current_session_id, loan_app.current_trace())
+        if assistant_text is not None:
+            await run_store_io(loan_app.record_model_reply, turn['conversation'], assistant_text, current_session_id)
+            return {"response": assistant_text}
+
+    try:
+        with loan_app.trace_span('llm'):
+            response = await loan_app.llm_pool.generate_async(turn['full_chat_history_for_gemini'], model=turn['model'])
+        assistant_text = loan_app.extract_assistant_text(response, current_session_id)
+        loan_app.record_model_usage(turn['full_chat_history_for_gemini'], response, assistant_text)
+    except PoolSaturatedError as e:
+        return loan_app.respond_pool_saturated(current_session_id, e)
+    except Exception as e:
+        logging.error("Session %s: An exception occurred during async Gemini API call: %s", current_session_id, e, exc_info=not isinstance(e, CircuitOpenError))
+        loan_app.record_model_error(e)
+        assistant_text = loan_app.build_fallback_message(turn['loan_id'], current_session_id)
+
+    await run_store_io(loan_app.record_model_reply, turn['conversation'], assistant_text, current_session_id)
+    return {"response": assistant_text}
+
+
+async def chat_stream_turn_async():
+    """Returns (response, event_stream); event_stream is None when the turn ends without streaming."""
+    user_input = request.json.get('text')
+    current_session_id = session.get('session_id', 'NoSessionId')
+    logging.info("Session %s: Received async streaming chat input from user: '%s'", current_session_id, user_input)
+
+    error_response, turn = await prepare_turn(user_input, current_session_id)
+    if error_response is not None:
+        return error_response, None
+
+    # The event stream runs after the request context is gone, so it times and logs through the trace object.
+    trace = loan_app.current_trace()
+    response = Response(mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    if turn['prepared_opening'] is not None:
+        prepared_text = await await_prepared_opening(turn, current_session_id, trace)
+        if prepared_text is not None:
+            async def prepared_events():
+                yield loan_app.format_sse_event({"type": "delta", "text": prepared_text}).encode('utf8')
+                await run_store_io(loan_app.record_model_reply, turn['conversation'], prepared_text, current_session_id)
+                yield loan_app.format_sse_event({"type": "done", "response": prepared_text}).encode('utf8')
+                loan_app.log_request_trace(trace, 200, current_session_id)
+
+            return response, prepared_events()
+
+    stream_started = time.perf_counter()
+    model_stream = None # As in app.chat_stream: no pool means the event stream sends the fallback
+    try:
+        if loan_app.llm_pool is not None:
+            model_stream = await loan_app.llm_pool.stream_async(turn['full_chat_history_for_gemini'], model=turn['model'])
+    except PoolSaturatedError as e:
+        return loan_app.respond_pool_saturated(current_session_id, e), None
+
+    async def generate_events():
+        assistant_text = ""
+        try:
+            if model_stream is None:
+                raise RuntimeError("Gemini model pool is not initialized.")
+            async for chunk in model_stream:
+                if not assistant_text and trace is not None and 'llm_first_chunk' not in trace.stages:
+                    trace.record('llm_first_chunk', time.perf_counter() - stream_started)
+                try:
+                    chunk_text = chunk.text
+                except ValueError:
+                    chunk_text = ""
+                if chunk_text:
+                    assistant_text += chunk_text
+                    yield loan_app.format_sse_event({"type": "delta", "text": chunk_text}).encode('utf8')
+
+            assistant_text = assistant_text.strip()
+            if not assistant_text:
+                assistant_text = loan_app.extract_assistant_text(model_stream.response, current_session_id)
+                yield loan_app.format_sse_event({"type": "delta", "text": assistant_text}).encode('utf8')
+            else:
+                loan_app.llm_responses.inc('ok')
+            if trace is not None:
+                trace.record('llm', time.perf_counter() - stream_started)
+            loan_app.record_model_usage(turn['full_chat_history_for_gemini'], model_stream.response, assistant_text, trace=trace)
+        except Exception as e:
+            logging.error("Session %s: An exception occurred during async streaming Gemini API call: %s", current_session_id, e, exc_info=not isinstance(e, CircuitOpenError))
+            loan_app.record_model_error(e)
+            assistant_text = loan_app.build_fallback_message(turn['loan_id'], current_session_id)
+            yield loan_app.format_sse_event({"type": "reset"}).encode('utf8')
+            yield loan_app.format_sse_event({"type": "delta", "text": assistant_text}).encode('utf8')
+
+        await run_store_io(loan_app.record_model_reply, turn['conversation'], assistant_text, current_session_id)
+        yield loan_app.format_sse_event({"type": "done", "response": assistant_text}).encode('utf8')
+        loan_app.log_request_trace(trace, 200, current_session_id)
+
+    return response, generate_events()
+
+
+NATIVE_ROUTES = {
+    ('POST', '/chat'): chat_turn_async,
+    ('POST', '/chat_stream'): chat_stream_turn_async,
+}
+
+
+async def dispatch_native(handler, environ):
+    """Runs a native handler inside a Flask request context (before/after-request hooks and session saving included)."""
+    event_stream = None
+    with flask_app.request_context(environ):
+        try:
+            rv = flask_app.preprocess_request()
+            if rv is None:
+                rv = await handler()
+                if handler is chat_stream_turn_async:
+                    rv, event_stream = rv
+        except Exception as e:
+            event_stream = None
+            try:
+                rv = flask_app.handle_user_exception(e)  # HTTP errors (e.g. bad JSON) and registered handlers
+            except Exception as unhandled:
+                rv = flask_app.handle_exception(unhandled)
+        response = flask_app.make_response(rv)
+        response = flask_app.process_response(response)
+
+    if event_stream is None:
+        event_stream = _single_chunk(response.get_data())
+    return response.status_code, response.headers.to_wsgi_list(), event_stream
+
+
+# --- Fallback: run the Flask WSGI app on a worker thread ---
+
+def _run_wsgi(environ, loop, output):
+    """Runs the WSGI app and iterates its body on one thread, handing each piece to the event loop."""
+    def start_response(status, headers, exc_info=None):
+        loop.call_soon_threadsafe(output.put_nowait, ('start', int(status.split(' ', 1)[0]), headers))
+
+    app_iter = flask_app.wsgi_app(environ, start_response)
+    try:
+        for chunk in app_iter:
+            loop.call_soon_threadsafe(output.put_nowait, ('body', chunk))
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+        loop.call_soon_threadsafe(output.put_nowait, ('end',))
+
+
+async def dispatch_wsgi(environ):
+    loop = asyncio.get_running_loop()
+    output = asyncio.Queue()
+    worker = loop.run_in_executor(None, _run_wsgi, environ, loop, output)
+
+    first = await output.get()
+    if first[0] != 'start':
+        await worker  # The app failed before starting a response; re-raise its error
+        return 500, [('Content-Type', 'text/plain')], _single_chunk(b'Internal Server Error')
+    _, status, headers = first
+
+    async def body():
+        while True:
+            item = await output.get()
+            if item[0] == 'end':
+                break
+            yield item[1]
+        await worker  # Surface exceptions raised while iterating the body
+
+    return status, headers, body()
+
+
+# --- ASGI application ---
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if loan_app.llm_pool is not None:
+                    loan_app.llm_pool.shutdown()
+                loan_app.opening_turns.shutdown()
+                if loan_app.transcript_writer is not None:
+                    loan_app.transcript_writer.close()
+                if loan_app.loan_book_reloader is not None:
+                    loan_app.loan_book_reloader.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    if scope['type'] != 'http':
+        return
+
+    environ = build_environ(scope, await read_body(receive))
+    handler = NATIVE_ROUTES.get((scope['method'], scope['path']))
+    if handler is not None:
+        status, headers, body = await dispatch_native(handler, environ)
+    else:
+        status, headers, body = await dispatch_wsgi(environ)
+    await send_response(send, status, headers, body)
@@ -0,0 +1,40 @@
+"""Imports the Flask app configured for benchmarking: the local fake model, no loan book watcher.
+
+The app reads its configuration at import time, so the environment is set before the first import. Later
+calls reuse the imported module but still apply fake_latency and csv_path to it (the model's latency and the
+served loan book), so suites run one after another in the same process each get the settings they asked for.
+Other environment overrides only take effect on the first import.
+"""
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def import_app(fake_latency=0.0, csv_path=None, quiet=True, **env):
+    already_imported = 'app' in sys.modules
+    if not already_imported:
+        os.environ['LLM_BACKEND'] = 'fake'
+        os.environ['FAKE_LLM_LATENCY_SECONDS'] = str(fake_latency)
+        os.environ['LOAN_BOOK_RELOAD_SECONDS'] = '0'
+        os.environ['TRANSCRIPT_STORE'] = 'off' # Keep synthetic calls out of the transcript log
+        if csv_path:
+            os.environ['LOAN_BOOK_CSV'] = csv_path
+        for name, value in env.items():
+            os.environ[name] = str(value)
+    import app
+    if already_imported:
+        app.model.latency = fake_latency
+        if csv_path and os.path.abspath(csv_path) != os.path.abspath(app.csv_file_path):
+            from loan_book_reloader import load_snapshot
+            snapshot = load_snapshot(csv_path, storage=app.LOAN_BOOK_STORAGE, cache_dir=app.loan_book_cache_dir)
+            app.on_loan_book_swap(app.loan_book_snapshot, snapshot)
+            app.csv_file_path = csv_path
+        ignored = [name for name, value in env.items() if os.environ.get(name) != str(value)]
+        if ignored:
+            logging.warning("App already imported; ignoring environment overrides %s.", ', '.join(ignored))
+    if quiet:
+        logging.getLogger().setLevel(logging.WARNING) # The app logs every request at INFO
+        logging.getLogger('werkzeug').setLevel(logging.WARNING) # ...and so does the dev server's access log
+    return app
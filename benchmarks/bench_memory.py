@@ -0,0 +1,74 @@
+"""Loan book footprint: pandas DataFrame (per worker) vs. the compact memory-mapped layout (shared).
+
+Usage:
+    python benchmarks/bench_memory.py                   # bundled cleaned_data.csv
+    python benchmarks/bench_memory.py --rows 1000000    # synthetic book with the bundled file's schema
+    python benchmarks/bench_memory.py --workers 8 --json memory.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader  # noqa: E402
+import loan_book  # noqa: E402
+from synthetic import DEFAULT_CSV, synthesize_csv  # noqa: E402
+
+
+def record_latency_us(book, samples=2000):
+    positions = [random.randrange(len(book)) for _ in range(samples)]
+    timings = []
+    for position in positions:
+        started = time.perf_counter()
+        book.record(position)
+        timings.append((time.perf_counter() - started) * 1e6)
+    return round(statistics.median(timings), 2)
+
+
+def run(csv_path, workers, cache_dir):
+    df, source_hash = data_loader.load_loan_book(csv_path, cache_dir=cache_dir, use_cache=False)
+    frame_book = loan_book.FrameLoanBook(df)
+    compact_book, _ = loan_book.load_compact_loan_book(csv_path, cache_dir=cache_dir)
+    frame_bytes = frame_book.memory_bytes()
+    compact_bytes = compact_book.memory_bytes()
+    return {
+        'csv': os.path.basename(csv_path),
+        'rows': len(frame_book),
+        'workers': workers,
+        'frame': {'bytes_per_worker': frame_bytes, 'bytes_total': frame_bytes * workers,
+                  'record_median_us': record_latency_us(frame_book)},
+        'compact': {'bytes_shared': compact_bytes, 'bytes_total': compact_bytes,
+                    'record_median_us': record_latency_us(compact_book)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=DEFAULT_CSV, help='Loan book CSV to load (default: bundled cleaned_data.csv)')
+    parser.add_argument('--rows', type=int, help='Benchmark a synthetic book of this many rows instead')
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes to extrapolate totals for')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = synthesize_csv(args.csv, args.rows, workdir) if args.rows else args.csv
+        results = run(csv_path, args.workers, cache_dir=os.path.join(workdir, 'cache'))
+
+    print(f"Loan book: {results['csv']} ({results['rows']} rows, {results['workers']} workers)")
+    print(f"  frame    {results['frame']['bytes_per_worker'] / 1e6:>10.1f} MB per worker  "
+          f"{results['frame']['bytes_total'] / 1e6:>10.1f} MB total   record() {results['frame']['record_median_us']} us")
+    print(f"  compact  {results['compact']['bytes_shared'] / 1e6:>10.1f} MB shared      "
+          f"{results['compact']['bytes_total'] / 1e6:>10.1f} MB total   record() {results['compact']['record_median_us']} us")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""In-process microbenchmarks: customer lookup, dossier formatting and conversation (session) serialization.
+
+Usage:
+    python benchmarks/bench_micro.py                         # bundled cleaned_data.csv
+    python benchmarks/bench_micro.py --rows 100000 --json micro.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader  # noqa: E402
+import loan_book  # noqa: E402
+from app_harness import import_app  # noqa: E402
+from conversation_store import MemoryConversationStore, SQLiteConversationStore, new_conversation  # noqa: E402
+from customer_index import CustomerIndex  # noqa: E402
+from history_compaction import compact_history  # noqa: E402
+from prompt_cache import DossierCache  # noqa: E402
+from report import percentiles, write_report  # noqa: E402
+from synthetic import DEFAULT_CSV, synthesize_csv  # noqa: E402
+
+
+def time_each(fn, args_list):
+    """Per-call latency in microseconds for fn(*args) over args_list."""
+    samples = []
+    for args in args_list:
+        started = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - started) * 1e6)
+    return percentiles(samples, unit='us')
+
+
+def _typo(name, rng):
+    i = rng.randrange(1, max(2, len(name) - 1))
+    return name[:i] + name[i + 1:] if len(name) > 4 else name
+
+
+def bench_lookup(index, frame, samples, rng):
+    rows = [rng.randrange(len(frame)) for _ in range(samples)]
+    names = frame['Random_Name'].to_numpy()
+    queries = {
+        'exact_name': [names[i] for i in rows],
+        'prefix': [names[i][:5] for i in rows],
+        'fuzzy_typo': [_typo(names[i], rng) for i in rows],
+        'loan_id': [frame['Loan ID'].iat[i] for i in rows],
+        'phone': [frame['Random_Phone_Number'].iat[i] for i in rows],
+    }
+    return {kind: time_each(index.lookup, [(q,) for q in values]) for kind, values in queries.items()}
+
+
+def bench_dossier(app, books, samples, rng):
+    results = {}
+    for name, book in books.items():
+        rows = [rng.randrange(len(book)) for _ in range(samples)]
+        results[f'{name}_render'] = time_each(lambda i: app.format_customer_data_for_prompt(book.record(i)), [(i,) for i in rows])
+    cache = DossierCache(max_entries=samples)
+    book = books['frame']
+    rows = [rng.randrange(len(book)) for _ in range(samples)]
+    for i in rows: # Warm the cache, then time hits only
+        cache.get_or_render('bench', i, lambda i=i: app.format_customer_data_for_prompt(book.record(i)))
+    results['cache_hit'] = time_each(lambda i: cache.get_or_render('bench', i, None), [(i,) for i in rows])
+    return results
+
+
+def sample_conversation(turns):
+    conversation = new_conversation('00000000-0000-4000-8000-000000000000', 'Gregory Perez')
+    for i in range(turns):
+        conversation['history'].append({'role': 'user', 'parts': [f"I can pay about ${50 * (i + 1)} next week, but things are tight right now. {i}"]})
+        conversation['history'].append({'role': 'model', 'parts': [
+            "Thank you for sharing that. A payment of that size next week would really help keep late fees down. "
+            "Could you confirm the exact date and whether you'd prefer card or bank transfer?"]})
+    return conversation
+
+
+def bench_sessions(samples, turns):
+    conversation = sample_conversation(turns)
+    keys = [f'session-{i}' for i in range(samples)]
+    results = {
+        'history_turns': turns * 2,
+        'json_bytes': len(json.dumps(conversation)),
+        'json_roundtrip': time_each(lambda: json.loads(json.dumps(conversation)), [()] * samples),
+    }
+    memory_store = MemoryConversationStore(max_entries=samples * 2)
+    results['memory_put'] = time_each(memory_store.put, [(key, conversation) for key in keys])
+    results['memory_get'] = time_each(memory_store.get, [(key,) for key in keys])
+    with tempfile.TemporaryDirectory() as workdir:
+        sqlite_store = SQLiteConversationStore(os.path.join(workdir, 'bench.sqlite3'))
+        results['sqlite_put'] = time_each(sqlite_store.put, [(key, conversation) for key in keys])
+        results['sqlite_get'] = time_each(sqlite_store.get, [(key,) for key in keys])
+    results['compact_history'] = time_each(
+        lambda: compact_history(json.loads(json.dumps(conversation)), token_budget=1500, min_recent_turns=6), [()] * samples)
+    return results
+
+
+def run(csv_path, samples=2000, turns=10, seed=0):
+    rng = random.Random(seed)
+    app = import_app()
+    frame, _ = data_loader.load_loan_book(csv_path, use_cache=False)
+    with tempfile.TemporaryDirectory() as workdir:
+        compact_dir = os.path.join(workdir, 'compact')
+        loan_book.write_compact_book(frame, compact_dir)
+        books = {'frame': loan_book.FrameLoanBook(frame), 'compact': loan_book.CompactLoanBook(compact_dir)}
+        started = time.perf_counter()
+        index = CustomerIndex.from_loan_book(books['frame'])
+        return {
+            'rows': len(frame),
+            'index_build_ms': round((time.perf_counter() - started) * 1000, 2),
+            'lookup': bench_lookup(index, frame, samples, rng),
+            'dossier': bench_dossier(app, books, samples, rng),
+            'session': bench_sessions(samples, turns),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=DEFAULT_CSV, help='Loan book CSV (default: bundled cleaned_data.csv)')
+    parser.add_argument('--rows', type=int, help='Benchmark a synthetic book of this many rows instead')
+    parser.add_argument('--samples', type=int, default=2000, help='Calls timed per benchmark')
+    parser.add_argument('--turns', type=int, default=10, help='Exchanges in the serialized conversation')
+    parser.add_argument('--json', help='Write a report to this JSON file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = synthesize_csv(args.csv, args.rows, workdir) if args.rows else args.csv
+        results = run(csv_path, args.samples, args.turns)
+
+    print(f"Microbenchmarks over {results['rows']} rows (index build {results['index_build_ms']} ms), median / p99 in us:")
+    for group in ('lookup', 'dossier', 'session'):
+        for name, stats in results[group].items():
+            if isinstance(stats, dict):
+                print(f"  {group + '.' + name:<28} {stats['p50_us']:>10.1f} {stats['p99_us']:>10.1f}")
+    if args.json:
+        write_report(args.json, {'micro': results})
+
+
+if __name__ == '__main__':
+    main()
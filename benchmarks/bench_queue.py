@@ -0,0 +1,97 @@
+"""Call queue: scoring and ranking the whole book, incremental re-ranks for deltas and logged outcomes.
+
+Usage:
+    python benchmarks/bench_queue.py                      # synthetic book of 1,000,000 rows
+    python benchmarks/bench_queue.py --rows 3000000 --changed 5000
+    python benchmarks/bench_queue.py --rows 100000 --json queue.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import call_queue  # noqa: E402
+import data_loader  # noqa: E402
+from loan_book_reloader import snapshot_from_frame  # noqa: E402
+from synthetic import DEFAULT_CSV, synthesize_frame  # noqa: E402
+
+
+def _ms(started):
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def run(csv_path=DEFAULT_CSV, rows=1_000_000, changed=1000, outcomes=500, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = data_loader.clean_loan_book(synthesize_frame(csv_path, rows, seed=seed))
+    snapshot = snapshot_from_frame(frame, 'bench-0', csv_path)
+
+    started = time.perf_counter()
+    call_queue.score_loan_book(snapshot.book)
+    score_ms = _ms(started)
+
+    started = time.perf_counter()
+    queue = call_queue.CallQueue(snapshot)
+    full_rank_ms = _ms(started)
+
+    # A delta that changes `changed` balances, as LoanBookReloader would build it.
+    positions = rng.choice(len(frame), size=changed, replace=False)
+    updated = frame.copy()
+    balances = updated['Current Loan Amount'].to_numpy(copy=True)
+    balances[positions] = rng.integers(1_000, 800_000, size=changed)
+    updated['Current Loan Amount'] = balances
+    delta_snapshot = snapshot_from_frame(updated, 'bench-1', csv_path, parent_version=snapshot.version)
+    started = time.perf_counter()
+    queue.update_snapshot(snapshot, delta_snapshot)
+    delta_update_ms = _ms(started)
+
+    loan_ids = [delta_snapshot.book.value(int(p), 'Loan ID') for p in rng.choice(len(frame), size=outcomes, replace=False)]
+    names = [name for name in call_queue.CALL_OUTCOMES if name != 'in_call']
+    timings = []
+    for i, loan_id in enumerate(loan_ids):
+        started = time.perf_counter()
+        queue.record_outcome(loan_id, names[i % len(names)])
+        timings.append((time.perf_counter() - started) * 1e6)
+
+    started = time.perf_counter()
+    queue.page(1, 50)
+    first_page_ms = _ms(started)
+    started = time.perf_counter()
+    queue.page(max(1, len(frame) // 100), 50)
+    deep_page_ms = _ms(started)
+
+    return {
+        'rows': len(frame),
+        'score_ms': score_ms,
+        'full_rank_ms': full_rank_ms,
+        'delta_changed_rows': changed,
+        'delta_update_ms': delta_update_ms,
+        'outcome_median_us': round(statistics.median(timings), 1),
+        'first_page_ms': first_page_ms,
+        'deep_page_ms': deep_page_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=DEFAULT_CSV, help='Schema and value source (default: bundled cleaned_data.csv)')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Synthetic book size')
+    parser.add_argument('--changed', type=int, default=1000, help='Rows changed by the benchmarked delta')
+    parser.add_argument('--outcomes', type=int, default=500, help='Call outcomes to log')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run(args.csv, args.rows, args.changed, args.outcomes)
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
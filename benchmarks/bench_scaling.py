@@ -0,0 +1,68 @@
+"""Scaling runs: startup, memory and lookup/dossier latency across loan book sizes (synthetic rows).
+
+Usage:
+    python benchmarks/bench_scaling.py                          # 1k, 10k, 100k rows
+    python benchmarks/bench_scaling.py --sizes 10000 1000000 --json scaling.json
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench_memory  # noqa: E402
+import bench_micro  # noqa: E402
+import bench_startup  # noqa: E402
+from report import write_report  # noqa: E402
+from synthetic import DEFAULT_CSV, synthesize_csv  # noqa: E402
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+
+def run_size(source_csv, rows, samples, repeat, workers):
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = synthesize_csv(source_csv, rows, workdir)
+        startup = bench_startup.run(csv_path, repeat, cache_dir=os.path.join(workdir, 'cache'))
+        startup.pop('legacy_row_wise_csv') # Row-wise cleaning is minutes at 100k+ rows; bench_startup covers it
+        memory = bench_memory.run(csv_path, workers, cache_dir=os.path.join(workdir, 'cache'))
+        micro = bench_micro.run(csv_path, samples=samples)
+    return {
+        'rows': rows,
+        'startup': startup,
+        'memory': memory,
+        'index_build_ms': micro['index_build_ms'],
+        'lookup': micro['lookup'],
+        'dossier': micro['dossier'],
+    }
+
+
+def run(source_csv=DEFAULT_CSV, sizes=DEFAULT_SIZES, samples=500, repeat=3, workers=4):
+    return {f'rows_{rows}': run_size(source_csv, rows, samples, repeat, workers) for rows in sizes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=DEFAULT_CSV, help='Schema and value source (default: bundled cleaned_data.csv)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='Row counts to benchmark')
+    parser.add_argument('--samples', type=int, default=500, help='Calls timed per lookup/dossier benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per load strategy (median reported)')
+    parser.add_argument('--workers', type=int, default=4, help='Worker processes to extrapolate memory totals for')
+    parser.add_argument('--json', help='Write a report to this JSON file')
+    args = parser.parse_args()
+
+    results = run(args.csv, args.sizes, args.samples, args.repeat, args.workers)
+    print(f"{'rows':>10} {'csv ms':>10} {'cache ms':>10} {'index ms':>10} {'frame MB':>10} {'compact MB':>11} "
+          f"{'exact us':>10} {'fuzzy us':>10} {'dossier us':>11}")
+    for size in results.values():
+        print(f"{size['rows']:>10} {size['startup']['vectorized_csv']['median_ms']:>10.1f} "
+              f"{size['startup']['binary_cache']['median_ms']:>10.1f} {size['index_build_ms']:>10.1f} "
+              f"{size['memory']['frame']['bytes_per_worker'] / 1e6:>10.1f} {size['memory']['compact']['bytes_shared'] / 1e6:>11.1f} "
+              f"{size['lookup']['exact_name']['p50_us']:>10.1f} {size['lookup']['fuzzy_typo']['p50_us']:>10.1f} "
+              f"{size['dossier']['frame_render']['p50_us']:>11.1f}")
+    if args.json:
+        write_report(args.json, {'scaling': results})
+
+
+if __name__ == '__main__':
+    main()
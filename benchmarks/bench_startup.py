@@ -0,0 +1,86 @@
+"""Cold-start benchmark: row-wise CSV cleaning vs. vectorized CSV cleaning vs. the binary cache.
+
+Usage:
+    python benchmarks/bench_startup.py                   # bundled cleaned_data.csv
+    python benchmarks/bench_startup.py --rows 1000000    # synthetic book with the bundled file's schema
+    python benchmarks/bench_startup.py --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_loader  # noqa: E402
+from synthetic import DEFAULT_CSV, synthesize_csv  # noqa: E402,F401
+
+
+def legacy_row_wise_load(csv_path):
+    """The original import-time cleaning: per-cell .apply(lambda ...) over each numeric column."""
+    df = pd.read_csv(csv_path)
+    for col in data_loader.NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+            df[col] = df[col].apply(lambda x: x if pd.isna(x) else (int(x) if x == int(x) else float(x)))
+            df[col] = df[col].fillna(0.0)
+    if 'Credit Score' in df.columns:
+        df['Credit Score'] = pd.to_numeric(df['Credit Score'], errors='coerce')
+        df['Credit Score'] = df['Credit Score'].apply(lambda x: x / 10.0 if pd.notna(x) and x > 1000 and x < 10000 else x)
+        df['Credit Score'] = df['Credit Score'].clip(lower=300.0, upper=850.0)
+        df['Credit Score'] = df['Credit Score'].apply(lambda x: x if pd.isna(x) else (int(x) if x == int(x) else float(x)))
+        df['Credit Score'] = df['Credit Score'].astype(object).where(df['Credit Score'].notna(), 'Unknown Score')
+    for col in data_loader.TEXT_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].fillna('Unknown')
+    return df
+
+
+def time_call(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {'median_ms': round(statistics.median(samples), 2), 'min_ms': round(min(samples), 2), 'runs': repeat}
+
+
+def run(csv_path, repeat, cache_dir):
+    results = {
+        'csv': os.path.basename(csv_path),
+        'rows': len(pd.read_csv(csv_path, usecols=[0])),
+        'legacy_row_wise_csv': time_call(lambda: legacy_row_wise_load(csv_path), repeat),
+        'vectorized_csv': time_call(lambda: data_loader.load_loan_book(csv_path, cache_dir=cache_dir, use_cache=False), repeat),
+    }
+    data_loader.load_loan_book(csv_path, cache_dir=cache_dir)  # Populate the cache
+    results['binary_cache'] = time_call(lambda: data_loader.load_loan_book(csv_path, cache_dir=cache_dir), repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default=DEFAULT_CSV, help='Loan book CSV to load (default: bundled cleaned_data.csv)')
+    parser.add_argument('--rows', type=int, help='Benchmark a synthetic book of this many rows instead')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per strategy (median reported)')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = synthesize_csv(args.csv, args.rows, workdir) if args.rows else args.csv
+        results = run(csv_path, args.repeat, cache_dir=os.path.join(workdir, 'cache'))
+
+    print(f"Loan book: {results['csv']} ({results['rows']} rows)")
+    for name in ('legacy_row_wise_csv', 'vectorized_csv', 'binary_cache'):
+        print(f"  {name:<22} median {results[name]['median_ms']:>10.2f} ms   min {results[name]['min_ms']:>10.2f} ms")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""End-to-end load generator: concurrent simulated collection calls against /find_customer and /chat.
+
+Each simulated session loads / (for its cookie), locates a random customer by Loan ID, then plays --turns
+customer lines through /chat (or /chat_stream with --stream, recording time to the first event). By default
+the app runs in-process on a threaded werkzeug server with the fake model answering after --latency
+seconds; pass --url to drive an already running server instead (its model backend is whatever it was
+started with).
+
+Usage:
+    python benchmarks/load_test.py --sessions 200 --concurrency 32 --latency 0.5
+    python benchmarks/load_test.py --stream --json load.json
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --sessions 50
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+from app_harness import import_app  # noqa: E402
+from report import percentiles, write_report  # noqa: E402
+from synthetic import DEFAULT_CSV, synthesize_csv  # noqa: E402
+
+CUSTOMER_LINES = [
+    "Hi, who is this?",
+    "Okay, what is this about?",
+    "Money is tight this month, I'm not sure I can pay.",
+    "Could I pay part of it now and the rest later?",
+    "I could do about a hundred dollars on Friday.",
+    "Can you tell me how much is overdue exactly?",
+    "Alright, let's set that up.",
+    "Thanks, bye.",
+]
+
+
+def start_local_server(app_module):
+    """Serves the Flask app on an ephemeral port in a daemon thread; returns (base_url, server)."""
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='load-test-server', daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+class SessionClient:
+    """One browser: its own cookie jar, JSON POSTs, per-request latency samples."""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def get(self, path):
+        with self.opener.open(self.base_url + path, timeout=self.timeout) as response:
+            response.read()
+
+    def post_json(self, path, payload):
+        request = urllib.request.Request(self.base_url + path, data=json.dumps(payload).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        with self.opener.open(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def post_stream(self, path, payload):
+        """Returns (seconds to the first SSE event, final payload)."""
+        request = urllib.request.Request(self.base_url + path, data=json.dumps(payload).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        started = time.perf_counter()
+        first_event = None
+        final = {}
+        with self.opener.open(request, timeout=self.timeout) as response:
+            if not response.headers.get('Content-Type', '').startswith('text/event-stream'):
+                return time.perf_counter() - started, json.loads(response.read()) # Busy/error replies are plain JSON
+            for line in response:
+                if not line.startswith(b'data: '):
+                    continue
+                if first_event is None:
+                    first_event = time.perf_counter() - started
+                event = json.loads(line[6:])
+                if event.get('type') == 'done':
+                    final = event
+        return first_event, final
+
+
+class LoadStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.counters = {'sessions': 0, 'requests': 0, 'errors': 0, 'busy': 0, 'not_found': 0}
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.samples.setdefault(name, []).append(seconds * 1000)
+            self.counters['requests'] += name != 'first_event'
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+
+def run_session(client, loan_id, turns, stream, think_seconds, stats):
+    started = time.perf_counter()
+    client.get('/')
+    stats.record('index', time.perf_counter() - started)
+
+    started = time.perf_counter()
+    found = client.post_json('/find_customer', {'loan_id': loan_id})
+    stats.record('find_customer', time.perf_counter() - started)
+    if not found.get('customer_found'):
+        stats.count('not_found')
+        return
+
+    for line in CUSTOMER_LINES[:turns]:
+        if think_seconds:
+            time.sleep(think_seconds)
+        started = time.perf_counter()
+        if stream:
+            first_event, reply = client.post_stream('/chat_stream', {'text': line})
+            if first_event is not None:
+                stats.record('first_event', first_event)
+        else:
+            reply = client.post_json('/chat', {'text': line})
+        stats.record('chat_stream' if stream else 'chat', time.perf_counter() - started)
+        if reply.get('busy'):
+            stats.count('busy')
+    stats.count('sessions')
+
+
+def run(base_url, loan_ids, sessions=100, concurrency=16, turns=6, stream=False, think_ms=0, timeout=60, seed=0):
+    rng = random.Random(seed)
+    stats = LoadStats()
+
+    def one(_):
+        try:
+            run_session(SessionClient(base_url, timeout), rng.choice(loan_ids), turns, stream, think_ms / 1000, stats)
+        except Exception:
+            stats.count('errors')
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(sessions)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'sessions': sessions,
+        'concurrency': concurrency,
+        'turns': turns,
+        'stream': stream,
+        'think_ms': think_ms,
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_s': round(stats.counters['requests'] / elapsed, 2),
+        'sessions_per_s': round(stats.counters['sessions'] / elapsed, 2),
+        'counters': stats.counters,
+        'latency': {name: percentiles(samples) for name, samples in stats.samples.items()},
+    }
+
+
+def run_local(csv_path, latency, **options):
+    """Starts the app in-process against csv_path with the fake model, runs the load, stops the server."""
+    app_module = import_app(fake_latency=latency, csv_path=csv_path)
+    base_url, server = start_local_server(app_module)
+    try:
+        loan_ids = list(app_module.loan_book_snapshot.book.column('Loan ID'))
+        results = run(base_url, loan_ids, **options)
+    finally:
+        server.shutdown()
+    # Report the settings the app actually ran with, not the ones requested.
+    results.update({'rows': len(loan_ids), 'csv': os.path.basename(app_module.csv_file_path),
+                    'fake_latency_s': app_module.model.latency,
+                    'llm_max_concurrency': app_module.LLM_MAX_CONCURRENCY, 'llm_max_queue': app_module.LLM_MAX_QUEUE})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Drive an already running server instead of starting one in-process')
+    parser.add_argument('--csv', default=DEFAULT_CSV, help='Loan book CSV (in-process server, and Loan IDs to query)')
+    parser.add_argument('--rows', type=int, help='Serve a synthetic book of this many rows instead (in-process only)')
+    parser.add_argument('--latency', type=float, default=0.2, help='Fake model latency in seconds (in-process only)')
+    parser.add_argument('--sessions', type=int, default=100, help='Simulated calls to run')
+    parser.add_argument('--concurrency', type=int, default=16, help='Calls in flight at once')
+    parser.add_argument('--turns', type=int, default=6, help=f'Customer lines per call (max {len(CUSTOMER_LINES)})')
+    parser.add_argument('--think-ms', type=float, default=0, help='Pause before each customer line')
+    parser.add_argument('--stream', action='store_true', help='Use /chat_stream and record time to first event')
+    parser.add_argument('--timeout', type=float, default=60, help='Per-request timeout in seconds')
+    parser.add_argument('--json', help='Write a report to this JSON file')
+    args = parser.parse_args()
+    options = dict(sessions=args.sessions, concurrency=args.concurrency, turns=min(args.turns, len(CUSTOMER_LINES)),
+                   stream=args.stream, think_ms=args.think_ms, timeout=args.timeout)
+
+    if args.url:
+        loan_ids = pd.read_csv(args.csv, usecols=['Loan ID'])['Loan ID'].dropna().tolist()
+        results = run(args.url.rstrip('/'), loan_ids, **options)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            csv_path = synthesize_csv(args.csv, args.rows, workdir) if args.rows else args.csv
+            results = run_local(csv_path, args.latency, **options)
+
+    counters = results['counters']
+    print(f"{results['sessions']} sessions x {results['turns']} turns at concurrency {results['concurrency']} in "
+          f"{results['elapsed_s']} s: {results['requests_per_s']} req/s, {counters['errors']} errors, "
+          f"{counters['busy']} busy replies, {counters['not_found']} not found")
+    for name, stats in results['latency'].items():
+        print(f"  {name:<14} p50 {stats['p50_ms']:>9.1f} ms   p90 {stats['p90_ms']:>9.1f} ms   p99 {stats['p99_ms']:>9.1f} ms")
+    if args.json:
+        write_report(args.json, {'load': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Machine-readable benchmark reports and regression comparison.
+
+A report is JSON: {"environment": {...}, "suites": {suite name: nested results}}. Metrics are compared by
+their dotted path; names ending in _ms or _us are latencies (lower is better) and names ending in _per_s or
+_per_min are throughputs (higher is better). Everything else is context and is not compared.
+
+Usage:
+    python benchmarks/report.py old_report.json new_report.json [--threshold 0.10]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+LOWER_IS_BETTER = ('_ms', '_us')
+HIGHER_IS_BETTER = ('_per_s', '_per_min')
+
+
+def percentiles(samples, unit='ms'):
+    """count/mean/p50/p90/p99/max of a list of latency samples (already in `unit`)."""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {
+        'count': len(ordered),
+        f'mean_{unit}': round(sum(ordered) / len(ordered), 3),
+        f'p50_{unit}': pick(0.50),
+        f'p90_{unit}': pick(0.90),
+        f'p99_{unit}': pick(0.99),
+        f'max_{unit}': round(ordered[-1], 3),
+    }
+
+
+def environment():
+    import numpy
+    import pandas
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo, capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'pandas': pandas.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def write_report(path, suites):
+    report = {'environment': environment(), 'suites': suites}
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def _flatten(value, prefix=''):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            yield from _flatten(child, f'{prefix}.{key}' if prefix else key)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, value
+
+
+def compare_reports(old, new, threshold=0.10):
+    """Returns (regressions, improvements): lists of (metric, old, new, relative change)."""
+    old_metrics = dict(_flatten(old.get('suites', {})))
+    regressions, improvements = [], []
+    for metric, new_value in _flatten(new.get('suites', {})):
+        old_value = old_metrics.get(metric)
+        name = metric.rsplit('.', 1)[-1]
+        if not old_value:
+            continue
+        if name.endswith(LOWER_IS_BETTER):
+            change = (new_value - old_value) / old_value
+        elif name.endswith(HIGHER_IS_BETTER):
+            change = (old_value - new_value) / old_value
+        else:
+            continue
+        if change > threshold:
+            regressions.append((metric, old_value, new_value, change))
+        elif change < -threshold:
+            improvements.append((metric, old_value, new_value, change))
+    return regressions, improvements
+
+
+def print_comparison(regressions, improvements):
+    for title, rows in (('Regressions', regressions), ('Improvements', improvements)):
+        print(f"{title} ({len(rows)}):")
+        for metric, old_value, new_value, change in sorted(rows, key=lambda row: -abs(row[3])):
+            print(f"  {metric:<70} {old_value:>12} -> {new_value:<12} ({'worse' if change > 0 else 'better'} by {abs(change):.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Relative change to report (default 0.10)')
+    args = parser.parse_args()
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    regressions, improvements = compare_reports(old, new, args.threshold)
+    print_comparison(regressions, improvements)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Runs the benchmark suites and writes one machine-readable report, optionally compared with a baseline.
+
+Usage:
+    python benchmarks/run_all.py --out bench.json
+    python benchmarks/run_all.py --out bench.json --compare baseline.json    # exit 1 on regressions
+    python benchmarks/run_all.py --quick --out smoke.json                    # small sizes, for CI
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench_micro  # noqa: E402
+import bench_queue  # noqa: E402
+import bench_scaling  # noqa: E402
+import load_test  # noqa: E402
+from report import compare_reports, print_comparison, write_report  # noqa: E402
+from synthetic import DEFAULT_CSV  # noqa: E402
+
+SUITES = ('micro', 'scaling', 'queue', 'load')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', required=True, help='Report JSON to write')
+    parser.add_argument('--csv', default=DEFAULT_CSV, help='Loan book CSV (default: bundled cleaned_data.csv)')
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument('--quick', action='store_true', help='Fewer samples, sizes and sessions')
+    parser.add_argument('--latency', type=float, default=0.2, help='Fake model latency for the load suite')
+    parser.add_argument('--compare', help='Baseline report; exit 1 if any metric regressed past --threshold')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    args = parser.parse_args()
+
+    suites = {}
+    if 'micro' in args.suites:
+        print("Running micro...")
+        suites['micro'] = bench_micro.run(args.csv, samples=300 if args.quick else 2000)
+    if 'scaling' in args.suites:
+        print("Running scaling...")
+        sizes = (1_000, 10_000) if args.quick else bench_scaling.DEFAULT_SIZES
+        suites['scaling'] = bench_scaling.run(args.csv, sizes, samples=200 if args.quick else 500,
+                                              repeat=1 if args.quick else 3)
+    if 'queue' in args.suites:
+        print("Running queue...")
+        suites['queue'] = bench_queue.run(args.csv, rows=100_000 if args.quick else 1_000_000)
+    if 'load' in args.suites:
+        print("Running load...")
+        sessions, concurrency = (30, 8) if args.quick else (200, 32)
+        suites['load'] = {
+            'chat': load_test.run_local(args.csv, args.latency, sessions=sessions, concurrency=concurrency),
+            'chat_stream': load_test.run_local(args.csv, args.latency, sessions=sessions, concurrency=concurrency,
+                                               stream=True),
+        }
+
+    write_report(args.out, suites)
+    print(f"Wrote {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        with open(args.out) as f:
+            current = json.load(f)
+        regressions, improvements = compare_reports(baseline, current, args.threshold)
+        print_comparison(regressions, improvements)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Synthetic loan books with the cleaned_data.csv schema, for benchmarks at sizes beyond the bundled file.
+
+Identifiers are fresh (unique Loan/Customer IDs, phone numbers), names combine first and last names seen in
+the source, and every other column is resampled from the source column, so value distributions and the
+share of missing cells match the real data.
+"""
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cleaned_data.csv')
+
+
+def _uuids(rng, rows):
+    raw = rng.bytes(16 * rows)
+    return [str(uuid.UUID(bytes=raw[i * 16:(i + 1) * 16], version=4)) for i in range(rows)]
+
+
+def synthesize_frame(source_csv, rows, seed=0):
+    source = pd.read_csv(source_csv)
+    rng = np.random.default_rng(seed)
+    data = {}
+    for col in source.columns:
+        if col in ('Loan ID', 'Customer ID'):
+            data[col] = _uuids(rng, rows)
+        elif col == 'Random_Name':
+            parts = source[col].dropna().str.split(' ', n=1)
+            first_names = np.array(sorted({p[0] for p in parts}))
+            last_names = np.array(sorted({p[1] for p in parts if len(p) > 1}))
+            data[col] = np.char.add(np.char.add(rng.choice(first_names, rows), ' '), rng.choice(last_names, rows))
+        elif col == 'Random_Phone_Number':
+            digits = rng.integers(0, 10 ** 10, size=rows, dtype=np.int64)
+            data[col] = [f'{d // 10 ** 7:03d}-{d // 10 ** 4 % 1000:03d}-{d % 10 ** 4:04d}' for d in digits]
+        else:
+            data[col] = rng.choice(source[col].to_numpy(), size=rows)
+    return pd.DataFrame(data, columns=source.columns)
+
+
+def synthesize_csv(source_csv, rows, directory, seed=0):
+    """Writes a synthetic CSV with `rows` rows and returns its path."""
+    path = os.path.join(directory, f'synthetic_{rows}.csv')
+    synthesize_frame(source_csv, rows, seed=seed).to_csv(path, index=False)
+    return path
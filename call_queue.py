@@ -0,0 +1,347 @@
+import heapq
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# --- Portfolio prioritization and the ranked call queue ---
+# score_loan_book() scores every loan with whole-column NumPy operations: an estimated recovery probability
+# (credit score, debt-to-income, bankruptcies, tax liens, recent delinquency) times the balance at stake,
+# boosted for recent delinquencies that need attention before they roll further.
+#
+# CallQueue keeps the book ranked by that priority (adjusted by the outcomes of calls made so far) as a
+# sorted order array. Logged call outcomes and loan book deltas only move the affected rows: they are
+# removed from and re-inserted into the sorted arrays at binary-searched indices, so the queue stays
+# fresh without a full re-sort. Full reloads (row positions may change) re-rank everything with one argsort.
+# Loans under a cooldown (in a call, no answer, promise to pay, ...) sink below every callable loan until
+# the cooldown expires; the queue's pages only list callable loans. A loan's current rank is found by
+# binary search on its key, so no per-row rank array has to be rewritten when loans move.
+#
+# Call state is kept per process, keyed by Loan ID, so it survives loan book reloads.
+
+BALANCE_SENTINEL = 99999999  # Placeholder balance in the source data; scored as the median known balance
+CREDIT_SCORE_RANGE = (300.0, 850.0)  # Scores above the range were recorded x10 and are scaled down
+DTI_LIMIT = 0.6  # Monthly debt / monthly income at which affordability reaches zero
+RECENT_DELINQUENCY_MONTHS = 12
+
+SCORE_WEIGHTS = {
+    'base': 0.10,
+    'credit': 0.45,
+    'affordability': 0.30,
+    'bankruptcies': -0.15,
+    'tax_liens': -0.10,
+    'recent_delinquency': -0.10,
+}
+RECENT_DELINQUENCY_URGENCY = 0.5  # Priority boost for a delinquency within RECENT_DELINQUENCY_MONTHS
+PROBABILITY_BOUNDS = (0.02, 0.95)
+
+HOUR = 3600
+DAY = 24 * HOUR
+# outcome -> (cooldown in seconds, None = never call again; multiplier applied to the loan's priority)
+CALL_OUTCOMES = {
+    'in_call': (15 * 60, 1.0),
+    'no_answer': (4 * HOUR, 0.9),
+    'voicemail': (4 * HOUR, 0.9),
+    'callback': (DAY, 1.0),
+    'refused': (DAY, 0.7),
+    'promise_to_pay': (3 * DAY, 0.5),
+    'disputed': (7 * DAY, 0.3),
+    'wrong_number': (30 * DAY, 0.2),
+    'paid': (None, 0.0),
+}
+
+REBUILD_FRACTION = 0.05  # Re-sort everything when more than this share of the rows changed at once
+
+
+def _numeric(values, dtype=np.float32):
+    values = np.asarray(values)
+    if values.dtype.kind in 'fiu':
+        return values.astype(dtype)
+    return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=dtype)
+
+
+def _known_balances(balance):
+    return (balance > 0) & (balance < BALANCE_SENTINEL)
+
+
+def median_balance(book):
+    """Median of the known balances in `book`, used as the balance of loans that only have the sentinel."""
+    balance = _numeric(book.column('Current Loan Amount'), np.float64)
+    known = _known_balances(balance)
+    return float(np.median(balance[known])) if known.any() else 0.0
+
+
+def score_loan_book(book, unknown_balance=None):
+    """(priority, recovery_probability) arrays over every row of `book` (a FrameLoanBook or CompactLoanBook).
+    `unknown_balance` defaults to median_balance(book).
+
+    Factors are computed in float32 and in place, since the pass is bound by memory traffic on large books;
+    only the balance and the priority itself are float64."""
+    balance = _numeric(book.column('Current Loan Amount'), np.float64)
+    known = _known_balances(balance)
+    if unknown_balance is None:
+        unknown_balance = float(np.median(balance[known])) if known.any() else 0.0
+    balance[~known] = unknown_balance
+
+    credit = _numeric(book.column('Credit Score'))
+    with np.errstate(invalid='ignore'):
+        scaled = credit > CREDIT_SCORE_RANGE[1]
+    credit[scaled] /= 10
+    credit -= CREDIT_SCORE_RANGE[0]
+    credit /= CREDIT_SCORE_RANGE[1] - CREDIT_SCORE_RANGE[0]
+    np.clip(credit, 0, 1, out=credit)
+    credit[np.isnan(credit)] = 0.5  # 'Unknown Score'
+    probability = credit
+    probability *= SCORE_WEIGHTS['credit']
+    probability += SCORE_WEIGHTS['base']
+
+    income = _numeric(book.column('Annual Income'))
+    affordability = _numeric(book.column('Monthly Debt'))
+    affordability *= 12 / DTI_LIMIT
+    with np.errstate(divide='ignore', invalid='ignore'):
+        affordability /= income
+    np.subtract(1, affordability, out=affordability)
+    np.clip(affordability, 0, 1, out=affordability)
+    affordability[~(income > 0)] = 0.5  # Missing income is stored as 0
+    affordability *= SCORE_WEIGHTS['affordability']
+    probability += affordability
+
+    for column, weight in (('Bankruptcies', SCORE_WEIGHTS['bankruptcies']), ('Tax Liens', SCORE_WEIGHTS['tax_liens'])):
+        counts = np.nan_to_num(_numeric(book.column(column)), copy=False)
+        np.clip(counts, 0, 2, out=counts)
+        counts *= weight / 2
+        probability += counts
+
+    months = _numeric(book.column('Months since last delinquent'))  # 0 = never delinquent or unknown
+    recent = (months > 0) & (months <= RECENT_DELINQUENCY_MONTHS)
+    probability[recent] += SCORE_WEIGHTS['recent_delinquency']
+    np.clip(probability, *PROBABILITY_BOUNDS, out=probability)
+
+    priority = balance
+    priority *= probability
+    priority[recent] *= 1 + RECENT_DELINQUENCY_URGENCY
+    return np.nan_to_num(priority, copy=False), probability
+
+
+class CallQueue:
+    """Loans ranked by priority for outbound calls; see the module comment."""
+
+    def __init__(self, snapshot, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._call_state = {}  # Loan ID -> {'calls', 'multiplier', 'suppressed_until', 'last_outcome', 'last_called_at'}
+        self._expiry = []  # Heap of (suppressed_until, loan_id) for cooldowns that end
+        self.full_ranks = 0
+        self.incremental_updates = 0
+        self.last_rank_ms = None
+        self.rebuild(snapshot)
+
+    # --- Ranking ---
+    # _keys holds each row's current key (priority x outcome multiplier, -inf while cooling down).
+    # _order lists row positions by descending key and _sorted the matching negated keys (ascending).
+
+    def _key(self, position, state):
+        if state is not None and (state['suppressed_until'] is None or state['suppressed_until'] > self._clock()):
+            return -np.inf
+        multiplier = state['multiplier'] if state is not None else 1.0
+        return self._priority[position] * multiplier
+
+    def _rank_all(self):
+        self._order = np.argsort(-self._keys)
+        self._sorted = -self._keys[self._order]
+        self.full_ranks += 1
+
+    def _locate(self, positions):
+        """Indices of ranked rows in _order, found by binary search on their current keys."""
+        keys = -self._keys[positions]
+        lo = np.searchsorted(self._sorted, keys, side='left')
+        hi = np.searchsorted(self._sorted, keys, side='right')
+        for i in np.flatnonzero(hi - lo > 1):  # Equal keys: find the row among them
+            lo[i] += int(np.flatnonzero(self._order[lo[i]:hi[i]] == positions[i])[0])
+        return lo
+
+    def _move(self, position, key):
+        """Re-ranks one row in place, shifting only the rows between its old and new rank."""
+        i = int(self._locate(np.array([position]))[0])
+        new = -key
+        j = int(np.searchsorted(self._sorted, new, side='right'))
+        if j > i:
+            j -= 1
+            self._sorted[i:j] = self._sorted[i + 1:j + 1]
+            self._order[i:j] = self._order[i + 1:j + 1]
+        else:
+            self._sorted[j + 1:i + 1] = self._sorted[j:i]
+            self._order[j + 1:i + 1] = self._order[j:i]
+        self._sorted[j] = new
+        self._order[j] = position
+        self._keys[position] = key
+        self.incremental_updates += 1
+
+    def _update(self, positions, keys):
+        """Gives `positions` (unique; ranked rows, or rows just appended to _keys) new keys and moves them."""
+        positions = np.asarray(positions, dtype=np.int64)
+        keys = np.asarray(keys, dtype=np.float64)
+        if len(positions) == 0:
+            return
+        ranked = len(self._order)
+        if len(positions) > REBUILD_FRACTION * ranked:
+            self._keys[positions] = keys
+            self._rank_all()
+        elif len(positions) == 1 and positions[0] < ranked:
+            self._move(int(positions[0]), float(keys[0]))
+        else:
+            self.incremental_updates += 1
+            removed = self._locate(positions[positions < ranked])
+            order = np.delete(self._order, removed)
+            sorted_keys = np.delete(self._sorted, removed)
+            self._keys[positions] = keys
+            by_key = np.lexsort((positions, -keys))
+            at = np.searchsorted(sorted_keys, -keys[by_key], side='right')
+            self._order = np.insert(order, at, positions[by_key])
+            self._sorted = np.insert(sorted_keys, at, -keys[by_key])
+
+    def rebuild(self, snapshot):
+        """Scores and ranks `snapshot` from scratch (call state is carried over by Loan ID)."""
+        started = time.perf_counter()
+        unknown_balance = median_balance(snapshot.book)
+        priority, probability = score_loan_book(snapshot.book, unknown_balance)
+        with self._lock:
+            self._unknown_balance = unknown_balance
+            self._snapshot = snapshot
+            self._priority = priority
+            self._probability = probability
+            self._keys = priority.copy()
+            for loan_id, state in self._call_state.items():
+                position = snapshot.position_for(loan_id)
+                if position is not None:
+                    self._keys[position] = self._key(position, state)
+            self._rank_all()
+            self.last_rank_ms = round((time.perf_counter() - started) * 1000, 2)
+        logging.info("Call queue ranked %s loans (version %s) in %s ms.", len(priority), snapshot.version, self.last_rank_ms)
+
+    def update_snapshot(self, previous, snapshot):
+        """Follows a loan book swap: after a delta only the rows it changed or appended move; a full reload
+        (row positions may differ) re-ranks everything."""
+        if getattr(snapshot, 'parent_version', None) != self._snapshot.version:
+            self.rebuild(snapshot)
+            return
+        started = time.perf_counter()
+        # Keep the median from the last full rank, so a delta does not move every loan with an unknown balance
+        priority, probability = score_loan_book(snapshot.book, self._unknown_balance)
+        with self._lock:
+            ranked = len(self._priority)
+            with_calls = {}
+            for loan_id, state in self._call_state.items():
+                position = snapshot.position_for(loan_id)
+                if position is not None:
+                    with_calls[position] = state
+            changed = np.flatnonzero(priority[:ranked] != self._priority)
+            moved = np.unique(np.concatenate([changed, np.arange(ranked, len(priority)),
+                                              np.fromiter(with_calls, dtype=np.int64, count=len(with_calls))]))
+            self._snapshot = snapshot
+            self._priority = priority
+            self._probability = probability
+            self._keys = np.concatenate([self._keys, np.zeros(len(priority) - ranked)])
+            keys = priority[moved]
+            for i, position in enumerate(moved):
+                if position in with_calls:
+                    keys[i] = self._key(position, with_calls[position])
+            self._update(moved, keys)
+            self.last_rank_ms = round((time.perf_counter() - started) * 1000, 2)
+        logging.info("Call queue updated for version %s: %s changed, %s appended in %s ms.", snapshot.version, len(changed), len(priority) - ranked, self.last_rank_ms)
+
+    def _release_expired(self):
+        now = self._clock()
+        while self._expiry and self._expiry[0][0] <= now:
+            until, loan_id = heapq.heappop(self._expiry)
+            state = self._call_state.get(loan_id)
+            position = self._snapshot.position_for(loan_id)
+            if state is None or state['suppressed_until'] != until or position is None:
+                continue  # Superseded by a later outcome, or no longer in the book
+            self._move(position, self._key(position, state))
+
+    # --- Call outcomes ---
+
+    def record_outcome(self, loan_id, outcome, until=None):
+        """Logs a call outcome for loan_id; `until` (epoch seconds) overrides the outcome's cooldown.
+        Returns the loan's queue entry, or None if the loan is not in the book."""
+        cooldown, multiplier = CALL_OUTCOMES[outcome]
+        with self._lock:
+            position = self._snapshot.position_for(loan_id)
+            if position is None:
+                return None
+            now = self._clock()
+            state = self._call_state.setdefault(loan_id, {'calls': 0, 'multiplier': 1.0, 'suppressed_until': 0.0,
+                                                          'last_outcome': None, 'last_called_at': None})
+            if outcome != 'in_call':
+                state['calls'] += 1
+                state['multiplier'] *= multiplier
+                state['last_outcome'] = outcome
+                state['last_called_at'] = now
+            state['suppressed_until'] = until if until is not None else (None if cooldown is None else now + cooldown)
+            if state['suppressed_until'] is not None:
+                heapq.heappush(self._expiry, (state['suppressed_until'], loan_id))
+            self._move(position, self._key(position, state))
+            self._release_expired()
+            return self._entry(position)
+
+    # --- Reading the queue ---
+
+    def _callable_count(self):
+        return int(np.searchsorted(self._sorted, np.inf, side='left'))
+
+    def _entry(self, position, rank=None):
+        book = self._snapshot.book
+        loan_id = book.value(position, 'Loan ID')
+        state = self._call_state.get(loan_id) or {}
+        callable_now = bool(np.isfinite(self._keys[position]))
+        if rank is None and callable_now:
+            rank = int(self._locate(np.array([position]))[0]) + 1
+        return {
+            'rank': rank if callable_now else None,
+            'loan_id': loan_id,
+            'customer_name': book.value(position, 'Random_Name'),
+            'phone': book.value(position, 'Random_Phone_Number'),
+            'overdue_amount': book.value(position, 'Current Loan Amount'),
+            'priority_score': round(float(self._keys[position]), 2) if callable_now else None,
+            'recovery_probability': round(float(self._probability[position]), 4),
+            'calls': state.get('calls', 0),
+            'last_outcome': state.get('last_outcome'),
+            'callable_after': state.get('suppressed_until') if not callable_now else None,
+        }
+
+    def page(self, page=1, per_page=50):
+        with self._lock:
+            self._release_expired()
+            callable_count = self._callable_count()
+            start = (page - 1) * per_page
+            positions = self._order[start:min(start + per_page, callable_count)]
+            return {
+                'version': self._snapshot.version,
+                'page': page,
+                'per_page': per_page,
+                'total': callable_count,
+                'pages': -(-callable_count // per_page),
+                'items': [self._entry(int(position), rank=start + i + 1) for i, position in enumerate(positions)],
+            }
+
+    def entry(self, loan_id):
+        with self._lock:
+            self._release_expired()
+            position = self._snapshot.position_for(loan_id)
+            return self._entry(position) if position is not None else None
+
+    def stats(self):
+        with self._lock:
+            callable_count = self._callable_count()
+            return {
+                'loans': len(self._keys),
+                'callable': callable_count,
+                'cooling_down': len(self._keys) - callable_count,
+                'loans_with_calls': len(self._call_state),
+                'full_ranks': self.full_ranks,
+                'incremental_updates': self.incremental_updates,
+                'last_rank_ms': self.last_rank_ms,
+            }
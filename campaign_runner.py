@@ -0,0 +1,346 @@
+"""Offline batch campaign runner: scripted or simulated debtor personas against the live prompt pipeline.
+
+Every conversation uses the app's own prompt assembly (core_system_instruction + the customer dossier from
+format_customer_data_for_prompt, with the same history compaction), so a run measures exactly what /chat
+would send. Transcripts stream to a JSONL file, one conversation per line; that file is also the checkpoint,
+so an interrupted run continues with --resume. A summary (outcome rates, overall and per persona) is written
+next to it.
+
+Usage:
+    python campaign_runner.py --out runs/campaign.jsonl                           # every loan, mixed personas, fake model
+    python campaign_runner.py --out runs/hardship.jsonl --persona hardship --limit 500 --workers 16
+    python campaign_runner.py --out runs/campaign.jsonl --resume                  # continue an interrupted run
+    python campaign_runner.py --out runs/picked.jsonl --requests campaign_requests.jsonl
+    python campaign_runner.py --out runs/gemini.jsonl --backend gemini --rate 2 --workers 4
+    python campaign_runner.py --out runs/new_prompt.jsonl --baseline runs/campaign.summary.json
+
+A --requests file has one JSON object per line: {"request_id": ..., "loan_id": ..., "persona": ...}, where
+request_id and persona are optional and "script" (a list of customer lines) may replace the persona.
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+from rate_limit import TokenBucket
+
+# --- Debtor personas ---
+# A persona opens the call, then answers each agent reply with the first rule whose pattern matches it,
+# falling back to its scripted lines in order. Everything is deterministic, so reruns are comparable.
+
+
+class Persona:
+    def __init__(self, name, opening, lines, rules=()):
+        self.name = name
+        self.opening = opening
+        self.lines = list(lines)
+        self.rules = [(re.compile(pattern, re.IGNORECASE), reply) for pattern, reply in rules]
+
+    def reply(self, turn_number, agent_text, used_rules):
+        """Customer line for turn_number (0 = opening); each rule is used at most once per conversation."""
+        if turn_number == 0:
+            return self.opening
+        for i, (pattern, reply) in enumerate(self.rules):
+            if i not in used_rules and pattern.search(agent_text or ''):
+                used_rules.add(i)
+                return reply
+        return self.lines[(turn_number - 1) % len(self.lines)] if self.lines else None
+
+
+PERSONAS = {
+    'cooperative': Persona('cooperative', "Hello?",
+                           ["Yes, I can pay $500 today.", "By debit card is fine.", "Okay, that works for me."],
+                           rules=[(r'\bwhen\b|date', "I can pay it this Friday."),
+                                  (r'how much|amount|feasible', "I can pay $500 today."),
+                                  (r'method|how will|card|cheque|check', "I'll pay by debit card.")]),
+    'hardship': Persona('hardship', "Hi, who is this?",
+                        ["I lost my job last month and I can't pay right now.", "Maybe a small payment.",
+                         "Maybe $50 next Friday.", "I'd send it by bank transfer."],
+                        rules=[(r'how much|amount|feasible', "Maybe $50 next Friday.")]),
+    'refuses': Persona('refuses', "Hello.",
+                       ["I'm not paying anything.", "Stop calling me.", "Fine, what are my options?", "I'll think about it."]),
+    'disputes': Persona('disputes', "Yes?",
+                        ["I don't think I owe that much.", "Can you send me the details in writing?",
+                         "Okay, I'll pay $200 by cheque next week."]),
+    'silent': Persona('silent', "hello", ["...", "I don't know.", "okay"]),
+}
+
+
+def persona_for(loan_id, name):
+    """'mix' spreads personas over loans by a stable hash of the Loan ID."""
+    if name != 'mix':
+        return PERSONAS[name]
+    names = sorted(PERSONAS)
+    return PERSONAS[names[int(hashlib.md5(str(loan_id).encode('utf-8')).hexdigest(), 16) % len(names)]]
+
+
+# --- Outcome scoring ---
+COMMITMENT_PATTERN = re.compile(r'\$\s?[\d,]+(?:\.\d+)?')
+BLOCKED_OR_EMPTY_PREFIXES = ("I'm sorry, I cannot respond to that query", "I'm sorry, I couldn't generate a clear response")
+
+
+def score_conversation(turns, overdue_amount_text, fallback_turns):
+    agent_turns = [t['text'] for t in turns if t['role'] == 'agent']
+    customer_turns = [t['text'] for t in turns if t['role'] == 'customer']
+    amount_variants = {overdue_amount_text, overdue_amount_text.replace('.00', '')}
+    promised = [m.group(0).replace(' ', '') for text in customer_turns for m in COMMITMENT_PATTERN.finditer(text)]
+    return {
+        'stated_amount_first_turn': bool(agent_turns) and any(a in agent_turns[0] for a in amount_variants),
+        'repeated_introduction': any('Apex Financial' in text for text in agent_turns[1:]),
+        'customer_offered_payment': bool(promised),
+        'agent_confirmed_payment': any(p in text.replace(' ', '') for p in promised for text in agent_turns),
+        'fallback_turns': fallback_turns,
+        'blocked_or_empty_turns': sum(1 for text in agent_turns if text.startswith(BLOCKED_OR_EMPTY_PREFIXES)),
+        'agent_turns': len(agent_turns),
+        'mean_agent_chars': round(sum(map(len, agent_turns)) / len(agent_turns), 1) if agent_turns else 0.0,
+    }
+
+
+# --- Per-process campaign context ---
+# Imports the Flask app module (for its prompt pipeline, model and loan book) once per process. In process
+# mode each worker builds its own context in the pool initializer, with its share of the rate limit.
+_context = None
+
+
+class CampaignContext:
+    def __init__(self, settings, rate):
+        os.environ['LLM_BACKEND'] = settings['backend']
+        os.environ.setdefault('FAKE_LLM_LATENCY_SECONDS', str(settings['fake_latency']))
+        os.environ.setdefault('LOAN_BOOK_RELOAD_SECONDS', '0') # A run scores one snapshot of the loan book
+        os.environ.setdefault('TRANSCRIPT_STORE', 'off') # Simulated calls are recorded in the run's own output
+        import app as loan_app
+        if not settings['verbose']:
+            logging.getLogger().setLevel(logging.WARNING)
+        if loan_app.model is None:
+            raise RuntimeError("No model available (check GEMINI_API_KEY or use --backend fake).")
+        if loan_app.loan_book_snapshot is None:
+            raise RuntimeError("Loan book could not be loaded.")
+        self.app = loan_app
+        self.snapshot = loan_app.loan_book_snapshot
+        self.bucket = TokenBucket(rate, capacity=settings['burst'] or None)
+        self.max_turns = settings['max_turns']
+        self.prompt_version = hashlib.sha256(loan_app.core_system_instruction.encode('utf-8')).hexdigest()[:12]
+
+
+def _init_worker(settings, rate):
+    global _context
+    _context = CampaignContext(settings, rate)
+
+
+def run_conversation(job):
+    """Runs one scripted conversation; returns the transcript record written to the JSONL output."""
+    ctx = _context
+    loan_app = ctx.app
+    started = time.perf_counter()
+    position = ctx.snapshot.position_for(job['loan_id'])
+    if position is None:
+        return {'request_id': job['request_id'], 'loan_id': job['loan_id'], 'error': 'loan_id not found'}
+
+    customer_name = ctx.snapshot.book.value(position, 'Random_Name')
+    overdue_amount_text = f"${ctx.snapshot.book.value(position, 'Current Loan Amount'):,.2f}"
+    prompt_prefix = loan_app.build_prompt_prefix(loan_app.get_customer_dossier(ctx.snapshot, position))
+    conversation = loan_app.new_conversation(job['loan_id'], customer_name)
+    script = job.get('script')
+    persona = None if script else persona_for(job['loan_id'], job['persona'])
+
+    turns = []
+    used_rules = set()
+    fallback_turns = 0
+    agent_text = ''
+    for turn_number in range(ctx.max_turns):
+        if script:
+            customer_text = script[turn_number] if turn_number < len(script) else None
+        else:
+            customer_text = persona.reply(turn_number, agent_text, used_rules)
+        if not customer_text:
+            break
+
+        loan_app.compact_history(conversation, token_budget=loan_app.HISTORY_TOKEN_BUDGET,
+                                 min_recent_turns=loan_app.HISTORY_MIN_RECENT_TURNS,
+                                 summary_token_budget=loan_app.HISTORY_SUMMARY_TOKEN_BUDGET)
+        contents = loan_app.assemble_model_history(conversation, prompt_prefix)
+        contents.append({'role': 'user', 'parts': [customer_text]})
+        conversation['history'].append({'role': 'user', 'parts': [customer_text]})
+        turns.append({'role': 'customer', 'text': customer_text})
+
+        ctx.bucket.acquire()
+        try:
+            agent_text = loan_app.extract_assistant_text(loan_app.model.generate_content(contents), job['request_id'])
+        except Exception as e:
+            logging.warning("Campaign %s: model call failed (%s); using fallback reply.", job['request_id'], e)
+            agent_text = loan_app.build_fallback_message(job['loan_id'], job['request_id'])
+            fallback_turns += 1
+        conversation['history'].append({'role': 'model', 'parts': [agent_text]})
+        turns.append({'role': 'agent', 'text': agent_text})
+
+    return {
+        'request_id': job['request_id'],
+        'loan_id': job['loan_id'],
+        'customer_name': customer_name,
+        'persona': 'script' if script else persona.name,
+        'prompt_version': ctx.prompt_version,
+        'loan_book_version': ctx.snapshot.version,
+        'turns': turns,
+        'outcome': score_conversation(turns, overdue_amount_text, fallback_turns),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+# --- Jobs, checkpoints and output ---
+
+def build_jobs(args, snapshot):
+    if args.requests:
+        with open(args.requests) as f:
+            for line in f:
+                if line.strip():
+                    job = json.loads(line)
+                    job.setdefault('persona', args.persona)
+                    job.setdefault('request_id', f"{job['loan_id']}:{'script' if job.get('script') else job['persona']}")
+                    yield job
+        return
+    count = len(snapshot.book) if args.limit is None else min(args.limit, len(snapshot.book))
+    for position in range(count):
+        loan_id = snapshot.book.value(position, 'Loan ID')
+        yield {'request_id': f'{loan_id}:{args.persona}', 'loan_id': loan_id, 'persona': args.persona}
+
+
+def completed_request_ids(out_path):
+    """request_ids already in out_path; a partial last line from an interrupted run is truncated away."""
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    good_offset = 0
+    with open(out_path, 'rb') as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)['request_id'])
+            except (ValueError, KeyError):
+                break
+            good_offset += len(line)
+    if good_offset != os.path.getsize(out_path):
+        logging.warning("Truncating incomplete record at the end of '%s'.", out_path)
+        with open(out_path, 'rb+') as f:
+            f.truncate(good_offset)
+    return done
+
+
+def summarize(out_path):
+    rate_keys = ('stated_amount_first_turn', 'repeated_introduction', 'customer_offered_payment', 'agent_confirmed_payment')
+
+    def aggregate(records):
+        outcomes = [r['outcome'] for r in records]
+        total = len(outcomes)
+        summary = {'conversations': total}
+        for key in rate_keys:
+            summary[f'{key}_rate'] = round(sum(1 for o in outcomes if o[key]) / total, 4) if total else 0.0
+        for key in ('fallback_turns', 'blocked_or_empty_turns', 'agent_turns'):
+            summary[key] = sum(o[key] for o in outcomes)
+        summary['mean_agent_chars'] = round(sum(o['mean_agent_chars'] for o in outcomes) / total, 1) if total else 0.0
+        return summary
+
+    records, errors = [], 0
+    with open(out_path) as f:
+        for line in f:
+            record = json.loads(line)
+            if 'outcome' in record:
+                records.append(record)
+            else:
+                errors += 1
+    summary = aggregate(records)
+    summary['errors'] = errors
+    summary['prompt_versions'] = sorted({r['prompt_version'] for r in records})
+    summary['by_persona'] = {persona: aggregate([r for r in records if r['persona'] == persona])
+                             for persona in sorted({r['persona'] for r in records})}
+    return summary
+
+
+def print_comparison(summary, baseline):
+    print("Change vs baseline:")
+    for key, value in summary.items():
+        if isinstance(value, (int, float)) and isinstance(baseline.get(key), (int, float)):
+            print(f"  {key:<34} {baseline[key]:>10} -> {value:<10} ({value - baseline[key]:+.4g})")
+
+
+def run_campaign(args):
+    settings = {'backend': args.backend, 'fake_latency': args.fake_latency, 'max_turns': args.max_turns,
+                'burst': args.burst, 'verbose': args.verbose}
+    _init_worker(settings, args.rate) # Main-process context: builds the job list (and runs thread mode)
+    done = completed_request_ids(args.out) if args.resume else set()
+    if not args.resume and os.path.exists(args.out) and os.path.getsize(args.out):
+        sys.exit(f"'{args.out}' already exists; pass --resume to continue it or choose another --out.")
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+
+    if args.executor == 'process':
+        # Each process limits itself to its share of the overall rate.
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=args.workers, initializer=_init_worker,
+            initargs=(settings, args.rate / args.workers if args.rate > 0 else 0))
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='campaign')
+
+    started = time.perf_counter()
+    written = skipped = 0
+    window = args.workers * 4 # Bounded number of submitted jobs, so huge portfolios don't queue up in memory
+    with executor, open(args.out, 'a') as out:
+        def write_finished(futures):
+            nonlocal written
+            for future in futures:
+                out.write(json.dumps(future.result()) + '\n')
+                written += 1
+            out.flush()
+            if written and written % args.progress_every < len(futures):
+                rate = written / (time.perf_counter() - started) * 60
+                logging.warning("Campaign progress: %s conversations written (%.0f/min).", written, rate)
+
+        in_flight = set()
+        for job in build_jobs(args, _context.snapshot):
+            if job['request_id'] in done:
+                skipped += 1
+                continue
+            if len(in_flight) >= window:
+                finished, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                write_finished(finished)
+            in_flight.add(executor.submit(run_conversation, job))
+        write_finished(concurrent.futures.wait(in_flight).done)
+
+    elapsed = time.perf_counter() - started
+    summary = summarize(args.out)
+    summary_path = os.path.splitext(args.out)[0] + '.summary.json'
+    with open(summary_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"Wrote {written} conversations ({skipped} already done) to '{args.out}' in {elapsed:.1f}s "
+          f"({written / elapsed * 60 if elapsed else 0:,.0f}/min); summary in '{summary_path}'.")
+    print(json.dumps({k: v for k, v in summary.items() if k != 'by_persona'}, indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            print_comparison(summary, json.load(f))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', required=True, help='Transcript JSONL to write (also the resume checkpoint)')
+    parser.add_argument('--requests', help='JSONL of conversations to run instead of the whole loan book')
+    parser.add_argument('--persona', default='mix', choices=['mix'] + sorted(PERSONAS), help='Debtor persona (default: mix)')
+    parser.add_argument('--limit', type=int, help='Only the first N loans of the book')
+    parser.add_argument('--max-turns', type=int, default=6, help='Customer turns per conversation')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent conversations')
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread',
+                        help='thread for network-bound models, process for CPU-bound local runs')
+    parser.add_argument('--rate', type=float, default=0.0, help='Max model calls per second across all workers (0 = unlimited)')
+    parser.add_argument('--burst', type=float, default=0.0, help='Token bucket capacity (default: one second of --rate)')
+    parser.add_argument('--backend', choices=['fake', 'gemini'], default='fake', help='Model backend (default: local fake model)')
+    parser.add_argument('--fake-latency', type=float, default=0.0, help='Simulated seconds per fake model call')
+    parser.add_argument('--resume', action='store_true', help='Skip request_ids already present in --out')
+    parser.add_argument('--baseline', help='Earlier .summary.json to compare outcome rates against')
+    parser.add_argument('--progress-every', type=int, default=1000, help='Log progress every N conversations')
+    parser.add_argument('--verbose', action='store_true', help="Keep the app's per-turn INFO logging")
+    run_campaign(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# --- Server-side conversation state ---
+# The Flask session cookie only carries an opaque key (session['session_id']); everything else about a
+# call lives here: the located customer, the recent dialogue turns and the running summary of older turns.
+#
+# A conversation is a plain JSON-serializable dict:
+#   {'loan_id': str, 'customer_name': str, 'history': [{'role': ..., 'parts': [...]}, ...],
+#    'summary': str, 'summarized_turns': int}
+#
+# Two interchangeable backends:
+#   * MemoryConversationStore  - per-process LRU with TTL eviction (single-process / dev servers)
+#   * SQLiteConversationStore  - shared file for multi-process deployments (e.g. several Gunicorn workers)
+
+
+def new_conversation(loan_id, customer_name):
+    return {
+        'loan_id': loan_id, # Stable across loan book reloads, unlike a row position
+        'customer_name': customer_name,
+        'history': [],
+        'summary': '',
+        'summarized_turns': 0,
+    }
+
+
+class MemoryConversationStore:
+    """In-process LRU of conversations; entries idle longer than ttl_seconds are evicted."""
+
+    def __init__(self, max_entries=10000, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (last_access, conversation)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            last_access, conversation = entry
+            if time.monotonic() - last_access > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries[key] = (time.monotonic(), conversation)
+            self._entries.move_to_end(key)
+            # Hand out a copy so callers can't mutate stored state without an explicit put().
+            return json.loads(json.dumps(conversation))
+
+    def put(self, key, conversation):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), json.loads(json.dumps(conversation)))
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self):
+        now = time.monotonic()
+        # Oldest entries are at the front: drop expired ones, then trim to capacity.
+        while self._entries:
+            key, (last_access, _) = next(iter(self._entries.items()))
+            if now - last_access <= self.ttl_seconds and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+
+class SQLiteConversationStore:
+    """Conversations in a SQLite file shared by all worker processes on the host."""
+
+    PURGE_INTERVAL_SECONDS = 60
+
+    def __init__(self, path, ttl_seconds=3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._last_purge = 0.0
+        with self._connection() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS conversations ('
+                         'key TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at)')
+
+    def _connection(self):
+        # One connection per thread; sqlite3 connections must not be shared across threads.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT data, updated_at FROM conversations WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if time.time() - row[1] > self.ttl_seconds:
+            self.delete(key)
+            return None
+        return json.loads(row[0])
+
+    def put(self, key, conversation):
+        now = time.time()
+        self._connection().execute(
+            'INSERT INTO conversations (key, data, updated_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at',
+            (key, json.dumps(conversation), now))
+        if now - self._last_purge > self.PURGE_INTERVAL_SECONDS:
+            self._last_purge = now
+            self._connection().execute('DELETE FROM conversations WHERE updated_at < ?', (now - self.ttl_seconds,))
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM conversations WHERE key = ?', (key,))
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM conversations').fetchone()[0]
+
+
+def create_conversation_store():
+    """Builds the store selected by CONVERSATION_STORE ('memory' or 'sqlite')."""
+    backend = os.getenv('CONVERSATION_STORE', 'memory').lower()
+    ttl_seconds = float(os.getenv('CONVERSATION_TTL_SECONDS', '3600'))
+    if backend == 'sqlite':
+        return SQLiteConversationStore(os.getenv('CONVERSATION_DB_PATH', 'conversations.sqlite3'), ttl_seconds=ttl_seconds)
+    if backend != 'memory':
+        raise ValueError(f"Unknown CONVERSATION_STORE backend '{backend}' (expected 'memory' or 'sqlite').")
+    return MemoryConversationStore(max_entries=int(os.getenv('CONVERSATION_MAX_ENTRIES', '10000')), ttl_seconds=ttl_seconds)
@@ -0,0 +1,342 @@
+import difflib
+import os
+import re
+import shutil
+import tempfile
+from collections import defaultdict
+
+import numpy as np
+
+# --- In-memory customer lookup index ---
+# Built once when the loan book is loaded so that /find_customer never has to scan
+# (or lowercase) the whole DataFrame per request.
+#
+#   * exact names      -> sorted array of normalized names (UTF-8 bytes) + aligned row positions,
+#                         searched with np.searchsorted
+#   * name prefixes    -> the same sorted array: all keys with a prefix form one contiguous run
+#   * typo tolerance   -> trigram inverted index (CSR arrays) to shortlist names, ranked by similarity
+#   * identifiers      -> sorted key arrays for Loan ID, Customer ID and phone number (digits only)
+
+UUID_PATTERN = re.compile(r'^[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}$')
+PHONE_PATTERN = re.compile(r'^[\d\s().+-]+$')
+
+MIN_PREFIX_LENGTH = 3
+MIN_FUZZY_SCORE = 0.75
+DEFAULT_CANDIDATE_LIMIT = 5
+
+INDEX_ARRAYS = ('name_keys', 'name_positions', 'fuzzy_keys', 'gram_keys', 'gram_offsets', 'gram_postings',
+                'loan_id_keys', 'loan_id_positions', 'customer_id_keys', 'customer_id_positions',
+                'phone_keys', 'phone_positions')
+
+
+def normalize_name(name):
+    """Lowercase and collapse whitespace so 'gregory  PEREZ ' matches 'Gregory Perez'."""
+    return ' '.join(str(name).lower().split())
+
+
+def normalize_identifier(value):
+    """Loan/Customer IDs are compared case-insensitively and without dashes."""
+    return str(value).strip().lower().replace('-', '')
+
+
+def normalize_phone(value):
+    """Only the digits of a phone number are significant."""
+    return re.sub(r'\D', '', str(value))
+
+
+def _trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _sorted_key_index(keys):
+    """(sorted UTF-8 key array, aligned row positions) for non-empty keys; equal keys keep row order."""
+    pairs = [(key.encode('utf-8'), position) for position, key in enumerate(keys) if key]
+    key_array = np.array([key for key, _ in pairs], dtype=bytes)
+    positions = np.array([position for _, position in pairs], dtype=np.int32 if len(pairs) < 2 ** 31 else np.int64)
+    order = np.argsort(key_array, kind='stable')
+    return key_array[order], positions[order]
+
+
+def _widen(keys, other):
+    """keys as a bytes array wide enough to hold other's keys (np.insert would truncate them)."""
+    width = max(keys.dtype.itemsize, other.dtype.itemsize, 1)
+    return keys if keys.dtype.itemsize == width else keys.astype(f'S{width}')
+
+
+def _patched_key_index(keys, key_positions, positions, new_keys):
+    """_sorted_key_index output with the entries for `positions` replaced by `new_keys` (normalized)."""
+    keep = ~np.isin(key_positions, positions)
+    keys, key_positions = keys[keep], key_positions[keep]
+    pairs = sorted((key.encode('utf-8'), int(position)) for position, key in zip(positions, new_keys) if key)
+    if not pairs:
+        return keys, key_positions
+    insert_keys = np.array([key for key, _ in pairs], dtype=bytes)
+    insert_positions = np.array([position for _, position in pairs], dtype=np.int64)
+    keys = _widen(keys, insert_keys)
+    # Equal keys stay in row order: insert after equal keys with a lower row position.
+    left = np.searchsorted(keys, insert_keys, side='left')
+    right = np.searchsorted(keys, insert_keys, side='right')
+    at = [lo + int(np.searchsorted(key_positions[lo:hi], position)) for lo, hi, position in zip(left, right, insert_positions)]
+    dtype = np.int32 if max(len(key_positions), int(insert_positions.max())) < 2 ** 31 else np.int64
+    return np.insert(keys, at, insert_keys), np.insert(key_positions.astype(dtype), at, insert_positions.astype(dtype))
+
+
+class LookupResult:
+    """Outcome of a customer lookup: how the query matched and the ranked row positions."""
+
+    def __init__(self, match_type, positions):
+        self.match_type = match_type  # 'loan_id', 'customer_id', 'phone', 'exact', 'prefix', 'fuzzy' or None
+        self.positions = positions    # Row positions into the loan book, best match first
+
+    @property
+    def is_unique(self):
+        """True only for an unambiguous exact match that is safe to select without confirmation."""
+        return self.match_type in ('loan_id', 'customer_id', 'phone', 'exact') and len(self.positions) == 1
+
+    def __bool__(self):
+        return bool(self.positions)
+
+
+class CustomerIndex:
+    """Hash, prefix and fuzzy indexes over the customer columns of the loan book.
+
+    Every structure is a flat NumPy array (sorted keys + aligned row positions, and a CSR trigram
+    index), so an index can be saved next to a compact loan book and memory-mapped by every worker.
+    """
+
+    def __init__(self, names, loan_ids=None, customer_ids=None, phones=None):
+        arrays = {}
+        arrays['name_keys'], arrays['name_positions'] = _sorted_key_index(normalize_name(name) for name in names)
+        arrays['loan_id_keys'], arrays['loan_id_positions'] = _sorted_key_index(
+            normalize_identifier(loan_id) for loan_id in (loan_ids if loan_ids is not None else []))
+        arrays['customer_id_keys'], arrays['customer_id_positions'] = _sorted_key_index(
+            normalize_identifier(customer_id) for customer_id in (customer_ids if customer_ids is not None else []))
+        arrays['phone_keys'], arrays['phone_positions'] = _sorted_key_index(
+            normalize_phone(phone) for phone in (phones if phones is not None else []))
+
+        # Unique name keys for prefix/fuzzy ranking; trigram postings point at these keys.
+        arrays['fuzzy_keys'] = np.unique(arrays['name_keys'])
+        grams = defaultdict(list)
+        for key_id, key in enumerate(arrays['fuzzy_keys']):
+            for gram in _trigrams(key.decode('utf-8')):
+                grams[gram.encode('utf-8')].append(key_id)
+        gram_keys = sorted(grams)
+        arrays['gram_keys'] = np.array(gram_keys, dtype=bytes)
+        arrays['gram_offsets'] = np.cumsum([0] + [len(grams[g]) for g in gram_keys], dtype=np.int64)
+        arrays['gram_postings'] = np.array([key_id for g in gram_keys for key_id in grams[g]], dtype=np.int64)
+        self._arrays = arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        index = cls.__new__(cls)
+        index._arrays = dict(arrays)
+        return index
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """Build the index from the standard loan book columns (missing columns are skipped)."""
+        def column(name):
+            return df[name].tolist() if name in df.columns else None
+
+        return cls(column('Random_Name') or [],
+                   loan_ids=column('Loan ID'),
+                   customer_ids=column('Customer ID'),
+                   phones=column('Random_Phone_Number'))
+
+    @classmethod
+    def from_loan_book(cls, book):
+        """Same as from_dataframe, for a loan_book.FrameLoanBook or CompactLoanBook."""
+        def column(name):
+            return book.column(name) if name in book.columns else None
+
+        names = column('Random_Name')
+        return cls(names if names is not None else [],
+                   loan_ids=column('Loan ID'),
+                   customer_ids=column('Customer ID'),
+                   phones=column('Random_Phone_Number'))
+
+    def updated(self, positions, names, loan_ids=None, customer_ids=None, phones=None):
+        """A new index for the book after the rows at `positions` were replaced or appended with the given
+        values (aligned with positions). Only those rows' entries are touched: keys are removed and inserted
+        into the sorted arrays, and trigram postings are added for names the index hasn't seen. Names no
+        longer in the book stay in the fuzzy shortlist but resolve to no rows."""
+        positions = np.asarray(positions, dtype=np.int64)
+        arrays = dict(self._arrays)
+        for field, values, normalize in (('name', names, normalize_name), ('loan_id', loan_ids, normalize_identifier),
+                                         ('customer_id', customer_ids, normalize_identifier), ('phone', phones, normalize_phone)):
+            if values is not None:
+                arrays[f'{field}_keys'], arrays[f'{field}_positions'] = _patched_key_index(
+                    arrays[f'{field}_keys'], arrays[f'{field}_positions'], positions, [normalize(v) for v in values])
+
+        fuzzy_keys = arrays['fuzzy_keys']
+        candidates = sorted({normalize_name(name).encode('utf-8') for name in names} - {b''})
+        candidates = np.array(candidates, dtype=bytes)
+        added = candidates
+        if len(fuzzy_keys) and len(candidates):
+            slots = np.minimum(np.searchsorted(fuzzy_keys, candidates), len(fuzzy_keys) - 1)
+            added = candidates[fuzzy_keys[slots] != candidates]
+        if len(added):
+            # Existing key ids shift up by the number of added keys sorting before them.
+            shift = np.searchsorted(added, fuzzy_keys)
+            fuzzy_keys = _widen(fuzzy_keys, added)
+            fuzzy_keys = np.insert(fuzzy_keys, np.searchsorted(fuzzy_keys, added), added)
+            added_ids = np.searchsorted(fuzzy_keys, added)
+            postings = np.asarray(arrays['gram_postings'])
+            postings = postings + shift[postings] if len(postings) else postings
+
+            new_pairs = sorted((gram.encode('utf-8'), int(key_id))
+                               for key, key_id in zip(added, added_ids) for gram in _trigrams(key.decode('utf-8')))
+            pair_grams = np.array([gram for gram, _ in new_pairs], dtype=bytes)
+            pair_ids = np.array([key_id for _, key_id in new_pairs], dtype=np.int64)
+            gram_keys = np.asarray(arrays['gram_keys'])
+            merged_grams = np.union1d(gram_keys, pair_grams)
+            counts = np.zeros(len(merged_grams), dtype=np.int64)
+            counts[np.searchsorted(merged_grams, gram_keys)] = np.diff(arrays['gram_offsets'])
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            pair_slots = np.searchsorted(merged_grams, pair_grams)
+            at = [offsets[slot] + int(np.searchsorted(postings[offsets[slot]:offsets[slot + 1]], key_id))
+                  for slot, key_id in zip(pair_slots, pair_ids)]
+            arrays['gram_postings'] = np.insert(postings, at, pair_ids)
+            counts += np.bincount(pair_slots, minlength=len(merged_grams))
+            arrays['gram_offsets'] = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+            arrays['gram_keys'] = merged_grams
+            arrays['fuzzy_keys'] = fuzzy_keys
+        return CustomerIndex.from_arrays(arrays)
+
+    # --- Persistence (one .npy per array, loaded memory-mapped) ---
+
+    def save(self, directory):
+        """Writes the index to directory atomically (temp dir + rename); a concurrent writer's copy wins."""
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, suffix='.tmp')
+        try:
+            for name in INDEX_ARRAYS:
+                np.save(os.path.join(tmp_dir, f'{name}.npy'), self._arrays[name], allow_pickle=False)
+            try:
+                os.rename(tmp_dir, directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        return cls.from_arrays({name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+                                for name in INDEX_ARRAYS})
+
+    def __len__(self):
+        return len(self._arrays['name_keys'])
+
+    def _positions(self, field, key):
+        """Row positions (ascending) whose normalized field equals key."""
+        if not key:
+            return []
+        keys = self._arrays[f'{field}_keys']
+        encoded = key.encode('utf-8')
+        start = np.searchsorted(keys, encoded, side='left')
+        end = np.searchsorted(keys, encoded, side='right')
+        return [int(p) for p in self._arrays[f'{field}_positions'][start:end]]
+
+    # --- Identifier lookups ---
+
+    def by_loan_id(self, loan_id):
+        return self._positions('loan_id', normalize_identifier(loan_id))[:1]
+
+    def by_customer_id(self, customer_id):
+        return self._positions('customer_id', normalize_identifier(customer_id))
+
+    def by_phone(self, phone):
+        digits = normalize_phone(phone)
+        if not digits:
+            return []
+        matches = self._positions('phone', digits)
+        if not matches and len(digits) == 11 and digits.startswith('1'):
+            matches = self._positions('phone', digits[1:])  # Tolerate a leading US country code
+        return matches
+
+    # --- Name lookups ---
+
+    def by_exact_name(self, name):
+        return self._positions('name', normalize_name(name))
+
+    def by_prefix(self, prefix, limit=DEFAULT_CANDIDATE_LIMIT):
+        key = normalize_name(prefix)
+        if len(key) < MIN_PREFIX_LENGTH:
+            return []
+        # Sorted keys sharing the prefix form one contiguous run; 0xff never occurs in UTF-8.
+        encoded = key.encode('utf-8')
+        keys = self._arrays['name_keys']
+        start = np.searchsorted(keys, encoded, side='left')
+        end = np.searchsorted(keys, encoded + b'\xff', side='left')
+        return [int(p) for p in self._arrays['name_positions'][start:min(end, start + limit)]]
+
+    def by_fuzzy_name(self, name, limit=DEFAULT_CANDIDATE_LIMIT, min_score=MIN_FUZZY_SCORE):
+        key = normalize_name(name)
+        if len(key) < MIN_PREFIX_LENGTH:
+            return []
+        # Shortlist keys sharing at least a third of the query's trigrams, then rank them.
+        query_grams = _trigrams(key)
+        gram_keys = self._arrays['gram_keys']
+        offsets = self._arrays['gram_offsets']
+        postings = []
+        for gram in query_grams:
+            encoded = gram.encode('utf-8')
+            slot = np.searchsorted(gram_keys, encoded)
+            if slot < len(gram_keys) and gram_keys[slot] == encoded:
+                postings.append(self._arrays['gram_postings'][offsets[slot]:offsets[slot + 1]])
+        if not postings:
+            return []
+        key_ids, shared = np.unique(np.concatenate(postings), return_counts=True)
+        min_shared = max(1, len(query_grams) // 3)
+
+        scored = []
+        for key_id in key_ids[shared >= min_shared]:
+            candidate = self._arrays['fuzzy_keys'][key_id].decode('utf-8')
+            score = difflib.SequenceMatcher(None, key, candidate).ratio()
+            if score >= min_score:
+                scored.append((-score, candidate))
+        scored.sort()
+
+        positions = []
+        for _, candidate in scored:
+            positions.extend(self._positions('name', candidate))
+            if len(positions) >= limit:
+                break
+        return positions[:limit]
+
+    # --- Combined lookup used by /find_customer ---
+
+    def lookup(self, query, limit=DEFAULT_CANDIDATE_LIMIT):
+        """Resolve free text typed by the agent: a Loan ID, Customer ID, phone number or name."""
+        query = (query or '').strip()
+        if not query:
+            return LookupResult(None, [])
+
+        if UUID_PATTERN.match(query):
+            positions = self.by_loan_id(query)
+            if positions:
+                return LookupResult('loan_id', positions)
+            positions = self.by_customer_id(query)
+            if positions:
+                return LookupResult('customer_id', positions[:limit])
+            return LookupResult(None, [])
+
+        if PHONE_PATTERN.match(query) and len(normalize_phone(query)) >= 7:
+            positions = self.by_phone(query)
+            return LookupResult('phone' if positions else None, positions[:limit])
+
+        positions = self.by_exact_name(query)
+        if positions:
+            return LookupResult('exact', positions[:limit])
+        positions = self.by_prefix(query, limit=limit)
+        if positions:
+            return LookupResult('prefix', positions)
+        positions = self.by_fuzzy_name(query, limit=limit)
+        if positions:
+            return LookupResult('fuzzy', positions)
+        return LookupResult(None, [])
@@ -0,0 +1,228 @@
+import hashlib
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# --- Loan book loading ---
+# Parses the loan CSV and applies the app's cleaning rules with vectorized pandas/NumPy operations
+# (no per-cell Python lambdas), then keeps the cleaned result in a columnar NumPy .npz cache keyed on the
+# SHA-256 of the source file. Later starts (worker boots, debug reloads) load the cache instead of re-parsing.
+#
+# Cleaning rules (unchanged from the original row-wise implementation):
+#   * numeric columns: coerced to numbers; int64 when every value is present and integral, otherwise
+#     float64 with missing values filled with 0.0
+#   * Credit Score: 4-digit scores (1000-9999) are divided by 10, then clipped to 300-850; missing scores
+#     become 'Unknown Score'
+#   * text columns: missing values become 'Unknown'
+
+NUMERIC_COLUMNS = ['Current Loan Amount', 'Annual Income', 'Monthly Debt',
+                   'Years of Credit History', 'Months since last delinquent',
+                   'Number of Open Accounts', 'Number of Credit Problems',
+                   'Current Credit Balance', 'Maximum Open Credit', 'Bankruptcies', 'Tax Liens']
+TEXT_COLUMNS = ['Term', 'Years in current job', 'Home Ownership', 'Purpose', 'Random_Name', 'Random_Phone_Number']
+CREDIT_SCORE_COLUMN = 'Credit Score'
+UNKNOWN_CREDIT_SCORE = 'Unknown Score'
+
+DEFAULT_CACHE_DIR = '.loan_book_cache'
+CACHE_FORMAT_VERSION = 1  # Bump when the cleaning rules or cache layout change
+_COLUMNS_KEY = '__columns__'
+_MISSING_PREFIX = '__missing__:'
+_CATEGORIES_PREFIX = '__categories__:'
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _integral_or_float(values):
+    """int64 when every value is present and integral, float64 otherwise (matches the old per-cell int() rule)."""
+    values = values.astype('float64') if values.dtype.kind not in 'iuf' else values
+    if values.dtype.kind == 'f' and values.notna().all() and np.array_equal(values, np.floor(values)):
+        return values.astype('int64')
+    return values
+
+
+def clean_loan_book(df):
+    """Vectorized cleaning; returns a frame with plain dtypes (Credit Score still float64 with NaN)."""
+    df = df.copy()
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            values = _integral_or_float(pd.to_numeric(df[col], errors='coerce'))
+            df[col] = values.fillna(0.0) if values.dtype.kind == 'f' else values
+
+    if CREDIT_SCORE_COLUMN in df.columns:
+        scores = pd.to_numeric(df[CREDIT_SCORE_COLUMN], errors='coerce').astype('float64')
+        scores = scores.where(~((scores > 1000) & (scores < 10000)), scores / 10.0)
+        df[CREDIT_SCORE_COLUMN] = _integral_or_float(scores.clip(lower=300.0, upper=850.0))
+
+    for col in TEXT_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].fillna('Unknown')
+    return df
+
+
+def apply_display_fills(df):
+    """Final, cheap step shared by the CSV and cache paths: missing credit scores become 'Unknown Score'."""
+    if CREDIT_SCORE_COLUMN in df.columns and df[CREDIT_SCORE_COLUMN].isna().any():
+        scores = df[CREDIT_SCORE_COLUMN].astype(object)
+        df[CREDIT_SCORE_COLUMN] = scores.where(scores.notna(), UNKNOWN_CREDIT_SCORE)
+    return df
+
+
+# --- Columnar .npz cache ---
+
+def cache_path_for(csv_path, source_hash, cache_dir=DEFAULT_CACHE_DIR):
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_dir, f'{stem}-v{CACHE_FORMAT_VERSION}-{source_hash[:16]}.npz')
+
+
+def write_cache(df, path):
+    """Stores each column as its own NumPy array.
+
+    Text columns with repeated values are dictionary-encoded (int32 codes + unique values) so loading
+    rebuilds them by indexing instead of creating one Python string per row; code -1 marks missing values.
+    Mostly-unique text columns (IDs, names) are stored as fixed-width unicode plus a missing mask.
+    """
+    arrays = {_COLUMNS_KEY: np.array(df.columns, dtype=str)}
+    for i, col in enumerate(df.columns):
+        values = df[col]
+        if values.dtype.kind in 'iufb':
+            arrays[f'c{i}'] = values.to_numpy()
+            continue
+        codes, uniques = pd.factorize(values)
+        if len(uniques) <= len(values) // 2:
+            arrays[f'c{i}'] = codes.astype('int32')
+            arrays[_CATEGORIES_PREFIX + str(i)] = np.asarray(uniques, dtype=str)
+        else:
+            missing = values.isna().to_numpy()
+            arrays[f'c{i}'] = values.where(~missing, '').to_numpy(dtype=str)
+            if missing.any():
+                arrays[_MISSING_PREFIX + str(i)] = missing
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Write to a temp file and rename so concurrent workers never see a partial cache.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.npz.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_cache(path):
+    with np.load(path, allow_pickle=False) as arrays:
+        columns = list(arrays[_COLUMNS_KEY])
+        data = {}
+        for i, col in enumerate(columns):
+            values = arrays[f'c{i}']
+            categories_key = _CATEGORIES_PREFIX + str(i)
+            if categories_key in arrays:
+                # Append a NaN slot so code -1 (missing) indexes it.
+                lookup = np.append(arrays[categories_key].astype(object), np.nan)
+                values = lookup[values]
+            elif values.dtype.kind == 'U':
+                values = values.astype(object)
+                missing_key = _MISSING_PREFIX + str(i)
+                if missing_key in arrays:
+                    values[arrays[missing_key]] = np.nan
+            data[col] = values
+    return pd.DataFrame(data, columns=columns)
+
+
+# --- Incremental deltas ---
+# A delta file is a CSV with any subset of the loan book's columns plus 'Loan ID'. Rows whose Loan ID is
+# already in the book update the cells they fill in (empty cells leave the current value); the rest are
+# appended as new loans. Only the delta is parsed and cleaned. Column dtypes follow the full-load rule for
+# the combined data (int64 unless some value is float), except that a float column never narrows back to int64.
+
+DELTA_KEY_COLUMN = 'Loan ID'
+
+
+def _combined_dtype(arrays):
+    kinds = {a.dtype.kind for a in arrays if len(a)}
+    if not kinds:
+        return arrays[0].dtype
+    if kinds - set('iuf'):
+        return np.dtype(object)
+    return np.dtype('float64') if 'f' in kinds else np.dtype('int64')
+
+
+def apply_loan_book_delta(df, delta):
+    """Returns (new_df, updated_rows, appended_rows) for a loaded book and a raw delta frame.
+
+    df is not modified, so readers of the current book are unaffected while the new one is built.
+    """
+    if DELTA_KEY_COLUMN not in delta.columns:
+        raise ValueError(f"Delta has no '{DELTA_KEY_COLUMN}' column.")
+    ignored = [col for col in delta.columns if col not in df.columns]
+    if ignored:
+        logging.warning("Ignoring delta columns not present in the loan book: %s", ignored)
+    delta = delta.drop(columns=ignored).dropna(subset=[DELTA_KEY_COLUMN])
+    delta = delta.drop_duplicates(subset=DELTA_KEY_COLUMN, keep='last')
+
+    base = df
+    if CREDIT_SCORE_COLUMN in base.columns and base[CREDIT_SCORE_COLUMN].dtype == object:
+        # Merge scores as numbers; 'Unknown Score' is re-applied to the result.
+        base = base.assign(**{CREDIT_SCORE_COLUMN: pd.to_numeric(base[CREDIT_SCORE_COLUMN], errors='coerce')})
+
+    first_position = pd.Series(np.arange(len(base)), index=base[DELTA_KEY_COLUMN].to_numpy())
+    first_position = first_position[~first_position.index.duplicated()]
+    positions = first_position.reindex(delta[DELTA_KEY_COLUMN].to_numpy()).to_numpy()
+    is_update = ~np.isnan(positions)
+    updates = delta.loc[is_update]
+    update_positions = positions[is_update].astype(np.int64)
+    appended = clean_loan_book(delta.loc[~is_update].reindex(columns=base.columns))
+
+    merged = {}
+    for col in base.columns:
+        values = base[col].to_numpy()
+        parts = [values, appended[col].to_numpy()]
+        if col in updates.columns and col != DELTA_KEY_COLUMN:
+            provided = updates[col].notna().to_numpy()
+            parts.append(clean_loan_book(updates.loc[provided, [col]])[col].to_numpy())
+        dtype = _combined_dtype(parts)
+        column = values.astype(dtype, copy=True)
+        if len(parts) > 2:
+            column[update_positions[provided]] = parts[2].astype(dtype)
+        merged[col] = np.concatenate([column, parts[1].astype(dtype)])
+
+    new_df = apply_display_fills(pd.DataFrame(merged, columns=base.columns))
+    return new_df, int(is_update.sum()), int((~is_update).sum())
+
+
+# --- Public entry point ---
+
+def load_loan_book(csv_path, cache_dir=DEFAULT_CACHE_DIR, use_cache=True):
+    """Returns (df, source_hash) for the cleaned loan book, using the binary cache when it is current."""
+    source_hash = file_sha256(csv_path)
+    cache_path = cache_path_for(csv_path, source_hash, cache_dir)
+
+    if use_cache and os.path.exists(cache_path):
+        try:
+            started = time.perf_counter()
+            df = apply_display_fills(read_cache(cache_path))
+            logging.info("Loaded loan book from cache '%s' in %.1f ms.", cache_path, (time.perf_counter() - started) * 1000)
+            return df, source_hash
+        except Exception as e:
+            logging.warning("Ignoring unreadable loan book cache '%s': %s", cache_path, e)
+
+    started = time.perf_counter()
+    df = clean_loan_book(pd.read_csv(csv_path))
+    logging.info("Parsed and cleaned '%s' in %.1f ms.", csv_path, (time.perf_counter() - started) * 1000)
+    if use_cache:
+        try:
+            write_cache(df, cache_path)
+            logging.info("Wrote loan book cache '%s'.", cache_path)
+        except OSError as e:
+            logging.warning("Could not write loan book cache '%s': %s", cache_path, e)
+    return apply_display_fills(df), source_hash
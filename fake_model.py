@@ -0,0 +1,131 @@
+import os
+import random
+import re
+import threading
+import time
+import types
+
+# --- Local stand-in for the Gemini GenerativeModel ---
+# Mirrors the parts of the google.generativeai API the app uses (generate_content, with and without
+# stream=True, returning objects with .text and .prompt_feedback) so the serving path can be exercised
+# offline. Select it with LLM_BACKEND=fake; FAKE_LLM_LATENCY_SECONDS simulates the model round-trip.
+#
+# Fault injection, for exercising retries, hedging and the circuit breaker (see resilience.py):
+#   FAKE_LLM_ERROR_RATE       share of calls failing with a 503 (FakeServiceUnavailable)
+#   FAKE_LLM_RATE_LIMIT_RATE  share of calls failing with a 429 (FakeResourceExhausted)
+#   FAKE_LLM_SLOW_RATE        share of calls taking FAKE_LLM_SLOW_SECONDS extra (a latency tail)
+#   FAKE_LLM_SEED             makes the injected faults reproducible
+# `outage` (set_outage) fails every call until cleared. Streamed calls fail before their first chunk.
+
+
+class FakeServiceUnavailable(Exception):
+    """Injected 503, shaped like google.api_core.exceptions.ServiceUnavailable."""
+    code = 503
+
+
+class FakeResourceExhausted(Exception):
+    """Injected 429, shaped like google.api_core.exceptions.ResourceExhausted."""
+    code = 429
+
+
+class FakeResponse:
+    """Response/chunk object shaped like a google.generativeai GenerateContentResponse."""
+
+    def __init__(self, text, chunks=None):
+        self.text = text
+        self.prompt_feedback = types.SimpleNamespace(block_reason=None)
+        self._chunks = chunks
+
+    def __iter__(self):
+        return iter(self._chunks if self._chunks is not None else [self])
+
+
+DOSSIER_FIELD_PATTERN = r'^{}: (.+)$'
+
+
+def _dossier_field(contents, field, default):
+    """Reads a field (e.g. 'Customer Name') from the customer dossier in the first prompt turn."""
+    if not contents:
+        return default
+    prefix = ' '.join(str(part) for part in contents[0].get('parts', []))
+    match = re.search(DOSSIER_FIELD_PATTERN.format(re.escape(field)), prefix, re.MULTILINE)
+    return match.group(1).strip() if match else default
+
+
+def _last_user_text(contents):
+    for turn in reversed(contents or []):
+        if turn.get('role') == 'user':
+            return ' '.join(str(part) for part in turn.get('parts', []))
+    return ''
+
+
+class FakeGenerativeModel:
+    """Deterministic offline model: the reply depends only on the conversation passed in."""
+
+    def __init__(self, latency=0.0, chunk_size=4, error_rate=0.0, rate_limit_rate=0.0, slow_rate=0.0,
+                 slow_seconds=0.0, seed=None):
+        self.latency = latency
+        self.chunk_size = chunk_size  # Words per streamed chunk
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.outage = False
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.injected_errors = 0
+
+    def set_outage(self, outage=True):
+        self.outage = outage
+
+    def _inject_faults(self):
+        """Sleeps and/or raises according to the fault settings; called once per generate_content."""
+        with self._lock:
+            roll, slow_roll = self._rng.random(), self._rng.random()
+        delay = self.latency + (self.slow_seconds if slow_roll < self.slow_rate else 0.0)
+        if delay:
+            time.sleep(delay)
+        error = None
+        if self.outage or roll < self.error_rate:
+            error = FakeServiceUnavailable("503 The model is overloaded. Please try again later.")
+        elif roll < self.error_rate + self.rate_limit_rate:
+            error = FakeResourceExhausted("429 Resource has been exhausted (e.g. check quota).")
+        if error is not None:
+            with self._lock:
+                self.injected_errors += 1
+            raise error
+
+    def reply_for(self, contents):
+        turn_number = sum(1 for turn in contents if turn.get('role') == 'model') + 1
+        user_text = _last_user_text(contents)
+        if turn_number == 1:
+            name = _dossier_field(contents, 'Customer Name', 'there')
+            amount = _dossier_field(contents, 'Overdue Loan Amount', 'the overdue balance on file')
+            return (f"Hello {name}, this is Alex from Apex Financial Services. I'm calling about your loan account, "
+                    f"which shows an overdue balance of {amount}. Could we find a way to take care of it today?")
+        return (f"Thank you for letting me know. You said: \"{user_text[:80]}\". "
+                f"Let's work out a manageable payment step for your overdue balance today.")
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        self._inject_faults()
+        text = self.reply_for(contents)
+        if not stream:
+            return FakeResponse(text)
+        words = text.split(' ')
+        chunks = [FakeResponse(' '.join(words[i:i + self.chunk_size]) + ' ')
+                  for i in range(0, len(words), self.chunk_size)]
+        return FakeResponse(text, chunks=chunks)
+
+
+def create_fake_model():
+    """FakeGenerativeModel configured from FAKE_LLM_* settings."""
+    seed = os.getenv('FAKE_LLM_SEED')
+    return FakeGenerativeModel(latency=float(os.getenv('FAKE_LLM_LATENCY_SECONDS', '0')),
+                               error_rate=float(os.getenv('FAKE_LLM_ERROR_RATE', '0')),
+                               rate_limit_rate=float(os.getenv('FAKE_LLM_RATE_LIMIT_RATE', '0')),
+                               slow_rate=float(os.getenv('FAKE_LLM_SLOW_RATE', '0')),
+                               slow_seconds=float(os.getenv('FAKE_LLM_SLOW_SECONDS', '0')),
+                               seed=int(seed) if seed else None)
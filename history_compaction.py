@@ -0,0 +1,79 @@
+import re
+
+# --- Token-budgeted history windowing ---
+# Keeps the per-turn prompt roughly constant in size: the most recent turns are sent verbatim, and once
+# they exceed the token budget the oldest ones are folded into a running plain-text summary. The summary
+# itself is capped; lines that carry payment facts (amounts, dates, methods) are kept longest.
+# Summarization is extractive and local, so compaction never adds a model call to the request path.
+
+CHARS_PER_TOKEN = 4
+SUMMARY_LINE_MAX_CHARS = 240
+KEY_FACT_PATTERN = re.compile(
+    r'\$|\d|\b(pay|paid|payment|cheque|check|card|transfer|bank|date|today|tomorrow|week|month|promise|plan|hardship)\b',
+    re.IGNORECASE)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return max(1, len(text) // CHARS_PER_TOKEN) if text else 0
+
+
+def turn_text(turn):
+    return ' '.join(str(part) for part in turn.get('parts', []))
+
+
+def turn_tokens(turn):
+    return estimate_tokens(turn_text(turn))
+
+
+def summarize_turn(turn):
+    speaker = 'Customer' if turn.get('role') == 'user' else 'Representative'
+    text = ' '.join(turn_text(turn).split())
+    if len(text) > SUMMARY_LINE_MAX_CHARS:
+        text = text[:SUMMARY_LINE_MAX_CHARS - 3].rstrip() + '...'
+    return f'{speaker}: {text}'
+
+
+def trim_summary(summary, token_budget):
+    """Drops the oldest summary lines until the summary fits, sacrificing lines without key facts first."""
+    lines = summary.splitlines()
+    while lines and estimate_tokens('\n'.join(lines)) > token_budget:
+        filler = next((i for i, line in enumerate(lines) if not KEY_FACT_PATTERN.search(line)), None)
+        lines.pop(filler if filler is not None else 0)
+    return '\n'.join(lines)
+
+
+def compact_history(conversation, token_budget=1500, min_recent_turns=6, summary_token_budget=400):
+    """Folds old turns of conversation['history'] into conversation['summary'] in place.
+
+    Recent turns are kept verbatim while they fit in token_budget; at least min_recent_turns are always
+    kept. Returns the number of turns folded into the summary by this call.
+    """
+    history = conversation.get('history', [])
+    kept_tokens = 0
+    keep_from = len(history)
+    for i in range(len(history) - 1, -1, -1):
+        tokens = turn_tokens(history[i])
+        if kept_tokens + tokens > token_budget and len(history) - i > min_recent_turns:
+            break
+        kept_tokens += tokens
+        keep_from = i
+
+    if keep_from == 0:
+        return 0
+
+    folded = history[:keep_from]
+    summary_lines = [conversation.get('summary', '')] if conversation.get('summary') else []
+    summary_lines.extend(summarize_turn(turn) for turn in folded)
+    conversation['summary'] = trim_summary('\n'.join(summary_lines), summary_token_budget)
+    conversation['summarized_turns'] = conversation.get('summarized_turns', 0) + len(folded)
+    conversation['history'] = history[keep_from:]
+    return len(folded)
+
+
+def format_summary_for_prompt(conversation):
+    """Prompt section describing the folded part of the call, or '' when nothing has been folded."""
+    if not conversation.get('summary'):
+        return ''
+    return (f"\n\n--- Summary of the earlier part of this call ({conversation.get('summarized_turns', 0)} earlier turns; "
+            f"the conversation continues below) ---\n{conversation['summary']}\n--- End of summary ---")
@@ -0,0 +1,359 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# --- Bounded, shared pool for model calls ---
+# Every chat route goes through one pool per process:
+#   * at most `max_concurrency` model calls run at once (one worker thread each),
+#   * at most `max_queue` further calls wait for a free slot; beyond that, calls are rejected
+#     immediately with PoolSaturatedError so the route can answer with a fast "please hold",
+#   * each call is bounded by `timeout` seconds, including time spent queued.
+# Sync callers (the WSGI routes) block on the result; async callers (the ASGI entry point) await it
+# without holding a web worker.
+# With a `policy` (resilience.ModelCallPolicy) each call is also rate limited, retried on transient errors,
+# hedged when slow, and failed fast while the circuit breaker is open; all within the same timeout.
+
+
+class PoolSaturatedError(Exception):
+    """Raised when the pool's running and queued calls are already at capacity."""
+
+
+class LLMTimeoutError(TimeoutError):
+    """Raised when a model call (queue wait plus generation) exceeds the per-request timeout."""
+
+
+_STREAM_END = object()
+
+
+class PooledStream:
+    """Iterates chunks of a streamed model call that runs on a pool thread.
+
+    After iteration finishes, `.response` holds the underlying streamed response object.
+    """
+
+    def __init__(self, pool, contents, timeout, model=None, error=None, **kwargs):
+        self.response = None
+        self._pool = pool
+        self._timeout = timeout
+        self._chunks = queue.Queue()
+        # Set when an async consumer attaches; chunks are then handed to its event loop directly.
+        self._handoff_lock = threading.Lock()
+        self._loop = None
+        self._async_chunks = None
+        if error is not None:
+            # Failed before reaching the model (open circuit): the consumer sees the error on first read.
+            self._future = None
+            self._chunks.put(error)
+            self._chunks.put(_STREAM_END)
+            return
+        self._future = pool._submit(self._produce, model or pool.model, contents, kwargs)
+
+    def _emit(self, item):
+        with self._handoff_lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._async_chunks.put_nowait, item)
+            else:
+                self._chunks.put(item)
+
+    def _produce(self, model, contents, kwargs):
+        policy = self._pool.policy
+        deadline = time.monotonic() + self._timeout
+        attempt = 0
+        try:
+            while True:
+                emitted = False
+                try:
+                    self.response = model.generate_content(contents, stream=True, **kwargs)
+                    for chunk in self.response:
+                        emitted = True
+                        self._emit(chunk)
+                    break
+                except Exception as e:
+                    if policy is None:
+                        raise
+                    policy.record_error(e)
+                    # Only retried before the first chunk: the consumer may already be speaking it.
+                    delay = None if emitted else policy.retry_delay(e, attempt, deadline - time.monotonic())
+                    if delay is None or not policy.breaker.allow():
+                        raise
+                    logging.warning("Streamed model call attempt %s failed (%s: %s); retrying in %.2fs.", attempt + 1, type(e).__name__, e, delay)
+                    time.sleep(delay)
+                    policy.take_token(deadline - time.monotonic())
+                    attempt += 1
+            if policy is not None:
+                policy.record_success()
+        except Exception as e:
+            self._emit(e)
+        finally:
+            self._emit(_STREAM_END)
+
+    def _on_timeout(self):
+        if self._future is not None:
+            self._future.cancel()
+        with self._pool._lock:
+            self._pool.timed_out += 1
+        return LLMTimeoutError(f"No model output within {self._timeout} seconds.")
+
+    def __iter__(self):
+        while True:
+            try:
+                item = self._chunks.get(timeout=self._timeout)
+            except queue.Empty:
+                raise self._on_timeout()
+            if item is _STREAM_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    async def __aiter__(self):
+        with self._handoff_lock:
+            self._loop = asyncio.get_running_loop()
+            self._async_chunks = asyncio.Queue()
+            while not self._chunks.empty():
+                self._async_chunks.put_nowait(self._chunks.get_nowait())
+        while True:
+            try:
+                item = await asyncio.wait_for(self._async_chunks.get(), timeout=self._timeout)
+            except asyncio.TimeoutError:
+                raise self._on_timeout()
+            if item is _STREAM_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class LLMClientPool:
+    """Shares one model client across a bounded set of worker threads with backpressure."""
+
+    def __init__(self, model, max_concurrency=8, max_queue=32, timeout=30.0, policy=None):
+        self.model = model
+        self.policy = policy
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm-pool')
+        self._lock = threading.Lock()
+        self._outstanding = 0  # Running plus queued calls
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def outstanding(self):
+        return self._outstanding
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._outstanding >= self.max_concurrency + self.max_queue:
+                self.rejected += 1
+                raise PoolSaturatedError(f"{self._outstanding} model calls already running or queued.")
+            self._outstanding += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future):
+        with self._lock:
+            self._outstanding -= 1
+            self.completed += 1
+
+    def _timeout_for(self, timeout):
+        return self.timeout if timeout is None else timeout
+
+    def generate(self, contents, timeout=None, model=None, **kwargs):
+        """Blocking call for WSGI routes. Raises PoolSaturatedError or LLMTimeoutError, and with a policy
+        also RateLimitedError (a PoolSaturatedError) or CircuitOpenError.
+
+        `model` overrides the pool's model for this call (e.g. one bound to a cached prompt prefix).
+        """
+        timeout = self._timeout_for(timeout)
+        model = model or self.model
+        call = lambda: model.generate_content(contents, **kwargs)
+        if self.policy is None:
+            return self._attempt([self._submit(call)], timeout)
+        policy = self.policy
+        deadline = time.monotonic() + timeout
+        policy.admit()
+        attempt = 0
+        while True:
+            try:
+                policy.take_token(deadline - time.monotonic())
+                started = time.monotonic()
+                result = self._hedged_attempt(call, deadline)
+            except PoolSaturatedError:
+                policy.breaker.release_probe()
+                raise
+            except Exception as e:
+                policy.record_error(e)
+                delay = policy.retry_delay(e, attempt, deadline - time.monotonic())
+                if delay is None or not policy.breaker.allow():
+                    raise
+                logging.warning("Model call attempt %s failed (%s: %s); retrying in %.2fs.", attempt + 1, type(e).__name__, e, delay)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            policy.record_success(time.monotonic() - started)
+            return result
+
+    def _attempt(self, futures, timeout):
+        """Waits up to `timeout` for the first successful future; cancels the rest."""
+        deadline = time.monotonic() + timeout
+        primary = futures[0]
+        error = None
+        while futures:
+            done, pending = wait(futures, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if self.policy is not None and future is not primary:
+                        self.policy.count('hedge_wins')
+                    return future.result()
+                error = future.exception()
+            futures = [future for future in futures if future in pending]
+        if error is not None and not futures:
+            raise error
+        for future in futures:
+            future.cancel()  # Drops the call if it is still queued; a running call finishes in the background.
+        with self._lock:
+            self.timed_out += 1
+        raise LLMTimeoutError(f"Model call exceeded {timeout} seconds.")
+
+    def _hedge(self, call):
+        """Starts a duplicate call if a worker is idle and the rate limit allows it; None otherwise."""
+        if self._outstanding >= self.max_concurrency or not self.policy.try_token():
+            return None
+        try:
+            future = self._submit(call)
+        except PoolSaturatedError:
+            return None
+        self.policy.count('hedges')
+        return future
+
+    def _hedged_attempt(self, call, deadline):
+        futures = [self._submit(call)]
+        hedge_delay = self.policy.hedge_delay()
+        if hedge_delay is not None and hedge_delay < deadline - time.monotonic():
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done:
+                hedge = self._hedge(call)
+                if hedge is not None:
+                    futures.append(hedge)
+        return self._attempt(futures, max(0.0, deadline - time.monotonic()))
+
+    async def generate_async(self, contents, timeout=None, model=None, **kwargs):
+        """Awaitable call for the ASGI entry point. Raises the same errors as generate()."""
+        timeout = self._timeout_for(timeout)
+        model = model or self.model
+        call = lambda: model.generate_content(contents, **kwargs)
+        if self.policy is None:
+            return await self._attempt_async([self._submit(call)], timeout)
+        policy = self.policy
+        deadline = time.monotonic() + timeout
+        policy.admit()
+        attempt = 0
+        while True:
+            try:
+                if not policy.bucket.try_acquire():
+                    await asyncio.to_thread(policy.take_token, deadline - time.monotonic())
+                started = time.monotonic()
+                result = await self._hedged_attempt_async(call, deadline)
+            except PoolSaturatedError:
+                policy.breaker.release_probe()
+                raise
+            except Exception as e:
+                policy.record_error(e)
+                delay = policy.retry_delay(e, attempt, deadline - time.monotonic())
+                if delay is None or not policy.breaker.allow():
+                    raise
+                logging.warning("Model call attempt %s failed (%s: %s); retrying in %.2fs.", attempt + 1, type(e).__name__, e, delay)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            policy.record_success(time.monotonic() - started)
+            return result
+
+    async def _attempt_async(self, futures, timeout):
+        """Async twin of _attempt."""
+        deadline = time.monotonic() + timeout
+        waiting = {asyncio.wrap_future(future): future for future in futures}
+        error = None
+        while waiting:
+            done, _ = await asyncio.wait(waiting, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for wrapped in done:
+                future = waiting.pop(wrapped)
+                if wrapped.exception() is None:
+                    for other in waiting.values():
+                        other.cancel()
+                    if self.policy is not None and future is not futures[0]:
+                        self.policy.count('hedge_wins')
+                    return wrapped.result()
+                error = wrapped.exception()
+        if error is not None and not waiting:
+            raise error
+        for future in waiting.values():
+            future.cancel()
+        with self._lock:
+            self.timed_out += 1
+        raise LLMTimeoutError(f"Model call exceeded {timeout} seconds.")
+
+    async def _hedged_attempt_async(self, call, deadline):
+        futures = [self._submit(call)]
+        hedge_delay = self.policy.hedge_delay()
+        if hedge_delay is not None and hedge_delay < deadline - time.monotonic():
+            done, _ = await asyncio.wait([asyncio.wrap_future(futures[0])], timeout=hedge_delay)
+            if not done:
+                hedge = self._hedge(call)
+                if hedge is not None:
+                    futures.append(hedge)
+        return await self._attempt_async(futures, max(0.0, deadline - time.monotonic()))
+
+    def stream(self, contents, timeout=None, model=None, **kwargs):
+        """Starts a streamed call; iterate (or async-iterate) the result for chunks.
+
+        Admission happens here, so PoolSaturatedError is raised before any response is sent.
+        The timeout applies to the wait for each chunk. With a policy, an open circuit surfaces as a
+        CircuitOpenError on the first read, and failures before the first chunk are retried (not hedged).
+        May block for a rate-limit token; async callers use stream_async().
+        """
+        timeout = self._timeout_for(timeout)
+        if self.policy is None:
+            return PooledStream(self, contents, timeout, model=model, **kwargs)
+        try:
+            self.policy.admit()
+        except Exception as e:  # CircuitOpenError
+            return PooledStream(self, contents, timeout, error=e)
+        self.policy.take_token(timeout)
+        return self._start_admitted_stream(contents, timeout, model, kwargs)
+
+    async def stream_async(self, contents, timeout=None, model=None, **kwargs):
+        """stream() for the ASGI entry point: waits for a rate-limit token without blocking the event loop."""
+        timeout = self._timeout_for(timeout)
+        if self.policy is None:
+            return PooledStream(self, contents, timeout, model=model, **kwargs)
+        try:
+            self.policy.admit()
+        except Exception as e:  # CircuitOpenError
+            return PooledStream(self, contents, timeout, error=e)
+        if not self.policy.bucket.try_acquire():
+            await asyncio.to_thread(self.policy.take_token, timeout)
+        return self._start_admitted_stream(contents, timeout, model, kwargs)
+
+    def _start_admitted_stream(self, contents, timeout, model, kwargs):
+        try:
+            return PooledStream(self, contents, timeout, model=model, **kwargs)
+        except PoolSaturatedError:
+            self.policy.breaker.release_probe()
+            raise
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,408 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from data_loader import DEFAULT_CACHE_DIR, file_sha256, load_loan_book
+
+# --- Loan book storage ---
+# The app reads the loan book through one small interface (len, `in`, record, value, column) so it can be
+# backed either by the cleaned pandas DataFrame (FrameLoanBook, the default) or by a compact, read-only,
+# memory-mapped column directory (CompactLoanBook, LOAN_BOOK_STORAGE=compact).
+#
+# Compact layout: one .npy file per column plus manifest.json describing how each column is encoded.
+#   * int      -> the narrowest of int8/int16/int32/int64 that holds every value
+#   * float    -> float32 when every value survives the round trip through its shortest float32 repr
+#                 (so the formatted dossier text is unchanged), otherwise float64
+#   * numeric_or_label -> float column with NaN standing in for a single text label ('Unknown Score')
+#   * uuid     -> 16-byte binary UUIDs (only when every value is a canonical lowercase UUID string)
+#   * category -> int8/int16/int32 codes into the manifest's category list; code -1 is a missing value
+#   * string   -> fixed-width UTF-8 bytes, plus a missing mask when needed
+# Files are opened with np.load(mmap_mode='r'), so every worker process on the host shares one copy of the
+# data through the OS page cache instead of holding its own.
+
+COMPACT_FORMAT_VERSION = 1  # Bump when the compact layout changes
+MANIFEST_FILE = 'manifest.json'
+
+
+class FrameLoanBook:
+    """Loan book backed by the cleaned DataFrame (one copy per worker process)."""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.columns = list(frame.columns)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __contains__(self, position):
+        return isinstance(position, (int, np.integer)) and 0 <= position < len(self.frame)
+
+    def record(self, position):
+        """The row as a dict of Python values (same as df.iloc[position].to_dict())."""
+        return self.frame.iloc[position].to_dict()
+
+    def value(self, position, column):
+        value = self.frame[column].iat[position]
+        return value.item() if isinstance(value, np.generic) else value
+
+    def column(self, column):
+        return self.frame[column].to_numpy()
+
+    def memory_bytes(self):
+        return int(self.frame.memory_usage(deep=True).sum())
+
+
+# --- Compact column encodings ---
+
+def _is_missing(value):
+    return isinstance(value, float) and np.isnan(value)
+
+
+def _smallest_int_dtype(low, high):
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _float32_is_lossless(values):
+    """True when str(float32(v)) parses back to exactly v for every value (NaN allowed)."""
+    narrowed = values.astype(np.float32)
+    restored = narrowed.astype(str).astype(np.float64)
+    return bool(np.all((restored == values) | (np.isnan(values) & np.isnan(restored))))
+
+
+def _encode_floats(values):
+    values = np.asarray(values, dtype=np.float64)
+    if _float32_is_lossless(values):
+        return values.astype(np.float32), 'float32'
+    return values, 'float64'
+
+
+def _is_canonical_uuid(value):
+    try:
+        return isinstance(value, str) and str(uuid.UUID(value)) == value
+    except ValueError:
+        return False
+
+
+def encode_column(series):
+    """Returns (arrays, spec): arrays maps a file suffix ('' or '.missing') to an ndarray."""
+    if series.dtype.kind in 'iu':
+        values = series.to_numpy()
+        dtype = np.dtype(np.int8) if len(values) == 0 else _smallest_int_dtype(values.min(), values.max())
+        return {'': values.astype(dtype)}, {'encoding': 'int', 'dtype': dtype.name}
+
+    if series.dtype.kind == 'f':
+        values, dtype = _encode_floats(series.to_numpy())
+        return {'': values}, {'encoding': 'float', 'dtype': dtype}
+
+    values = series.to_numpy(dtype=object)
+    numeric = np.array([isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in values], dtype=bool)
+    labels = set(values[~numeric])
+    if numeric.any() and len(labels) == 1:
+        # e.g. Credit Score: numbers with 'Unknown Score' for missing ones.
+        label = labels.pop()
+        as_int = all(isinstance(v, (int, np.integer)) for v in values[numeric])
+        floats = np.where(numeric, values, np.nan).astype(np.float64)
+        encoded, dtype = _encode_floats(floats)
+        return {'': encoded}, {'encoding': 'numeric_or_label', 'dtype': dtype, 'label': label,
+                               'python_type': 'int' if as_int else 'float'}
+
+    if len(values) and all(_is_canonical_uuid(v) for v in values):
+        binary = np.frombuffer(b''.join(uuid.UUID(v).bytes for v in values), dtype=np.uint8).reshape(-1, 16)
+        return {'': binary}, {'encoding': 'uuid'}
+
+    codes, categories = pd.factorize(series)
+    if len(categories) <= len(values) // 2:
+        dtype = _smallest_int_dtype(-1, max(len(categories) - 1, 0))
+        return {'': codes.astype(dtype)}, {'encoding': 'category', 'dtype': dtype.name,
+                                            'categories': [str(c) for c in categories]}
+
+    missing = np.array([_is_missing(v) for v in values], dtype=bool)
+    encoded = np.array([b'' if m else str(v).encode('utf-8') for v, m in zip(values, missing)], dtype=bytes)
+    arrays = {'': encoded}
+    if missing.any():
+        arrays['.missing'] = missing
+    return arrays, {'encoding': 'string'}
+
+
+def _write_columns(directory, rows, encoded_columns):
+    """Writes (name, arrays, spec) columns as a compact directory that appears atomically (temp dir + rename)."""
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, suffix='.tmp')
+    try:
+        columns = []
+        for i, (name, arrays, spec) in enumerate(encoded_columns):
+            spec = dict(spec, name=name, file=f'c{i}')
+            for suffix, values in arrays.items():
+                np.save(os.path.join(tmp_dir, f'c{i}{suffix}.npy'), values, allow_pickle=False)
+            columns.append(spec)
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+            json.dump({'format_version': COMPACT_FORMAT_VERSION, 'rows': rows, 'columns': columns}, f, indent=2)
+        try:
+            os.rename(tmp_dir, directory)
+        except OSError:
+            # Another worker finished first; its copy is identical.
+            if not os.path.isdir(directory):
+                raise
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def write_compact_book(df, directory):
+    """Writes df as a compact column directory; the directory appears atomically (temp dir + rename)."""
+    _write_columns(directory, len(df), ((name, *encode_column(df[name])) for name in df.columns))
+
+
+# --- Patching a compact book (loan book deltas) ---
+
+def _grown(raw, rows):
+    """Copy of raw with room for `rows` rows (extra rows zeroed)."""
+    grown = np.zeros((rows,) + raw.shape[1:], dtype=raw.dtype)
+    grown[:len(raw)] = raw
+    return grown
+
+
+def _patch_encoded(raw, missing, spec, positions, values, rows):
+    """(arrays, spec) for column `raw` with `values` written at `positions` in its current encoding, or None
+    when a value doesn't fit it (the caller then re-encodes the whole column)."""
+    encoding = spec['encoding']
+    spec = dict(spec)
+    if encoding == 'int':
+        if values.dtype.kind not in 'iu':
+            return None
+        info = np.iinfo(spec['dtype'])
+        if len(values) and (values.min() < info.min or values.max() > info.max):
+            return None
+        column = _grown(raw, rows)
+        column[positions] = values
+        return {'': column}, spec
+
+    if encoding in ('float', 'numeric_or_label'):
+        if encoding == 'float':
+            if values.dtype.kind not in 'iuf':
+                return None
+            floats = values.astype(np.float64)
+        else:
+            numeric = np.array([isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in values], dtype=bool)
+            if not all(v == spec['label'] for v in values[~numeric]):
+                return None
+            if spec['python_type'] == 'int' and not all(isinstance(v, (int, np.integer)) for v in values[numeric]):
+                return None
+            floats = np.where(numeric, values, np.nan).astype(np.float64)
+        if spec['dtype'] == 'float32' and not _float32_is_lossless(floats):
+            return None
+        column = _grown(raw, rows)
+        column[positions] = floats.astype(column.dtype)
+        return {'': column}, spec
+
+    if encoding == 'uuid':
+        if not all(_is_canonical_uuid(v) for v in values):
+            return None
+        column = _grown(raw, rows)
+        if len(values):
+            column[positions] = np.frombuffer(b''.join(uuid.UUID(v).bytes for v in values), dtype=np.uint8).reshape(-1, 16)
+        return {'': column}, spec
+
+    if encoding == 'category':
+        categories = list(spec['categories'])
+        code_for = {category: code for code, category in enumerate(categories)}
+        codes = []
+        for value in values:
+            if _is_missing(value):
+                codes.append(-1)
+                continue
+            value = str(value)
+            if value not in code_for:
+                code_for[value] = len(categories)
+                categories.append(value)
+            codes.append(code_for[value])
+        if len(categories) > rows // 2 or len(categories) - 1 > np.iinfo(spec['dtype']).max:
+            return None
+        column = _grown(raw, rows)
+        column[positions] = codes
+        spec['categories'] = categories
+        return {'': column}, spec
+
+    is_missing = np.array([_is_missing(v) for v in values], dtype=bool)
+    encoded = np.array([b'' if m else str(v).encode('utf-8') for v, m in zip(values, is_missing)], dtype=bytes)
+    column = _grown(raw, rows)
+    if encoded.dtype.itemsize > column.dtype.itemsize:
+        column = column.astype(encoded.dtype)
+    column[positions] = encoded
+    arrays = {'': column}
+    if missing is not None or is_missing.any():
+        mask = _grown(missing, rows) if missing is not None else np.zeros(rows, dtype=bool)
+        mask[positions] = is_missing
+        arrays['.missing'] = mask
+    return arrays, spec
+
+
+def patch_compact_book(book, positions, rows, directory):
+    """Writes `book` with `rows` (a cleaned DataFrame with the book's columns, aligned with `positions`) as a
+    new compact directory. Positions at or past the end of the book append rows, in order.
+
+    Columns are copied and patched in their encoded form, so a small delta costs a copy of the column
+    files rather than a decode of the whole book; only a column whose new values don't fit its encoding
+    (e.g. a wider integer range) is decoded and re-encoded whole, with the same result write_compact_book
+    would give.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    total = max(len(book), int(positions.max()) + 1 if len(positions) else 0)
+
+    def columns():
+        for name in book.columns:
+            values = rows[name].to_numpy()
+            patched = _patch_encoded(book._arrays[name], book._missing.get(name), book._specs[name], positions, values, total)
+            if patched is None:
+                current = book.frame_column(name)
+                dtype = current.dtype if current.dtype == values.dtype else np.dtype(object)
+                if {current.dtype.kind, values.dtype.kind} <= set('iu'):
+                    dtype = np.dtype(np.int64)
+                elif {current.dtype.kind, values.dtype.kind} <= set('iuf'):
+                    dtype = np.dtype(np.float64)
+                column = np.empty(total, dtype=dtype)
+                column[:len(current)] = current
+                column[positions] = values
+                patched = encode_column(pd.Series(column))
+            yield (name, *patched)
+
+    _write_columns(directory, total, columns())
+
+
+class CompactLoanBook:
+    """Read-only loan book over a memory-mapped column directory written by write_compact_book()."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') != COMPACT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported compact loan book format {manifest.get('format_version')} in '{directory}'.")
+        self._rows = manifest['rows']
+        self._specs = {spec['name']: spec for spec in manifest['columns']}
+        self.columns = [spec['name'] for spec in manifest['columns']]
+        self._arrays = {}
+        self._missing = {}
+        for name, spec in self._specs.items():
+            path = os.path.join(directory, spec['file'])
+            self._arrays[name] = np.load(path + '.npy', mmap_mode='r', allow_pickle=False)
+            if os.path.exists(path + '.missing.npy'):
+                self._missing[name] = np.load(path + '.missing.npy', mmap_mode='r', allow_pickle=False)
+
+    def __len__(self):
+        return self._rows
+
+    def __contains__(self, position):
+        return isinstance(position, (int, np.integer)) and 0 <= position < self._rows
+
+    def record(self, position):
+        """The row as a dict of Python values, equal to the FrameLoanBook record for the same data."""
+        return {name: self.value(position, name) for name in self.columns}
+
+    def value(self, position, column):
+        spec = self._specs[column]
+        raw = self._arrays[column][position]
+        encoding = spec['encoding']
+        if encoding == 'int':
+            return int(raw)
+        if encoding == 'float':
+            return self._decode_float(raw, spec)
+        if encoding == 'numeric_or_label':
+            if np.isnan(raw):
+                return spec['label']
+            number = self._decode_float(raw, spec)
+            return int(number) if spec['python_type'] == 'int' else number
+        if encoding == 'uuid':
+            return str(uuid.UUID(bytes=raw.tobytes()))
+        if encoding == 'category':
+            return float('nan') if raw < 0 else spec['categories'][raw]
+        if column in self._missing and self._missing[column][position]:
+            return float('nan')
+        return raw.decode('utf-8')
+
+    @staticmethod
+    def _decode_float(raw, spec):
+        # float32 values were only chosen when their shortest repr is the original float64 value.
+        return float(str(raw)) if spec['dtype'] == 'float32' else float(raw)
+
+    def column(self, column):
+        """Whole column: the memory-mapped array for numeric columns, decoded Python values for text."""
+        spec = self._specs[column]
+        raw = self._arrays[column]
+        encoding = spec['encoding']
+        if encoding in ('int', 'float', 'numeric_or_label'):
+            return raw
+        if encoding == 'uuid':
+            return np.array([str(uuid.UUID(bytes=row.tobytes())) for row in raw], dtype=object)
+        if encoding == 'category':
+            lookup = np.array(spec['categories'] + [float('nan')], dtype=object)  # Code -1 -> NaN slot
+            return lookup[np.asarray(raw, dtype=np.int64)]
+        values = np.array([v.decode('utf-8') for v in raw], dtype=object)
+        if column in self._missing:
+            values[np.asarray(self._missing[column])] = float('nan')
+        return values
+
+    def frame_column(self, name):
+        """One column decoded to the values and dtype FrameLoanBook would hold."""
+        spec = self._specs[name]
+        raw = self._arrays[name]
+        if spec['encoding'] == 'int':
+            return np.asarray(raw, dtype=np.int64)
+        if spec['encoding'] == 'float':
+            return self._exact_floats(raw, spec)
+        if spec['encoding'] == 'numeric_or_label':
+            floats = self._exact_floats(raw, spec)
+            missing = np.isnan(floats)
+            values = floats.astype(object)
+            if spec['python_type'] == 'int':
+                values[~missing] = floats[~missing].astype(np.int64).astype(object)
+            values[missing] = spec['label']
+            return values
+        return self.column(name)
+
+    def to_frame(self):
+        """Decodes the whole book into the DataFrame FrameLoanBook would hold."""
+        return pd.DataFrame({name: self.frame_column(name) for name in self.columns}, columns=self.columns)
+
+    @staticmethod
+    def _exact_floats(raw, spec):
+        return np.asarray(raw).astype(str).astype(np.float64) if spec['dtype'] == 'float32' else np.array(raw, dtype=np.float64)
+
+    def memory_bytes(self):
+        """Bytes of mapped column data (shared between processes, not per worker)."""
+        return int(sum(a.nbytes for a in self._arrays.values()) + sum(m.nbytes for m in self._missing.values()))
+
+
+# --- Public entry point ---
+
+def compact_dir_for(csv_path, source_hash, cache_dir=DEFAULT_CACHE_DIR):
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_dir, f'{stem}-compact-v{COMPACT_FORMAT_VERSION}-{source_hash[:16]}')
+
+
+def load_compact_loan_book(csv_path, cache_dir=DEFAULT_CACHE_DIR):
+    """Returns (CompactLoanBook, source_hash), writing the compact directory first if it is missing."""
+    source_hash = file_sha256(csv_path)
+    directory = compact_dir_for(csv_path, source_hash, cache_dir)
+    if not os.path.isdir(directory):
+        started = time.perf_counter()
+        df, _ = load_loan_book(csv_path, cache_dir=cache_dir, use_cache=False)
+        write_compact_book(df, directory)
+        del df
+        logging.info("Wrote compact loan book '%s' in %.1f ms.", directory, (time.perf_counter() - started) * 1000)
+    book = CompactLoanBook(directory)
+    logging.info("Memory-mapped compact loan book '%s' (%s rows, %.1f MB shared).", directory, len(book), book.memory_bytes() / 1e6)
+    return book, source_hash
@@ -0,0 +1,259 @@
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from customer_index import CustomerIndex
+from data_loader import DEFAULT_CACHE_DIR, DELTA_KEY_COLUMN, apply_loan_book_delta, file_sha256, load_loan_book
+from loan_book import (CompactLoanBook, FrameLoanBook, compact_dir_for, load_compact_loan_book, patch_compact_book,
+                       write_compact_book)
+
+# --- Loan book snapshots and hot reload ---
+# A LoanBookSnapshot bundles an immutable loan book with its lookup index and a version string. Request
+# handlers read the current snapshot once and use it for the whole request. LoanBookReloader builds new
+# snapshots on a daemon thread, off the request path, and swaps them in with a single reference assignment.
+#
+#   * Full reload: the CSV's (mtime, size) changed and stayed the same for one poll. The new file
+#     supersedes every delta seen so far.
+#   * Deltas: new *.csv files in the delta directory, applied in file name order with
+#     data_loader.apply_loan_book_delta (only the delta is parsed). Write delta files elsewhere and rename
+#     them into the directory so a half-written file is never picked up. The customer index is patched for
+#     the changed rows only; with compact storage only the changed rows are decoded, and the new version's
+#     column files are copies of the old ones with those rows re-encoded (see loan_book.patch_compact_book).
+#
+# Conversations reference customers by Loan ID, which is stable across snapshots, and resolve it to a
+# row position in whichever snapshot serves the turn.
+#
+# With compact storage each new version gets its own directory; superseded ones are left on disk for the
+# operator to prune, since other worker processes may still have them mapped.
+
+
+class LoanBookSnapshot:
+    """An immutable loan book plus its customer index; `version` keys caches of derived data.
+    `parent_version` is set when the snapshot was built from that version by a delta, which only updates
+    rows in place and appends new ones, so row positions of the parent are still valid."""
+
+    def __init__(self, book, index, version, parent_version=None):
+        self.book = book
+        self.index = index
+        self.version = version
+        self.parent_version = parent_version
+
+    def position_for(self, loan_id):
+        """Row position of loan_id in this snapshot, or None if the loan is not in it."""
+        if not loan_id:
+            return None
+        positions = self.index.by_loan_id(loan_id)
+        return positions[0] if positions else None
+
+    def frame(self):
+        """The cleaned DataFrame for this snapshot (decoded from the columns for compact storage)."""
+        return self.book.frame if isinstance(self.book, FrameLoanBook) else self.book.to_frame()
+
+
+def _index_for(book):
+    if isinstance(book, CompactLoanBook):
+        # Saved next to the column files and memory-mapped, so worker processes share it.
+        index_dir = os.path.join(book.directory, 'customer_index')
+        if not os.path.isdir(index_dir):
+            CustomerIndex.from_loan_book(book).save(index_dir)
+        return CustomerIndex.load(index_dir)
+    return CustomerIndex.from_loan_book(book)
+
+
+def load_snapshot(csv_path, storage='frame', cache_dir=DEFAULT_CACHE_DIR, use_cache=True):
+    """Full load of csv_path (through the binary caches) into a new snapshot."""
+    if storage == 'compact':
+        book, source_hash = load_compact_loan_book(csv_path, cache_dir=cache_dir)
+    else:
+        df, source_hash = load_loan_book(csv_path, cache_dir=cache_dir, use_cache=use_cache)
+        book = FrameLoanBook(df)
+    return LoanBookSnapshot(book, _index_for(book), source_hash[:16])
+
+
+def snapshot_from_frame(frame, version, csv_path, storage='frame', cache_dir=DEFAULT_CACHE_DIR, parent_version=None):
+    if storage == 'compact':
+        directory = compact_dir_for(csv_path, version, cache_dir)
+        if not os.path.isdir(directory):
+            write_compact_book(frame, directory)
+        book = CompactLoanBook(directory)
+    else:
+        book = FrameLoanBook(frame)
+    return LoanBookSnapshot(book, _index_for(book), version, parent_version)
+
+
+def _delta_positions(snapshot, delta):
+    """Row positions the delta updates: the first row with each of its Loan IDs, in ascending order."""
+    positions = set()
+    for loan_id in delta[DELTA_KEY_COLUMN].dropna().unique():
+        position = snapshot.position_for(loan_id)
+        if position is not None and snapshot.book.value(position, DELTA_KEY_COLUMN) == loan_id:
+            positions.add(position)
+    return np.array(sorted(positions), dtype=np.int64)
+
+
+def _updated_index(index, positions, rows):
+    def column(name):
+        return rows[name].tolist() if name in rows.columns else None
+
+    names = column('Random_Name')
+    return index.updated(positions, names if names is not None else [], loan_ids=column('Loan ID'),
+                         customer_ids=column('Customer ID'), phones=column('Random_Phone_Number'))
+
+
+def snapshot_with_delta(snapshot, delta, version, csv_path, storage='frame', cache_dir=DEFAULT_CACHE_DIR):
+    """Returns (new snapshot, updated rows, appended rows) for a raw delta frame applied to snapshot."""
+    book = snapshot.book
+    updated_positions = _delta_positions(snapshot, delta)
+    if isinstance(book, CompactLoanBook):
+        # Decode only the rows the delta updates, then patch the encoded columns.
+        base = pd.DataFrame({name: [book.value(int(p), name) for p in updated_positions] for name in book.columns},
+                            columns=book.columns)
+        rows, updated, appended = apply_loan_book_delta(base, delta)
+        positions = np.concatenate([updated_positions, np.arange(len(book), len(book) + appended)])
+        directory = compact_dir_for(csv_path, version, cache_dir)
+        if not os.path.isdir(directory):
+            patch_compact_book(book, positions, rows, directory)
+        new_book = CompactLoanBook(directory)
+        index_dir = os.path.join(directory, 'customer_index')
+        if not os.path.isdir(index_dir):
+            _updated_index(snapshot.index, positions, rows).save(index_dir)
+        index = CustomerIndex.load(index_dir)
+    else:
+        frame, updated, appended = apply_loan_book_delta(snapshot.frame(), delta)
+        positions = np.concatenate([updated_positions, np.arange(len(book), len(book) + appended)])
+        new_book = FrameLoanBook(frame)
+        index = _updated_index(snapshot.index, positions, frame.iloc[positions])
+    return LoanBookSnapshot(new_book, index, version, snapshot.version), updated, appended
+
+
+class LoanBookReloader:
+    """Watches the loan book CSV and a delta directory, swapping in new snapshots as they are built."""
+
+    def __init__(self, snapshot, csv_path, storage='frame', cache_dir=DEFAULT_CACHE_DIR, use_cache=True,
+                 delta_dir=None, poll_seconds=30.0, on_swap=None):
+        self._snapshot = snapshot
+        self.csv_path = csv_path
+        self.storage = storage
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self.delta_dir = delta_dir
+        self.poll_seconds = poll_seconds
+        self.on_swap = on_swap
+        self._loaded_signature = self._signature(csv_path)
+        self._last_seen_signature = self._loaded_signature
+        self._applied_deltas = set()
+        self._lock = threading.Lock() # One rebuild at a time
+        self._stop = threading.Event()
+        self._thread = None
+        self.full_reloads = 0
+        self.deltas_applied = 0
+        self.failures = 0
+        self.last_swap_at = None
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    @staticmethod
+    def _signature(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='loan-book-reloader', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            try:
+                self.check_now()
+            except Exception as e:
+                logging.error("Loan book reloader poll failed: %s", e)
+            if self._stop.wait(self.poll_seconds):
+                return
+
+    def check_now(self):
+        """Runs one poll: full reload if the CSV changed, then any new deltas. Returns True if it swapped."""
+        with self._lock:
+            swapped = self._reload_if_changed()
+            for path in self._pending_deltas():
+                swapped = self._apply_delta(path) or swapped
+            return swapped
+
+    def _reload_if_changed(self):
+        signature = self._signature(self.csv_path)
+        settled = signature == self._last_seen_signature
+        self._last_seen_signature = signature
+        if signature is None or signature == self._loaded_signature or not settled:
+            return False
+
+        superseded = set(self._delta_files())
+        try:
+            started = time.perf_counter()
+            snapshot = load_snapshot(self.csv_path, self.storage, self.cache_dir, self.use_cache)
+        except Exception as e:
+            self.failures += 1
+            logging.error("Full reload of '%s' failed; still serving version %s: %s", self.csv_path, self._snapshot.version, e)
+            return False
+        self._loaded_signature = signature
+        self._applied_deltas |= superseded
+        self.full_reloads += 1
+        self._swap(snapshot, f"full reload of '{self.csv_path}' in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return True
+
+    def _delta_files(self):
+        if not self.delta_dir:
+            return []
+        return sorted(glob.glob(os.path.join(self.delta_dir, '*.csv')))
+
+    def _pending_deltas(self):
+        return [path for path in self._delta_files() if path not in self._applied_deltas]
+
+    def _apply_delta(self, path):
+        self._applied_deltas.add(path) # A bad delta is logged once, not retried every poll
+        try:
+            started = time.perf_counter()
+            version = hashlib.sha256(f'{self._snapshot.version}:{file_sha256(path)}'.encode('utf-8')).hexdigest()[:16]
+            snapshot, updated, appended = snapshot_with_delta(self._snapshot, pd.read_csv(path), version, self.csv_path,
+                                                              self.storage, self.cache_dir)
+        except Exception as e:
+            self.failures += 1
+            logging.error("Could not apply loan book delta '%s'; still serving version %s: %s", path, self._snapshot.version, e)
+            return False
+        self.deltas_applied += 1
+        self._swap(snapshot, f"delta '{os.path.basename(path)}' ({updated} updated, {appended} appended) "
+                             f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return True
+
+    def _swap(self, snapshot, reason):
+        previous = self._snapshot
+        self._snapshot = snapshot
+        self.last_swap_at = time.time()
+        logging.info("Loan book version %s -> %s (%s rows) after %s.", previous.version, snapshot.version, len(snapshot.book), reason)
+        if self.on_swap is not None:
+            self.on_swap(previous, snapshot)
+
+    def stats(self):
+        return {
+            'version': self._snapshot.version,
+            'rows': len(self._snapshot.book),
+            'full_reloads': self.full_reloads,
+            'deltas_applied': self.deltas_applied,
+            'failures': self.failures,
+            'last_swap_at': self.last_swap_at,
+        }
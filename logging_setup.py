@@ -0,0 +1,218 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import multiprocessing.util
+import os
+import queue
+import random
+import re
+import sys
+
+# --- Non-blocking structured logging ---
+# Request threads never write to a file or console themselves: the root logger has a single QueueHandler
+# that puts records on a bounded in-memory queue, and a QueueListener thread formats them and writes them
+# to the sinks (stderr, plus LOG_FILE when set). When the queue is full, records are dropped and counted
+# rather than stalling the request. Messages use %-style arguments, so a disabled level costs one level
+# check, and records whose arguments are plain values are only formatted on the listener thread.
+#
+# LOG_FORMAT=json writes one JSON object per record with the session ID, trace ID and route of the request
+# that logged it (see configure_logging's `context`), plus any timings passed in `extra`.
+#
+# Session and conversation dumps go through log_dump(): they are sampled (LOG_DUMP_SAMPLE_RATE) and
+# truncated (LOG_DUMP_MAX_TURNS, LOG_DUMP_MAX_STRING, LOG_DUMP_MAX_CHARS), so their cost does not grow
+# with the length of a call.
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+STRUCTURED_FIELDS = ('session_id', 'trace_id', 'route', 'status', 'elapsed_ms', 'timings_ms', 'fields')
+SESSION_PREFIX = re.compile(r'^Session (\S+?):')
+_PLAIN_TYPES = (str, int, float, bool, type(None))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, structured fields and any exception."""
+
+    def format(self, record):
+        message = record.getMessage()
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': message,
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if 'session_id' not in entry:
+            match = SESSION_PREFIX.match(message)  # Logged outside a request context (e.g. ASGI streams)
+            if match:
+                entry['session_id'] = match.group(1)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Adds the fields returned by `context()` (e.g. the current request's session ID) to each record,
+    on the thread that logs it."""
+
+    def __init__(self, context):
+        super().__init__()
+        self.context = context
+
+    def filter(self, record):
+        try:
+            fields = self.context()
+        except Exception:
+            fields = None
+        for name, value in (fields or {}).items():
+            if getattr(record, name, None) is None:
+                setattr(record, name, value)
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records when the queue is full and defers formatting of
+    records whose arguments are plain values to the listener thread."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        args = record.args
+        values = args.values() if isinstance(args, dict) else (args or ())
+        if not all(isinstance(value, _PLAIN_TYPES) for value in values):
+            # Mutable arguments may change before the listener gets to them: format now.
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None  # Tracebacks hold frames; keep only the text
+        return record
+
+
+class DumpPolicy:
+    """Sampling and truncation for session/conversation dumps."""
+
+    def __init__(self, sample_rate=0.01, max_turns=4, max_string=200, max_chars=2000):
+        self.sample_rate = sample_rate
+        self.max_turns = max_turns
+        self.max_string = max_string
+        self.max_chars = max_chars
+
+    def sampled(self):
+        return self.sample_rate >= 1 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def _trim(self, value):
+        if isinstance(value, dict):
+            return {key: self._trim(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            items = [self._trim(item) for item in value[-self.max_turns:]]
+            if len(value) > self.max_turns:
+                items.insert(0, f'... {len(value) - self.max_turns} earlier items')
+            return items
+        if isinstance(value, str) and len(value) > self.max_string:
+            return f'{value[:self.max_string]}... ({len(value)} chars)'
+        return value
+
+    def render(self, value):
+        text = json.dumps(self._trim(dict(value) if hasattr(value, 'keys') else value), ensure_ascii=False, default=str)
+        if len(text) > self.max_chars:
+            text = f'{text[:self.max_chars]}... ({len(text)} chars)'
+        return text
+
+
+dump_policy = DumpPolicy()
+_listener = None
+_handler = None
+_context = None
+
+
+def log_dump(label, value, session_id=None, level=logging.INFO):
+    """Logs `[Session <id>: ]label: <value as truncated JSON>` for a sampled share of calls; nearly free
+    when not sampled."""
+    if not logging.getLogger().isEnabledFor(level) or not dump_policy.sampled():
+        return
+    if session_id is None:
+        logging.log(level, '%s: %s', label, dump_policy.render(value))
+    else:
+        logging.log(level, 'Session %s: %s: %s', session_id, label, dump_policy.render(value))
+
+
+def configure_logging(context=None):
+    """Installs the queue handler on the root logger and starts the listener thread (once per process).
+    `context` is called on the logging thread and returns extra record fields, or None."""
+    global _listener, _handler, _context
+    if _listener is not None:
+        return _handler
+    _context = context
+    level = os.getenv('LOG_LEVEL', 'INFO').upper()
+    formatter = JsonFormatter() if os.getenv('LOG_FORMAT', 'text').lower() == 'json' else logging.Formatter(TEXT_FORMAT)
+    sinks = [logging.StreamHandler(sys.stderr)]
+    if os.getenv('LOG_FILE'):
+        sinks.append(logging.handlers.WatchedFileHandler(os.getenv('LOG_FILE'), encoding='utf-8'))  # Reopens after logrotate
+    for sink in sinks:
+        sink.setFormatter(formatter)
+
+    dump_policy.sample_rate = float(os.getenv('LOG_DUMP_SAMPLE_RATE', '0.01'))
+    dump_policy.max_turns = int(os.getenv('LOG_DUMP_MAX_TURNS', '4'))
+    dump_policy.max_string = int(os.getenv('LOG_DUMP_MAX_STRING', '200'))
+    dump_policy.max_chars = int(os.getenv('LOG_DUMP_MAX_CHARS', '2000'))
+
+    _handler = NonBlockingQueueHandler(queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000'))))
+    if context is not None:
+        _handler.addFilter(ContextFilter(context))
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(_handler.queue, *sinks, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+    return _handler
+
+
+def _stop_listener():
+    """Writes out whatever is still queued and stops the listener thread."""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def _restart_after_fork():
+    """A forked child (pre-fork server worker, ProcessPoolExecutor worker) inherits the queue handler but
+    not the listener thread, so its records would be queued and never written: give it its own."""
+    global _listener, _handler
+    if _listener is None:
+        return
+    _listener = _handler = None
+    configure_logging(_context)
+    # multiprocessing children leave through os._exit, which skips atexit; its finalizers still run.
+    multiprocessing.util.register_after_fork(_stop_listener, _register_exit_flush)
+
+
+def _register_exit_flush(stop):
+    multiprocessing.util.Finalize(None, stop, exitpriority=0)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def logging_stats():
+    if _handler is None:
+        return None
+    return {'queued': _handler.queue.qsize(), 'dropped': _handler.dropped, 'dump_sample_rate': dump_policy.sample_rate}
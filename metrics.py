@@ -0,0 +1,209 @@
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# --- Request metrics in the Prometheus text format ---
+# A small, dependency-free registry of counters, histograms and callback gauges, rendered by the /metrics
+# route in the Prometheus exposition format (version 0.0.4). Histograms are cumulative per label set, so
+# they can be scraped by Prometheus or read by eye. RequestTrace times the stages of one request into a
+# stage histogram and keeps the per-request breakdown for the trace log line.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+COUNT_BUCKETS = (0, 1, 2, 4, 6, 8, 12, 16, 24, 32, 48, 64)
+
+TRACE_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labelvalues, value in values:
+            yield f'{self.name}_total{format_labels(self.labelnames, labelvalues)} {_format_value(value)}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # labelvalues -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labelvalues):
+        series = self._series.get(labelvalues)
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            snapshot = sorted((labelvalues, (list(s[0]), s[1], s[2])) for labelvalues, s in self._series.items())
+        for labelvalues, (bucket_counts, total, count) in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                labels = format_labels(self.labelnames, labelvalues, extra=[('le', _format_value(bound))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = format_labels(self.labelnames, labelvalues)
+            yield f'{self.name}_sum{labels} {_format_value(round(total, 6))}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+class CallbackGauge:
+    """Gauge whose samples are read at scrape time: collect() returns a number, None, or
+    a list of (labelvalues, value) pairs."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, collect, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        collected = self.collect()
+        if collected is None:
+            return
+        if not isinstance(collected, (list, tuple)):
+            collected = [((), collected)]
+        for labelvalues, value in collected:
+            if value is not None:
+                yield f'{self.name}{format_labels(self.labelnames, labelvalues)} {_format_value(value)}'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+        return self._register(Histogram(name, documentation, buckets, labelnames))
+
+    def gauge(self, name, documentation, collect, labelnames=()):
+        return self._register(CallbackGauge(name, documentation, collect, labelnames))
+
+    def stats_gauge(self, name, documentation, stats):
+        """Exposes every numeric entry of a stats() dict (e.g. DossierCache.stats) under a `stat` label.
+        stats() may return None when the component is disabled."""
+        def collect():
+            return [((key,), value) for key, value in (stats() or {}).items()
+                    if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        return self.gauge(name, documentation, collect, labelnames=('stat',))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            try:
+                lines.extend(metric.samples())
+            except Exception as e:  # A failing gauge callback must not break the scrape
+                lines.append(f'# {metric.name} unavailable: {_escape(e)}')
+        return '\n'.join(lines) + '\n'
+
+
+# --- Per-request tracing ---
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+def accept_trace_id(header_value):
+    """The caller's trace ID if it is safe to echo and log, otherwise a fresh one."""
+    if header_value and TRACE_ID_PATTERN.match(header_value):
+        return header_value
+    return new_trace_id()
+
+
+class RequestTrace:
+    """Stage timings for one request; each span is also observed into `stage_histogram` (route, stage)."""
+
+    def __init__(self, trace_id, route, stage_histogram=None):
+        self.trace_id = trace_id
+        self.route = route
+        self.stage_histogram = stage_histogram
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.fields = {}
+
+    @contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def record(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        if self.stage_histogram is not None:
+            self.stage_histogram.observe(seconds, self.route, stage)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        """One-line breakdown for the log: stage timings in ms, then extra fields."""
+        parts = [f'{stage}={seconds * 1000:.1f}ms' for stage, seconds in self.stages.items()]
+        parts += [f'{name}={value}' for name, value in self.fields.items()]
+        return ' '.join(parts)
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# --- Prepared opening turns ---
+# The first reply of every call is the same structured opening (name, Apex Financial Services, overdue
+# amount), so it can be prepared before the customer speaks: speculatively when /find_customer locates the
+# customer (a background model call, or a local template filled from the dossier), or in bulk for a known
+# call list (pregenerate_openings.py). Openings are keyed by a hash of the full prompt prefix (instruction +
+# dossier), so a changed prompt or changed customer data never serves a stale opening.
+
+OPENING_PROBE_TEXT = "Hello?"  # The customer turn a prepared opening answers
+MAX_OPENING_INPUT_WORDS = 4
+# A greeting is made only of these phrases ("Hello?", "Yes, speaking", "Hi, this is Maria, who's calling?").
+# Anything else in the first words ("Yes but I already paid", "I lost my job") goes to the model.
+_GREETING_PHRASE = (r"(hello|hi|hey|hiya|yes|yeah|yep|yup|speaking|hello there|hi there|this is \w+|\w+ speaking|"
+                    r"\w+ here|who is (this|it|calling)|who'?s (this|it|calling)|good (morning|afternoon|evening)|sorry)")
+GREETING_PATTERN = re.compile(rf"^\W*{_GREETING_PHRASE}(\W+{_GREETING_PHRASE})*\W*$", re.IGNORECASE)
+
+OPENING_TEMPLATES = (
+    "Hello {name}, this is Alex from Apex Financial Services. Thanks for taking my call. I'm calling about your loan "
+    "account, which currently shows an overdue balance of {amount}. I'd like to help you find the best way to take "
+    "care of that today, or set up a payment plan that works for you. Could we talk through that now?",
+    "Hi {name}, Jamie here from Apex Financial Services. I'm reaching out about your loan account, which has an "
+    "overdue balance of {amount}. Let's see if we can get that resolved today or find a realistic plan together. "
+    "What would work best for you?",
+    "Hello {name}, this is Sam with Apex Financial Services. I'm calling regarding your loan account and its overdue "
+    "balance of {amount}. My goal is to help you find a manageable way to settle it, either today or with a plan we "
+    "set up right now. Would that be okay?",
+)
+
+
+def _completed(text):
+    future = Future()
+    future.set_result(text)
+    return future
+
+
+def is_opening_input(user_text):
+    """True when the customer's first words are a short, plain greeting the structured opening answers."""
+    text = (user_text or '').strip()
+    return bool(text) and len(text.split()) <= MAX_OPENING_INPUT_WORDS and bool(GREETING_PATTERN.match(text))
+
+
+def opening_key(prompt_prefix):
+    return hashlib.sha256(prompt_prefix.encode('utf-8')).hexdigest()[:24]
+
+
+def render_template_opening(loan_id, customer_name, overdue_amount_text):
+    """Local opening; the variant is picked by a stable hash of the Loan ID so calls don't all sound alike."""
+    variant = int(hashlib.md5(str(loan_id).encode('utf-8')).hexdigest(), 16) % len(OPENING_TEMPLATES)
+    return OPENING_TEMPLATES[variant].format(name=customer_name, amount=overdue_amount_text)
+
+
+class OpeningTurnCache:
+    """Prepared openings by opening_key. Speculative entries (futures, bounded LRU) expire after ttl_seconds;
+    openings loaded from a pre-generation file are kept for the life of the process."""
+
+    def __init__(self, max_entries=4096, ttl_seconds=1800, workers=4):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.workers = workers
+        self._entries = OrderedDict()  # key -> (expires_at, future)
+        self._preloaded = {}  # key -> text
+        self._lock = threading.Lock()
+        self._executor = None
+        self.started = 0
+        self.skipped = 0
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def _store(self, key, future):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, future)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _live(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, future = entry
+            if time.monotonic() <= expires_at:
+                return future
+            del self._entries[key]
+        text = self._preloaded.get(key)
+        return _completed(text) if text is not None else None
+
+    def put(self, key, text):
+        self._store(key, _completed(text))
+
+    def start(self, key, generate):
+        """Runs generate() in the background unless an opening for key is already prepared or in flight."""
+        with self._lock:
+            if self._live(key) is not None:
+                self.skipped += 1
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='opening-turn')
+            self.started += 1
+            future = self._executor.submit(generate)
+        self._store(key, future)
+        return True
+
+    def lookup(self, key):
+        """The prepared (possibly still running) opening for key, or None."""
+        with self._lock:
+            future = self._live(key)
+            if future is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return future
+
+    def discard(self, key):
+        """Drops a speculative opening that failed or timed out, so the next lookup can start a fresh one."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self.failures += 1
+
+    def load_file(self, path):
+        """Loads pre-generated openings (JSONL records with "key" and "text"); returns how many were loaded."""
+        loaded = 0
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    key, text = record['key'], record['text']
+                except (ValueError, KeyError):
+                    continue  # Torn last line of a run still in progress, or a failed record
+                with self._lock:
+                    self._preloaded[key] = text
+                loaded += 1
+        logging.info("Loaded %s pre-generated opening turns from '%s'.", loaded, path)
+        return loaded
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = len(self._entries)
+            pending = sum(1 for _, future in self._entries.values() if not future.done())
+        return {
+            'entries': entries,
+            'pending': pending,
+            'preloaded': len(self._preloaded),
+            'started': self.started,
+            'skipped': self.skipped,
+            'hits': self.hits,
+            'misses': self.misses,
+            'failures': self.failures,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
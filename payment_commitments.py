@@ -0,0 +1,172 @@
+import datetime
+import re
+
+# --- Payment commitment extraction ---
+# Turns a call turn into a structured record of what the customer committed to pay: amount, due date and
+# payment method. A turn only counts when the customer accepts ("OK, I can pay $200 on Friday") or the agent
+# confirms an arrangement back ("So that's $250 by Friday with your debit card"), and never when the customer
+# refuses. Amounts the agent merely restates ("your overdue balance of $4,500") are not commitments.
+# Rule-based and cheap, so it can run on every turn in the transcript writer thread.
+
+AMOUNT_PATTERN = re.compile(r'\$\s?(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d{1,2}))?(?!\d)')
+ACCEPTANCE_PATTERN = re.compile(
+    r"\b(i'?ll pay|i will pay|i can pay|i could pay|i can do|i could do|i'?m going to pay|i'?ll make|"
+    r"i will make|i can make|i promise|i agree|agreed|deal|that works|works for me|sounds good|let'?s do|"
+    r"ok(?:ay)?|sure|yes|yeah|yep|fine|go ahead|set (?:it|that|this) up)\b",
+    re.IGNORECASE)
+CONFIRMATION_PATTERN = re.compile(
+    r"\b(so that'?s|that'?s \$|to confirm|confirm(?:ed|ing)|i'?ve (?:scheduled|set up|noted|arranged|recorded)|"
+    r"i have (?:scheduled|set up|noted|arranged|recorded)|you'?ll (?:pay|make)|you will (?:pay|make)|"
+    r"you'?ve agreed|you have agreed|you'?re committing|your payment of \$|(?:is|are) (?:now )?(?:scheduled|set up))",
+    re.IGNORECASE)
+# Words just before an amount that make it a restatement of what is owed rather than a payment.
+BALANCE_CONTEXT_PATTERN = re.compile(r"\b(balance|overdue|owe[ds]?|owing|outstanding|total|arrears|past due)\b[^$.?!]*$",
+                                     re.IGNORECASE)
+NEGATION_PATTERN = re.compile(r"\b(can'?t|cannot|won'?t|unable|not able|refuse\w*|no way)\b", re.IGNORECASE)
+
+PAYMENT_METHODS = (
+    ('debit_card', r'debit card'),
+    ('credit_card', r'credit card'),
+    ('card', r'\bcard\b'),
+    ('bank_transfer', r'bank transfer|wire transfer|\bwire\b|\bach\b|direct debit|bank account'),
+    ('check', r'\bche(?:ck|que)\b'),
+    ('money_order', r'money order'),
+    ('online', r'\bonline\b|website|\bportal\b|\bapp\b'),
+    ('autopay', r'auto-?pay|automatic payments?'),
+    ('cash', r'\bcash\b'),
+)
+PAYMENT_METHOD_PATTERNS = [(method, re.compile(pattern, re.IGNORECASE)) for method, pattern in PAYMENT_METHODS]
+
+INSTALLMENT_PATTERN = re.compile(
+    r'\b(?:a|per|each|every)\s+(week|month|fortnight)\b|\b(weekly|monthly|bi-?weekly|fortnightly)\b', re.IGNORECASE)
+INSTALLMENT_FREQUENCIES = {'week': 'weekly', 'weekly': 'weekly', 'month': 'monthly', 'monthly': 'monthly',
+                           'fortnight': 'biweekly', 'fortnightly': 'biweekly', 'biweekly': 'biweekly',
+                           'bi-weekly': 'biweekly'}
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+MONTHS = ('january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september', 'october',
+          'november', 'december')
+_MONTH = r'(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?'
+_DAY = r'(\d{1,2})(?:st|nd|rd|th)?'
+DATE_PATTERNS = (
+    ('relative', re.compile(r'\b(today|tonight|tomorrow|day after tomorrow|end of (?:the )?(?:week|month)|next week)\b', re.IGNORECASE)),
+    ('weekday', re.compile(r'\b(?:this |next |on |by )?(' + '|'.join(WEEKDAYS) + r')\b', re.IGNORECASE)),
+    ('month_day', re.compile(r'\b' + _MONTH + r'\s+' + _DAY + r'\b', re.IGNORECASE)),
+    ('day_month', re.compile(r'\b' + _DAY + r'\s+(?:of\s+)?' + _MONTH + r'\b', re.IGNORECASE)),
+    ('numeric', re.compile(r'\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b')),
+)
+
+
+def parse_amount(text, skip_balances=False):
+    """First dollar amount in text as a float, or None. With skip_balances, amounts introduced as the
+    balance owed ("your overdue balance is $4,500") are passed over."""
+    for match in AMOUNT_PATTERN.finditer(text or ''):
+        if skip_balances and BALANCE_CONTEXT_PATTERN.search(text[max(0, match.start() - 60):match.start()]):
+            continue
+        whole, cents = match.groups()
+        return float(whole.replace(',', '')) + (float(f'0.{cents:0<2}') if cents else 0.0)
+    return None
+
+
+def _month_number(name):
+    return next(i for i, month in enumerate(MONTHS, 1) if month.startswith(name.lower().rstrip('.')[:3]))
+
+
+def _upcoming(today, month, day):
+    try:
+        candidate = datetime.date(today.year, month, day)
+        return candidate if candidate >= today else datetime.date(today.year + 1, month, day)
+    except ValueError:
+        return None
+
+
+def parse_due_date(text, today):
+    """(date, matched text) for the first due date mentioned in text, resolved against `today`."""
+    for kind, pattern in DATE_PATTERNS:
+        match = pattern.search(text or '')
+        if match is None:
+            continue
+        phrase = match.group(0).strip()
+        if kind == 'relative':
+            word = match.group(1).lower()
+            if word in ('today', 'tonight'):
+                return today, phrase
+            if word == 'tomorrow':
+                return today + datetime.timedelta(days=1), phrase
+            if word == 'day after tomorrow':
+                return today + datetime.timedelta(days=2), phrase
+            if word == 'next week':
+                return today + datetime.timedelta(days=7 - today.weekday()), phrase
+            if word.endswith('week'):
+                return today + datetime.timedelta(days=(4 - today.weekday()) % 7), phrase
+            next_month = (today.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+            return next_month - datetime.timedelta(days=1), phrase
+        if kind == 'weekday':
+            ahead = (WEEKDAYS.index(match.group(1).lower()) - today.weekday()) % 7 or 7  # The coming one
+            return today + datetime.timedelta(days=ahead), phrase
+        if kind == 'month_day':
+            return _upcoming(today, _month_number(match.group(1)), int(match.group(2))), phrase
+        if kind == 'day_month':
+            return _upcoming(today, _month_number(match.group(2)), int(match.group(1))), phrase
+        month, day, year = match.groups()
+        if year:
+            year = int(year) + (2000 if len(year) == 2 else 0)
+            try:
+                return datetime.date(year, int(month), int(day)), phrase
+            except ValueError:
+                return None, phrase
+        return _upcoming(today, int(month), int(day)), phrase
+    return None, None
+
+
+def parse_method(text):
+    for method, pattern in PAYMENT_METHOD_PATTERNS:
+        if pattern.search(text or ''):
+            return method
+    return None
+
+
+def parse_installments(text):
+    match = INSTALLMENT_PATTERN.search(text or '')
+    if match is None:
+        return None
+    return INSTALLMENT_FREQUENCIES[(match.group(1) or match.group(2)).lower()]
+
+
+def extract_commitment(assistant_text, user_text='', at=None):
+    """The payment commitment made in this turn, or None. `at` (date or datetime, default now in UTC) is
+    when the turn happened; relative dates ("Friday", "tomorrow") are resolved against it.
+
+    Returns {'amount', 'due_date' (ISO date or None), 'due_text', 'method', 'installments' ('weekly',
+    'monthly', 'biweekly' or None), 'confidence'}. A turn counts as a commitment when the customer accepts
+    or the agent confirms an arrangement, the customer does not refuse, and an amount other than the balance
+    owed is mentioned."""
+    assistant_text = assistant_text or ''
+    user_text = user_text or ''
+    if NEGATION_PATTERN.search(user_text):
+        return None
+    accepted = bool(ACCEPTANCE_PATTERN.search(user_text))
+    confirmed = bool(CONFIRMATION_PATTERN.search(assistant_text))
+    if not accepted and not confirmed:
+        return None
+    amount = parse_amount(user_text, skip_balances=True)
+    if amount is None and confirmed:
+        amount = parse_amount(assistant_text, skip_balances=True)
+    if amount is None:
+        return None
+    at = at or datetime.datetime.now(datetime.timezone.utc)
+    today = at.date() if isinstance(at, datetime.datetime) else at
+    due_date, due_text = parse_due_date(assistant_text, today) if confirmed else (None, None)
+    if due_text is None:
+        due_date, due_text = parse_due_date(user_text, today)
+    method = (confirmed and parse_method(assistant_text)) or parse_method(user_text)
+    installments = (confirmed and parse_installments(assistant_text)) or parse_installments(user_text)
+    confidence = 0.4 + 0.3 * bool(due_text) + 0.2 * bool(method) + 0.1 * (accepted and confirmed)
+    return {
+        'amount': amount,
+        'due_date': due_date.isoformat() if due_date else None,
+        'due_text': due_text,
+        'method': method,
+        'installments': installments,
+        'confidence': round(confidence, 2),
+    }
@@ -0,0 +1,145 @@
+"""Bulk pre-generation of opening turns for a call list known in advance (e.g. the day's queue).
+
+Each opening is produced with the app's own first-turn prompt (or its local template) and stored with the
+key of its prompt prefix, so the app only serves it while the prompt and the customer's data are unchanged.
+Serve the output with OPENING_TURNS_FILE=<out>. The output is also the checkpoint: it is flushed as openings
+finish, and --resume skips loans already written. Failed openings are logged but not written, so a resumed
+run retries them. Model calls go through the app's model call pool, so transient errors are retried.
+
+Usage:
+    python pregenerate_openings.py --out openings/today.jsonl --queue todays_calls.csv
+    python pregenerate_openings.py --out openings/today.jsonl --queue todays_calls.csv --backend gemini --rate 2 --workers 4
+    python pregenerate_openings.py --out openings/today.jsonl --limit 500 --mode template
+    python pregenerate_openings.py --out openings/today.jsonl --queue todays_calls.csv --resume
+
+A --queue file is a CSV with a 'Loan ID' column, a JSONL file with a "loan_id" per line, or plain text with
+one Loan ID per line. Without --queue, the first --limit loans of the book (default: all) are used.
+"""
+import argparse
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+
+import pandas as pd
+
+from campaign_runner import completed_request_ids
+from rate_limit import TokenBucket
+
+
+def read_queue(path):
+    if path.endswith('.csv'):
+        return [str(loan_id) for loan_id in pd.read_csv(path, usecols=['Loan ID'])['Loan ID'].dropna()]
+    loan_ids = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                loan_ids.append(str(json.loads(line)['loan_id']) if line.startswith('{') else line)
+    return loan_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', required=True, help='Openings JSONL to write (also the resume checkpoint)')
+    parser.add_argument('--queue', help='Call list: CSV with a Loan ID column, JSONL with loan_id, or one Loan ID per line')
+    parser.add_argument('--limit', type=int, help='Without --queue: only the first N loans of the book')
+    parser.add_argument('--mode', choices=['llm', 'template'], default='llm', help='Model-generated or local template openings')
+    parser.add_argument('--backend', choices=['fake', 'gemini'], default='fake', help='Model backend (default: local fake model)')
+    parser.add_argument('--fake-latency', type=float, default=0.0, help='Simulated seconds per fake model call')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent model calls')
+    parser.add_argument('--rate', type=float, default=0.0, help='Max model calls per second (0 = unlimited)')
+    parser.add_argument('--burst', type=float, default=0.0, help='Token bucket capacity (default: one second of --rate)')
+    parser.add_argument('--resume', action='store_true', help='Skip loans already present in --out')
+    parser.add_argument('--verbose', action='store_true', help="Keep the app's INFO logging")
+    args = parser.parse_args()
+
+    os.environ['LLM_BACKEND'] = args.backend
+    os.environ.setdefault('FAKE_LLM_LATENCY_SECONDS', str(args.fake_latency))
+    os.environ.setdefault('LOAN_BOOK_RELOAD_SECONDS', '0')
+    os.environ['OPENING_TURN_MODE'] = 'off' # This process generates openings itself; it never serves them
+    os.environ.setdefault('TRANSCRIPT_STORE', 'off')
+    os.environ.setdefault('LLM_MAX_CONCURRENCY', str(args.workers)) # One pool slot per worker: never "please hold"
+    import app as loan_app
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    snapshot = loan_app.loan_book_snapshot
+    if snapshot is None:
+        sys.exit("Loan book could not be loaded.")
+    if args.mode == 'llm' and loan_app.llm_pool is None:
+        sys.exit("No model available (check GEMINI_API_KEY, use --backend fake or --mode template).")
+
+    done = completed_request_ids(args.out) if args.resume else set()
+    if not args.resume and os.path.exists(args.out) and os.path.getsize(args.out):
+        sys.exit(f"'{args.out}' already exists; pass --resume to continue it or choose another --out.")
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+
+    if args.queue:
+        loan_ids = read_queue(args.queue)
+    else:
+        count = len(snapshot.book) if args.limit is None else min(args.limit, len(snapshot.book))
+        loan_ids = [snapshot.book.value(position, 'Loan ID') for position in range(count)]
+    loan_ids = [loan_id for loan_id in dict.fromkeys(loan_ids) if loan_id not in done]
+
+    bucket = TokenBucket(args.rate, capacity=args.burst or None)
+    prompt_version = hashlib.sha256(loan_app.core_system_instruction.encode('utf-8')).hexdigest()[:12]
+
+    def generate(loan_id):
+        position = snapshot.position_for(loan_id)
+        if position is None:
+            logging.warning("Opening for Loan ID %s skipped: loan_id not found.", loan_id)
+            return None
+        if args.mode == 'llm':
+            bucket.acquire()
+        try:
+            key, text = loan_app.generate_opening_turn(snapshot, position, args.mode, loan_app.llm_pool.generate if loan_app.llm_pool else None)
+        except Exception as e:
+            logging.warning("Opening for Loan ID %s failed: %s", loan_id, e)
+            return None
+        return {
+            'request_id': loan_id,
+            'loan_id': loan_id,
+            'customer_name': snapshot.book.value(position, 'Random_Name'),
+            'key': key,
+            'text': text,
+            'source': args.mode,
+            'prompt_version': prompt_version,
+            'loan_book_version': snapshot.version,
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        }
+
+    started = time.perf_counter()
+    written = errors = 0
+    window = args.workers * 4 # Bounded number of submitted loans, so huge queues don't sit in memory
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='opening') as executor, \
+            open(args.out, 'a') as out:
+        def write_finished(futures):
+            nonlocal written, errors
+            for future in futures:
+                record = future.result()
+                if record is None:
+                    errors += 1 # Not checkpointed, so --resume retries it
+                    continue
+                out.write(json.dumps(record) + '\n')
+                written += 1
+            out.flush()
+
+        in_flight = set()
+        for loan_id in loan_ids:
+            if len(in_flight) >= window:
+                finished, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                write_finished(finished)
+            in_flight.add(executor.submit(generate, loan_id))
+        write_finished(concurrent.futures.wait(in_flight).done)
+
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {written} openings ({errors} failed, {len(done)} already done) to '{args.out}' in {elapsed:.1f}s. "
+          f"Serve them with OPENING_TURNS_FILE={args.out}")
+
+
+if __name__ == '__main__':
+    main()
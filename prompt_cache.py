@@ -0,0 +1,171 @@
+import datetime
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+# --- Caches for the static prompt prefix ---
+# The system instruction and a customer's dossier don't change during a call, so:
+#   * DossierCache memoizes the rendered dossier text per (data version, row index), bounded LRU.
+#   * ContextPrefixCache (optional) uploads instruction + dossier once to Gemini's context cache and hands
+#     back a model bound to that cached prefix, so later turns only send the dialogue.
+# Both keep hit/miss counters for /cache_stats.
+
+
+class DossierCache:
+    """Bounded LRU of rendered customer dossiers keyed by (data_version, row_index)."""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, data_version, row_index, render):
+        key = (data_version, row_index)
+        with self._lock:
+            dossier = self._entries.get(key)
+            if dossier is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dossier
+            self.misses += 1
+        dossier = render()
+        with self._lock:
+            self._entries[key] = dossier
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return dossier
+
+    def clear(self):
+        """Drops every entry; called when the loan book is reloaded."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class ContextPrefixCache:
+    """Per-prefix Gemini cached contents, reused by every turn (and conversation) with the same prefix.
+
+    Gemini only caches prompts above a minimum size and needs an explicit model version
+    (e.g. 'models/gemini-1.5-flash-002'). While a prefix's cache is being created, being retried after a
+    failure (exponential backoff from FAILURE_BACKOFF_SECONDS) or cannot be cached, model_for() returns
+    None and callers send the full prefix inline. Remote calls (create, delete) run outside the cache lock,
+    and one prefix is created by one caller at a time.
+
+    Calls that picked up a model may still be running when its entry is refreshed or evicted, so the remote
+    cache is not deleted right away: a refreshed one expires through its TTL (within REFRESH_MARGIN_SECONDS),
+    and an evicted one is deleted by a later creation once delete_delay_seconds have passed.
+    """
+
+    REFRESH_MARGIN_SECONDS = 60
+    FAILURE_BACKOFF_SECONDS = 60
+    MAX_FAILURE_BACKOFF_SECONDS = 3600
+
+    def __init__(self, model_name, generation_config=None, ttl_seconds=3600, max_entries=256, delete_delay_seconds=300):
+        import google.generativeai as genai  # Only needed when context caching is enabled
+        self._genai = genai
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.delete_delay_seconds = delete_delay_seconds
+        self._entries = OrderedDict()  # prefix hash -> (expires_at, cached_content, model)
+        self._retired = deque()  # (delete_at, cached_content) for evicted caches, oldest first
+        self._creating = set()  # prefix hashes with a create in flight
+        self._failed = OrderedDict()  # prefix hash -> (consecutive failures, retry_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.failures = 0
+
+    @staticmethod
+    def prefix_key(prefix_text):
+        return hashlib.sha256(prefix_text.encode('utf-8')).hexdigest()
+
+    def model_for(self, prefix_text):
+        """Returns a model bound to a cached copy of prefix_text, or None if it isn't cached (yet)."""
+        key = self.prefix_key(prefix_text)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] - self.REFRESH_MARGIN_SECONDS > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            # Another caller is already refreshing this prefix: use the old cache while it is still alive.
+            current_model = entry[2] if entry is not None and entry[0] > now else None
+            failed = self._failed.get(key)
+            if key in self._creating or (failed is not None and failed[1] > now):
+                return current_model
+            self._creating.add(key)
+
+        try:
+            cached_content = self._genai.caching.CachedContent.create(
+                model=self.model_name,
+                display_name=f'loan-prefix-{key[:16]}',
+                contents=[{'role': 'user', 'parts': [prefix_text]}],
+                ttl=datetime.timedelta(seconds=self.ttl_seconds),
+            )
+            cached_model = self._genai.GenerativeModel.from_cached_content(
+                cached_content=cached_content, generation_config=self.generation_config)
+        except Exception as e:
+            with self._lock:
+                self._creating.discard(key)
+                self.failures += 1
+                attempts = self._failed.pop(key, (0, 0))[0] + 1
+                backoff = min(self.MAX_FAILURE_BACKOFF_SECONDS, self.FAILURE_BACKOFF_SECONDS * 2 ** (attempts - 1))
+                self._failed[key] = (attempts, time.time() + backoff)
+                while len(self._failed) > self.max_entries:
+                    self._failed.popitem(last=False)
+            logging.warning("Context cache creation failed for prefix %s (%s); sending prefix inline, retrying in %ss.", key[:16], e, backoff)
+            return current_model
+
+        due = []
+        with self._lock:
+            now = time.time()
+            self._creating.discard(key)
+            self._failed.pop(key, None)
+            self.created += 1
+            self._entries.pop(key, None)  # The refreshed cache expires on its own shortly
+            self._entries[key] = (now + self.ttl_seconds, cached_content, cached_model)
+            while len(self._entries) > self.max_entries:
+                _, (expires_at, evicted_content, _) = self._entries.popitem(last=False)
+                if expires_at > now + self.delete_delay_seconds:  # Evicted caches are billed until they expire
+                    self._retired.append((now + self.delete_delay_seconds, evicted_content))
+            while self._retired and self._retired[0][0] <= now:
+                due.append(self._retired.popleft()[1])
+        for old_content in due:
+            self._delete_remote(old_content)
+        return cached_model
+
+    @staticmethod
+    def _delete_remote(cached_content):
+        try:
+            cached_content.delete()
+        except Exception as e:
+            logging.debug("Could not delete evicted context cache: %s", e)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'created': self.created,
+            'failures': self.failures,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,60 @@
+import threading
+import time
+
+# --- Token bucket rate limiting ---
+# Tokens accrue continuously at `rate` per second up to `capacity` (the allowed burst). Each model call takes
+# one token; callers either block until one is available (acquire) or skip/shed the call (try_acquire).
+
+
+class TokenBucket:
+    """Thread-safe token bucket. rate <= 0 means unlimited."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, self.rate))
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    @property
+    def unlimited(self):
+        return self.rate <= 0
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, tokens=1):
+        """Takes tokens if available right now; returns False instead of waiting."""
+        if self.unlimited:
+            return True
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None):
+        """Blocks until tokens are available; returns False if timeout (seconds) passes first."""
+        if self.unlimited:
+            return True
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+            with self._lock:
+                self.waited_seconds += wait
@@ -0,0 +1,227 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from llm_pool import PoolSaturatedError
+from rate_limit import TokenBucket
+
+# --- Adaptive admission control for model calls ---
+# Policies the model call pool (llm_pool.py) applies around every call when it is given a ModelCallPolicy:
+#   * retries: transient errors (rate limits, 5xx, connection resets) are retried with full-jitter
+#     exponential backoff, within the call's overall timeout;
+#   * hedging: when a call is still running after the recent latency percentile (e.g. p95), a second
+#     identical call is started and the first reply wins; hedges only use idle pool slots and quota;
+#   * rate limiting: a per-process token bucket sized to the API quota; a call that cannot get a token
+#     within max_rate_wait seconds is shed with RateLimitedError (a PoolSaturatedError, so the routes
+#     answer with the "please hold" message);
+#   * circuit breaker: after `failure_threshold` consecutive transient failures, calls fail immediately
+#     with CircuitOpenError (the routes answer with the amount-aware fallback) until a probe call succeeds
+#     after `reset_seconds`.
+# Hedging is off unless LLM_HEDGE_PERCENTILE is set (e.g. 0.95); rate limiting is off unless
+# LLM_RATE_LIMIT_PER_SECOND is set (the API quota divided by the number of serving processes).
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'InternalServerError',
+                         'DeadlineExceeded', 'GatewayTimeout', 'BadGateway', 'Aborted', 'RetryError'}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the model while the circuit breaker is open."""
+
+
+class RateLimitedError(PoolSaturatedError):
+    """Raised when no rate-limit token became available within the allowed wait."""
+
+
+def is_retryable(error):
+    """True for transient backend errors: google.api_core exceptions by name or HTTP status code,
+    connection errors, and the fake model's injected faults."""
+    if isinstance(error, ConnectionError):
+        return True
+    code = getattr(error, 'code', None)
+    if isinstance(code, int) and code in RETRYABLE_STATUS_CODES:
+        return True
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+class LatencyTracker:
+    """Recent successful call latencies (a sliding window) for percentile-based hedging."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures; half-open after reset_seconds lets one probe through."""
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        return 'half_open' if self._clock() - self._opened_at >= self.reset_seconds else 'open'
+
+    def allow(self):
+        """True if a call may go ahead; in half-open state only one probe call at a time."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._clock() - self._opened_at >= self.reset_seconds and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = self._clock()
+                self.opened += 1
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Ends a half-open probe that neither succeeded nor failed (e.g. a non-transient error)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+class ModelCallPolicy:
+    """Retry, hedging, rate-limit and circuit-breaker settings plus their shared state for one pool."""
+
+    def __init__(self, max_attempts=3, base_delay=0.25, max_delay=4.0, hedge_percentile=None, min_hedge_delay=0.5,
+                 min_hedge_samples=20, rate=0.0, burst=None, max_rate_wait=2.0, failure_threshold=5,
+                 reset_seconds=30.0, rng=None):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_percentile = hedge_percentile  # e.g. 0.95; None disables hedging
+        self.min_hedge_delay = min_hedge_delay
+        self.min_hedge_samples = min_hedge_samples
+        self.max_rate_wait = max_rate_wait
+        self.bucket = TokenBucket(rate, capacity=burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.latency = LatencyTracker()
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.rate_limited = 0
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def admit(self):
+        """Raises CircuitOpenError while the breaker is open."""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Model backend circuit open after {self.breaker.failure_threshold} consecutive failures.")
+
+    def take_token(self, remaining):
+        """Blocks for a rate-limit token (at most max_rate_wait and the call's remaining time)."""
+        if not self.bucket.acquire(timeout=max(0.0, min(self.max_rate_wait, remaining))):
+            self.count('rate_limited')
+            self.breaker.release_probe()
+            raise RateLimitedError("Model call quota exhausted; shedding the call.")
+
+    def try_token(self):
+        """Takes a token only if one is free right now (for optional calls such as hedges)."""
+        return self.bucket.try_acquire()
+
+    def retry_delay(self, error, attempt, remaining):
+        """Seconds to wait before attempt `attempt + 1`, or None if the error should be raised."""
+        if not is_retryable(error) or attempt + 1 >= self.max_attempts:
+            return None
+        delay = self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))  # Full jitter
+        if delay >= remaining:
+            return None
+        self.count('retries')
+        return delay
+
+    def hedge_delay(self):
+        """How long to wait on a call before hedging it, or None when hedging is off or not yet calibrated."""
+        if self.hedge_percentile is None or len(self.latency) < self.min_hedge_samples:
+            return None
+        return max(self.min_hedge_delay, self.latency.percentile(self.hedge_percentile))
+
+    def record_success(self, seconds=None):
+        """`seconds` is the call's latency; streamed calls pass None (their duration depends on reply length)."""
+        if seconds is not None:
+            self.latency.observe(seconds)
+        self.breaker.record_success()
+
+    def record_error(self, error):
+        if is_retryable(error) or isinstance(error, TimeoutError):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release_probe()  # The backend answered; the request itself was bad
+
+    def stats(self):
+        p50, p95 = self.latency.percentile(0.5), self.latency.percentile(0.95)
+        return {
+            'circuit_state': self.breaker.state,
+            'circuit_open': int(self.breaker.state != 'closed'),
+            'circuit_opened': self.breaker.opened,
+            'circuit_rejected': self.breaker.rejected,
+            'retries': self.retries,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'rate_limited': self.rate_limited,
+            'latency_p50_seconds': round(p50, 4) if p50 is not None else None,
+            'latency_p95_seconds': round(p95, 4) if p95 is not None else None,
+            'hedge_delay_seconds': round(self.hedge_delay(), 4) if self.hedge_delay() is not None else None,
+        }
+
+
+def create_model_call_policy():
+    """Builds the policy from LLM_RETRY_*, LLM_HEDGE_*, LLM_RATE_LIMIT_* and LLM_BREAKER_* settings;
+    None when LLM_RESILIENCE=off."""
+    if os.getenv('LLM_RESILIENCE', 'on').lower() == 'off':
+        return None
+    hedge_percentile = float(os.getenv('LLM_HEDGE_PERCENTILE', '0'))
+    burst = os.getenv('LLM_RATE_LIMIT_BURST')
+    return ModelCallPolicy(max_attempts=int(os.getenv('LLM_RETRY_MAX_ATTEMPTS', '3')),
+                           base_delay=float(os.getenv('LLM_RETRY_BASE_DELAY_SECONDS', '0.25')),
+                           max_delay=float(os.getenv('LLM_RETRY_MAX_DELAY_SECONDS', '4')),
+                           hedge_percentile=hedge_percentile if 0 < hedge_percentile < 1 else None,
+                           min_hedge_delay=float(os.getenv('LLM_HEDGE_MIN_DELAY_SECONDS', '0.5')),
+                           min_hedge_samples=int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20')),
+                           rate=float(os.getenv('LLM_RATE_LIMIT_PER_SECOND', '0')),
+                           burst=float(burst) if burst else None,
+                           max_rate_wait=float(os.getenv('LLM_RATE_LIMIT_MAX_WAIT_SECONDS', '2')),
+                           failure_threshold=int(os.getenv('LLM_BREAKER_FAILURE_THRESHOLD', '5')),
+                           reset_seconds=float(os.getenv('LLM_BREAKER_RESET_SECONDS', '30')))
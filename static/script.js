@@ -24,6 +24,9 @@ if (chatbox && chatbox.parentNode) {
 let recognition; // Web Speech Recognition object
 let isRecognizing = false; // Flag to indicate if speech recognition is active
 let currentFinalTranscript = ''; // Accumulates final transcript for a single user turn
+// Stream collector replies from /chat_stream and start speaking at the first complete sentence.
+// Set to false to fall back to the single-response /chat endpoint.
+const STREAM_CHAT_RESPONSES = true;
 
 
 // --- Feature detection for Web Speech API support ---
@@ -407,9 +410,12 @@ async function processUserInput(text) {
 
 
     try {
-        console.log("Calling fetch request to /chat."); // Debugging
-        // Send the user's input text to the backend's /chat endpoint
-        const response = await fetch('/chat', {
+        // Prefer the streaming endpoint when the browser can read a response body incrementally.
+        const useStreaming = STREAM_CHAT_RESPONSES && 'ReadableStream' in window && 'TextDecoder' in window;
+        const chatEndpoint = useStreaming ? '/chat_stream' : '/chat';
+        console.log(`Calling fetch request to ${chatEndpoint}.`); // Debugging
+        // Send the user's input text to the backend's chat endpoint
+        const response = await fetch(chatEndpoint, {
             method: 'POST', // Use POST
             headers: {
                 'Content-Type': 'application/json', // Specify JSON body
@@ -430,6 +436,10 @@ async function processUserInput(text) {
              if (hasSpeechSynthesis) { speakResponse(fallbackMessage); } // This function calls speechSynthesis.speak
 
              statusDiv.textContent = 'Status: Chat failed due to server error.'; // Update status message on the page
+         } else if ((response.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
+             // Streamed reply: speak each sentence as soon as it is complete.
+             await consumeChatStream(response);
+             statusDiv.textContent = 'Status: Response received. Ready for next turn.'; // Update status on the page
          } else {
              // Process successful HTTP response (status 200)
              const data = await response.json(); // Parse the JSON response body
@@ -481,7 +491,164 @@ async function processUserInput(text) {
 }
 
 
+// --- Streaming Chat Responses ---
+// Reads Server-Sent Events from /chat_stream. Text chunks are shown as they arrive and each complete
+// sentence is queued for speech immediately, so the customer hears the reply before generation finishes.
+async function consumeChatStream(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const speaker = createSentenceSpeaker();
+    let messageElement = null; // The collector's chatbox message, updated in place as chunks arrive
+    let streamedText = '';
+    let pendingData = '';
+
+    const handleEvent = (event) => {
+        if (event.type === 'delta') {
+            streamedText += event.text;
+            speaker.push(event.text);
+        } else if (event.type === 'reset') {
+            // Backend replaced the partial reply (e.g. with the fallback message after an error).
+            streamedText = '';
+            speaker.reset();
+        } else if (event.type === 'done') {
+            streamedText = event.response;
+        }
+        if (!messageElement) {
+            messageElement = appendMessage('Collector', streamedText);
+        } else {
+            messageElement.textContent = `Collector: ${streamedText.trim()}`;
+            chatbox.scrollTop = chatbox.scrollHeight;
+        }
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        pendingData += decoder.decode(value, { stream: true });
+        // SSE events are separated by a blank line; keep any incomplete trailing event for the next read.
+        const events = pendingData.split('\n\n');
+        pendingData = events.pop();
+        for (const rawEvent of events) {
+            const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+            if (!dataLine) continue;
+            try {
+                handleEvent(JSON.parse(dataLine.substring('data: '.length)));
+            } catch (parseError) {
+                console.warn('consumeChatStream: Could not parse stream event:', rawEvent, parseError); // Debugging
+            }
+        }
+    }
+    console.log("/chat_stream finished. Full collector response:", streamedText); // Debugging
+    speaker.finish(); // Speak any trailing text without sentence punctuation
+}
+
+
+// Splits streamed text into sentences and queues each one on speechSynthesis as soon as it is complete.
+// speechSynthesis plays queued utterances in order; the Start button is only re-enabled after the last one.
+function createSentenceSpeaker() {
+    let buffer = '';
+    let pendingUtterances = 0;
+    let streamFinished = false;
+    let generation = 0; // Bumped on reset so events from cancelled utterances are ignored
+
+    const maybeFinish = () => {
+        if (streamFinished && pendingUtterances === 0) {
+            if (audioFeedbackDiv) audioFeedbackDiv.textContent = '';
+            enableStartButtonAfterSpeech();
+        }
+    };
+
+    const speakSentence = (sentence) => {
+        if (!hasSpeechSynthesis) return;
+        const utteranceGeneration = generation;
+        const utterance = buildUtterance(sentence);
+        utterance.onstart = () => { if (audioFeedbackDiv) audioFeedbackDiv.textContent = '(Speaking...)'; };
+        utterance.onend = utterance.onerror = (event) => {
+            if (event.type === 'error') console.error("SpeechSynthesis Utterance Error:", event.error); // Debugging
+            if (utteranceGeneration !== generation) return;
+            pendingUtterances -= 1;
+            maybeFinish();
+        };
+        pendingUtterances += 1;
+        console.log(`Queueing streamed sentence for speech: "${sentence}"`); // Debugging
+        window.speechSynthesis.speak(utterance);
+    };
+
+    return {
+        push(text) {
+            buffer += text;
+            let boundary;
+            while ((boundary = findSentenceBoundary(buffer)) > 0) {
+                const sentence = buffer.substring(0, boundary).trim();
+                buffer = buffer.substring(boundary);
+                if (sentence) speakSentence(sentence);
+            }
+        },
+        reset() {
+            generation += 1;
+            buffer = '';
+            pendingUtterances = 0;
+            if (hasSpeechSynthesis) window.speechSynthesis.cancel();
+        },
+        finish() {
+            if (buffer.trim()) speakSentence(buffer.trim());
+            buffer = '';
+            streamFinished = true;
+            maybeFinish();
+        },
+    };
+}
+
+// Returns the index just past the first complete sentence in text, or -1 if there is none yet.
+// A sentence ends at . ! or ? followed by whitespace; amounts like "$1,000.50" and titles like "Mr." don't count.
+const SENTENCE_END_PATTERN = /[.!?]+["')\]]*\s+/g;
+const NON_TERMINAL_ABBREVIATIONS = ['mr.', 'ms.', 'mrs.', 'dr.', 'st.', 'jr.', 'sr.', 'vs.', 'e.g.', 'i.e.'];
+function findSentenceBoundary(text) {
+    SENTENCE_END_PATTERN.lastIndex = 0;
+    let match;
+    while ((match = SENTENCE_END_PATTERN.exec(text)) !== null) {
+        const precedingWord = text.substring(0, match.index + 1).split(/\s+/).pop().toLowerCase();
+        if (!NON_TERMINAL_ABBREVIATIONS.includes(precedingWord)) {
+            return match.index + match[0].length;
+        }
+    }
+    return -1;
+}
+
+
 // --- Text to Speech Setup ---
+// Creates an utterance with the shared language, voice, rate and pitch settings.
+function buildUtterance(text) {
+    const utterance = new SpeechSynthesisUtterance(text);
+    utterance.lang = 'en-US'; // Set the language for synthesis
+
+     // Optional: Try to get a preferred voice from the available voices list.
+    const voices = window.speechSynthesis.getVoices(); // Get the list of available voices
+    if (voices.length > 0) {
+        // Prioritize the default voice, then any US English voice, fall back to the first available voice.
+        utterance.voice = voices.find(v => v.default) || voices.find(v => v.lang.startsWith('en-US')) || voices[0];
+         console.log("buildUtterance: Selected voice:", utterance.voice ? utterance.voice.name : "Default/First"); // Debugging
+    } else {
+         console.warn("buildUtterance: No voices available yet when trying to speak. Using default."); // Debugging - May resolve when voiceschanged fires
+    }
+
+    // Set standard speech rate and pitch for clarity.
+    utterance.rate = 1.0; // Normal speed
+    utterance.pitch = 1.0; // Normal pitch
+    return utterance;
+}
+
+// After the collector finishes speaking, re-enable the Start button if we're in voice chat mode.
+// We check if the 'Find Customer' button is hidden as the indicator for 'customer found'.
+function enableStartButtonAfterSpeech() {
+    if (findCustomerButton && findCustomerButton.style.display === 'none' && hasSpeechRecognition) {
+         startButton.disabled = false; // ENABLE the Start Talking button for the next user turn
+          console.log("Speech ended. Enabling Start Talking button for next user input turn."); // Debugging
+     } else {
+         console.log("Speech ended. Not in voice chat mode, or voice not supported. Start button not enabled."); // Debugging
+     }
+}
+
 // Handles synthesizing text and playing it as audio using the browser's Speech Synthesis API.
 function speakResponse(text) {
     // Check if Speech Synthesis is available and the text to speak is not empty
@@ -505,22 +672,7 @@ function speakResponse(text) {
     }
 
     // Create a new SpeechSynthesisUtterance object for the text
-    const utterance = new SpeechSynthesisUtterance(text);
-    utterance.lang = 'en-US'; // Set the language for synthesis
-
-     // Optional: Try to get a preferred voice from the available voices list.
-    const voices = window.speechSynthesis.getVoices(); // Get the list of available voices
-    if (voices.length > 0) {
-        // Prioritize the default voice, then any US English voice, fall back to the first available voice.
-        utterance.voice = voices.find(v => v.default) || voices.find(v => v.lang.startsWith('en-US')) || voices[0];
-         console.log("speakResponse: Selected voice:", utterance.voice ? utterance.voice.name : "Default/First"); // Debugging
-    } else {
-         console.warn("speakResponse: No voices available yet when trying to speak. Using default."); // Debugging - May resolve when voiceschanged fires
-    }
-
-    // Set standard speech rate and pitch for clarity.
-    utterance.rate = 1.0; // Normal speed
-    utterance.pitch = 1.0; // Normal pitch
+    const utterance = buildUtterance(text);
 
      // --- Add event listeners to the utterance to track speech progress ---
     // These events are crucial for controlling the UI based on when the bot is speaking vs. when it's the user's turn.
@@ -736,7 +888,9 @@ function appendMessage(sender, message) {
         // **Scroll the chatbox to the bottom automatically** to ensure the latest message is always visible to the user.
         chatbox.scrollTop = chatbox.scrollHeight;
         console.debug("Chatbox scrolled to bottom."); // Debugging confirmation.
+        return p; // Returned so streamed replies can update the same message as chunks arrive.
     } else {
         console.warn("appendMessage: Message content became empty after cleaning or was empty initially. Not appending anything."); // Debugging: Log if nothing was appended.
+        return null;
     }
 }
\ No newline at end of file
@@ -0,0 +1,300 @@
+import datetime
+import glob
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from payment_commitments import extract_commitment
+
+# --- Durable transcript and outcome log ---
+# An append-only record of every call: each turn (customer words and the agent's reply), logged call
+# outcomes and the payment commitments extracted from the turns. Request threads only enqueue a record
+# (TranscriptWriter.submit never blocks); a background thread drains the queue in batches and writes each
+# batch with one commit (group commit), so disk latency stays off the /chat path. When the queue is full,
+# records are dropped and counted rather than stalling a call. close() drains and flushes on shutdown.
+#
+# A record is a JSON-serializable dict:
+#   {'kind': 'turn' | 'call_outcome' | 'payment_commitment', 'ts': epoch seconds, 'session_id': str,
+#    'loan_id': str, ...kind-specific fields}
+#
+# Two sinks, chosen by TRANSCRIPT_STORE:
+#   * JsonlTranscriptSink   - one JSONL file per UTC day (TRANSCRIPT_DIR); a date range only opens its days
+#   * SQLiteTranscriptSink  - one table indexed by (loan_id, ts) and ts (TRANSCRIPT_DB_PATH)
+# Both read back with iter_records(), a generator that streams matching records without loading a file.
+
+RECORD_KINDS = ('turn', 'call_outcome', 'payment_commitment')
+
+
+def _day(ts):
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).strftime('%Y-%m-%d')
+
+
+def _matches(record, loan_id, since, until, kinds):
+    return ((loan_id is None or record.get('loan_id') == loan_id)
+            and (since is None or record['ts'] >= since)
+            and (until is None or record['ts'] < until)
+            and (kinds is None or record['kind'] in kinds))
+
+
+class JsonlTranscriptSink:
+    """Daily JSONL files under `directory`; each batch is one write + flush (+ fsync when `fsync`)."""
+
+    def __init__(self, directory, fsync=False):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._file = None
+        self._file_day = None
+
+    def _file_for(self, day):
+        if day != self._file_day:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(os.path.join(self.directory, f'transcripts-{day}.jsonl'), 'a', encoding='utf-8')
+            self._file_day = day
+        return self._file
+
+    def write_batch(self, records):
+        by_day = {}
+        for record in records:
+            by_day.setdefault(_day(record['ts']), []).append(json.dumps(record, ensure_ascii=False) + '\n')
+        for day, lines in sorted(by_day.items()):
+            f = self._file_for(day)
+            f.write(''.join(lines))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+
+    def iter_records(self, loan_id=None, since=None, until=None, kinds=None):
+        since_day = _day(since) if since is not None else None
+        until_day = _day(until) if until is not None else None
+        for path in sorted(glob.glob(os.path.join(self.directory, 'transcripts-*.jsonl'))):
+            day = os.path.basename(path)[len('transcripts-'):-len('.jsonl')]
+            if (since_day and day < since_day) or (until_day and day > until_day):
+                continue
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if loan_id is not None and loan_id not in line:
+                        continue  # Cheap substring test before parsing
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line of a batch still being written
+                    if _matches(record, loan_id, since, until, kinds):
+                        yield record
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._file_day = None
+
+
+class SQLiteTranscriptSink:
+    """Records in a SQLite table; each batch is one transaction."""
+
+    READ_BATCH = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS transcript_records ('
+                     'id INTEGER PRIMARY KEY, ts REAL NOT NULL, kind TEXT NOT NULL, session_id TEXT, '
+                     'loan_id TEXT, data TEXT NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS transcript_records_loan ON transcript_records (loan_id, ts)')
+        conn.execute('CREATE INDEX IF NOT EXISTS transcript_records_ts ON transcript_records (ts)')
+
+    def _connection(self):
+        # One connection per thread (the writer thread and any reader threads).
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def write_batch(self, records):
+        conn = self._connection()
+        conn.execute('BEGIN')
+        try:
+            conn.executemany(
+                'INSERT INTO transcript_records (ts, kind, session_id, loan_id, data) VALUES (?, ?, ?, ?, ?)',
+                [(r['ts'], r['kind'], r.get('session_id'), r.get('loan_id'), json.dumps(r, ensure_ascii=False))
+                 for r in records])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def iter_records(self, loan_id=None, since=None, until=None, kinds=None):
+        clauses, params = [], []
+        if loan_id is not None:
+            clauses.append('loan_id = ?')
+            params.append(loan_id)
+        if since is not None:
+            clauses.append('ts >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('ts < ?')
+            params.append(until)
+        if kinds is not None:
+            clauses.append(f"kind IN ({', '.join('?' for _ in kinds)})")
+            params.extend(kinds)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        cursor = self._connection().execute(f'SELECT data FROM transcript_records{where} ORDER BY ts, id', params)
+        while True:
+            rows = cursor.fetchmany(self.READ_BATCH)
+            if not rows:
+                return
+            for (data,) in rows:
+                yield json.loads(data)
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class TranscriptWriter:
+    """Write-behind front of a sink: submit() enqueues, a daemon thread writes batches."""
+
+    def __init__(self, sink, max_queue=10000, batch_size=256, flush_seconds=0.25, extract_commitments=True):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.extract_commitments = extract_commitments
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self.submitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.commitments = 0
+        self.failures = 0
+        self.last_batch_ms = None
+        self._last_drop_log = 0.0
+        self._thread = threading.Thread(target=self._run, name='transcript-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, record):
+        """Queues a record for writing; returns False (and counts a drop) if the queue is full or closed."""
+        record.setdefault('ts', time.time())
+        if self._stop.is_set():
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if time.monotonic() - self._last_drop_log > 10:
+                self._last_drop_log = time.monotonic()
+                logging.warning("Transcript queue full (%s records); dropped %s records so far.", self._queue.maxsize, self.dropped)
+            return False
+        self.submitted += 1
+        return True
+
+    def _with_commitments(self, batch):
+        if not self.extract_commitments:
+            return batch
+        records = []
+        for record in batch:
+            records.append(record)
+            if record['kind'] != 'turn' or record.get('turn', 0) <= 1:
+                continue  # The opening only states the balance; the customer has not answered it yet
+            # Relative due dates resolve against the UTC day, the same day the record's file is named for.
+            commitment = extract_commitment(record.get('assistant_text'), record.get('user_text'),
+                                            at=datetime.datetime.fromtimestamp(record['ts'], datetime.timezone.utc))
+            if commitment is not None:
+                records.append({'kind': 'payment_commitment', 'ts': record['ts'], 'session_id': record.get('session_id'),
+                                'loan_id': record.get('loan_id'), **commitment})
+                self.commitments += 1
+        return records
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        records = self._with_commitments(batch)
+        try:
+            self.sink.write_batch(records)
+        except Exception as e:
+            self.failures += 1
+            logging.error("Could not write %s transcript records: %s", len(records), e)
+            return
+        self.written += len(records)
+        self.batches += 1
+        self.last_batch_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    def _drain(self, first=None):
+        batch = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                continue
+            self._write(self._drain(first))
+        # Shutdown: everything queued before close() is still written.
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            self._write(batch)
+
+    def iter_records(self, loan_id=None, since=None, until=None, kinds=None):
+        """Streams stored records (oldest first) for a Loan ID and/or a [since, until) epoch-seconds range.
+        Records still queued are not visible yet."""
+        if kinds is not None:
+            kinds = tuple(kinds)
+        return self.sink.iter_records(loan_id=loan_id, since=since, until=until, kinds=kinds)
+
+    def close(self, timeout=10.0):
+        """Stops accepting records, writes everything queued, and closes the sink."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self.sink.close()
+        logging.info("Transcript writer closed: %s records written, %s dropped.", self.written, self.dropped)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'submitted': self.submitted,
+            'dropped': self.dropped,
+            'written': self.written,
+            'batches': self.batches,
+            'commitments': self.commitments,
+            'failures': self.failures,
+            'last_batch_ms': self.last_batch_ms,
+        }
+
+
+def create_transcript_writer():
+    """Builds the writer selected by TRANSCRIPT_STORE ('jsonl', 'sqlite' or 'off'); None when off."""
+    backend = os.getenv('TRANSCRIPT_STORE', 'jsonl').lower()
+    if backend == 'off':
+        return None
+    if backend == 'jsonl':
+        sink = JsonlTranscriptSink(os.getenv('TRANSCRIPT_DIR', 'transcripts'), fsync=os.getenv('TRANSCRIPT_FSYNC', '0') == '1')
+    elif backend == 'sqlite':
+        sink = SQLiteTranscriptSink(os.getenv('TRANSCRIPT_DB_PATH', 'transcripts.sqlite3'))
+    else:
+        raise ValueError(f"Unknown TRANSCRIPT_STORE backend '{backend}' (expected 'jsonl', 'sqlite' or 'off').")
+    return TranscriptWriter(sink,
+                            max_queue=int(os.getenv('TRANSCRIPT_QUEUE_SIZE', '10000')),
+                            batch_size=int(os.getenv('TRANSCRIPT_BATCH_SIZE', '256')),
+                            flush_seconds=float(os.getenv('TRANSCRIPT_FLUSH_SECONDS', '0.25')),
+                            extract_commitments=os.getenv('TRANSCRIPT_EXTRACT_COMMITMENTS', '1') == '1')